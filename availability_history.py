@@ -0,0 +1,236 @@
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# --- MÜSAİTLİK GEÇMİŞİ ---
+# Her sorgu sonucunun normalize edilmiş hali (güzergah, tarih, tren, kalkış, vagon sınıfı, boş koltuk,
+# min fiyat, zaman) yalnızca eklenen bir SQLite tablosunda tutulur. Her (güzergah, tarih, tren, kalkış,
+# vagon) satırı bir "seri"dir; gözlemler sadece seri değiştiğinde yazılır (koltuk veya fiyat farklıysa,
+# ya da vagon tükendiyse koltuk 0 olarak). observations tablosu (series_id, observed_at) üzerinde
+# kümelenmiş (WITHOUT ROWID) olduğu için bir serinin zaman aralığı sorgusu tablo taramadan, tek bir
+# indeks aralığı okumasıyla cevaplanır.
+# Kayıtlar bellekte biriktirilir, karşılaştırma ve yazma arka plan thread'inde tek transaction'da yapılır.
+AVAILABILITY_HISTORY_PATH = os.getenv("AVAILABILITY_HISTORY_PATH", "availability_history.sqlite3")
+AVAILABILITY_HISTORY_FLUSH_SECONDS = float(os.getenv("AVAILABILITY_HISTORY_FLUSH_SECONDS", "5"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    series_id INTEGER PRIMARY KEY,
+    from_station INTEGER NOT NULL,
+    to_station INTEGER NOT NULL,
+    travel_date TEXT NOT NULL,
+    train TEXT NOT NULL,
+    departure TEXT NOT NULL,
+    cabin TEXT NOT NULL,
+    UNIQUE (from_station, to_station, travel_date, train, departure, cabin)
+);
+CREATE TABLE IF NOT EXISTS observations (
+    series_id INTEGER NOT NULL,
+    observed_at REAL NOT NULL,
+    seats INTEGER NOT NULL,
+    min_price REAL,
+    PRIMARY KEY (series_id, observed_at)
+) WITHOUT ROWID;
+"""
+
+# Bir güzergah/tarihin her serisindeki son gözlem; yeniden başlatmada karşılaştırma buradan devam eder.
+_LATEST = """
+SELECT s.series_id, s.train, s.departure, s.cabin, o.seats, o.min_price
+FROM series s
+JOIN observations o ON o.series_id = s.series_id
+WHERE s.from_station = ? AND s.to_station = ? AND s.travel_date = ?
+  AND o.observed_at = (SELECT MAX(observed_at) FROM observations WHERE series_id = s.series_id)
+"""
+
+HISTORY_ROWS_WRITTEN = metrics.Counter("availability_history_rows_total", "Geçmiş tablosuna yazılan gözlemler")
+HISTORY_FLUSH_SECONDS = metrics.Histogram(
+    "availability_history_flush_seconds", "Biriken geçmiş kayıtlarının diske yazılma süresi",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+class AvailabilityHistory:
+    """
+    record() sadece (anahtar, snapshot, zaman) üçlüsünü kuyruğa ekler ve hemen döner; değişiklik
+    tespiti ve yazma flush() içinde yapılır. Anahtar (from_id, to_id, 'YYYY-MM-DD'), snapshot
+    {(tren, 'SS:DD', vagon): (koltuk, min fiyat)} biçimindedir.
+    """
+
+    def __init__(self, path: str, flush_seconds: float = AVAILABILITY_HISTORY_FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._db_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = []  # [(anahtar, snapshot, zaman), ...]
+        # { anahtar: { (tren, kalkış, vagon): (series_id, koltuk, fiyat) } } - son yazılan durum
+        self._latest = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="availability-history", daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                log.error("Müsaitlik geçmişi diske yazılamadı: %s", e)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    def record(self, key: tuple, snapshot: dict, observed_at: float = None):
+        """Bir sorgu sonucunu kuyruğa ekler; hata sonuçları (snapshot None) kaydedilmez."""
+        if snapshot is None:
+            return
+        with self._pending_lock:
+            self._pending.append((key, snapshot, observed_at or time.time()))
+
+    def _load_latest(self, key: tuple):
+        rows = self._db.execute(_LATEST, key).fetchall()
+        return {(train, departure, cabin): (series_id, seats, min_price) for series_id, train, departure, cabin, seats, min_price in rows}
+
+    def _series_id(self, key: tuple, seat_key: tuple):
+        self._db.execute(
+            "INSERT OR IGNORE INTO series (from_station, to_station, travel_date, train, departure, cabin) VALUES (?, ?, ?, ?, ?, ?)",
+            key + seat_key,
+        )
+        return self._db.execute(
+            "SELECT series_id FROM series WHERE from_station = ? AND to_station = ? AND travel_date = ?"
+            " AND train = ? AND departure = ? AND cabin = ?",
+            key + seat_key,
+        ).fetchone()[0]
+
+    def _changes(self, key: tuple, snapshot: dict, observed_at: float):
+        """Son yazılan duruma göre değişen serilerin gözlem satırlarını üretir ve durumu günceller."""
+        latest = self._latest.get(key)
+        if latest is None:
+            latest = self._latest[key] = self._load_latest(key)
+
+        rows = []
+        for seat_key, (seats, min_price) in snapshot.items():
+            previous = latest.get(seat_key)
+            if previous is not None and previous[1:] == (seats, min_price):
+                continue
+            series_id = previous[0] if previous is not None else self._series_id(key, seat_key)
+            latest[seat_key] = (series_id, seats, min_price)
+            rows.append((series_id, observed_at, seats, min_price))
+        # Snapshot'ta artık olmayan vagonlar tükenmiştir.
+        for seat_key in latest.keys() - snapshot.keys():
+            series_id, seats, _ = latest[seat_key]
+            if seats:
+                latest[seat_key] = (series_id, 0, None)
+                rows.append((series_id, observed_at, 0, None))
+        return rows
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        with HISTORY_FLUSH_SECONDS.time():
+            try:
+                with self._db_lock, self._db:
+                    rows = []
+                    for key, snapshot, observed_at in pending:
+                        rows.extend(self._changes(key, snapshot, observed_at))
+                    if rows:
+                        # Aynı seri için aynı zaman damgası (aynı sonucun ikinci kaydı) yok sayılır.
+                        self._db.executemany("INSERT OR IGNORE INTO observations VALUES (?, ?, ?, ?)", rows)
+            except sqlite3.Error:
+                # Bellekteki son durum diskle uyumsuz kalmasın diye etkilenen anahtarlar yeniden okunacak.
+                for key, _, _ in pending:
+                    self._latest.pop(key, None)
+                with self._pending_lock:
+                    self._pending[:0] = pending
+                raise
+        HISTORY_ROWS_WRITTEN.inc(len(rows))
+        self._forget_past_dates()
+
+    def _forget_past_dates(self):
+        today = datetime.today().strftime("%Y-%m-%d")
+        for key in [key for key in self._latest if key[2] < today]:
+            del self._latest[key]
+
+    def seat_history(self, from_id: int, to_id: int, travel_date: str, train: str, cabin: str = None,
+                     since: float = None, until: float = None):
+        """
+        Bir trenin (isteğe bağlı olarak tek vagon sınıfının) zaman içindeki koltuk ve fiyat değişimleri:
+        [(zaman, kalkış, vagon, koltuk, min fiyat), ...] zamana göre sıralı. Her seri için sadece
+        (series_id, observed_at) aralığı okunur.
+        """
+        query = (
+            "SELECT o.observed_at, s.departure, s.cabin, o.seats, o.min_price"
+            " FROM series s JOIN observations o ON o.series_id = s.series_id"
+            " WHERE s.from_station = ? AND s.to_station = ? AND s.travel_date = ? AND s.train = ?"
+            " AND o.observed_at BETWEEN ? AND ?"
+        )
+        params = [from_id, to_id, travel_date, train, since or 0, until or float("inf")]
+        if cabin is not None:
+            query += " AND s.cabin = ?"
+            params.append(cabin)
+        query += " ORDER BY o.observed_at"
+        with self._db_lock:
+            return self._db.execute(query, params).fetchall()
+
+    def route_history(self, from_id: int, to_id: int, travel_date: str, since: float = None, until: float = None):
+        """Bir güzergah/tarihin tüm serilerindeki değişiklikler: [(zaman, tren, kalkış, vagon, koltuk, min fiyat), ...]."""
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT o.observed_at, s.train, s.departure, s.cabin, o.seats, o.min_price"
+                " FROM series s JOIN observations o ON o.series_id = s.series_id"
+                " WHERE s.from_station = ? AND s.to_station = ? AND s.travel_date = ?"
+                " AND o.observed_at BETWEEN ? AND ? ORDER BY o.observed_at",
+                (from_id, to_id, travel_date, since or 0, until or float("inf")),
+            ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Müsaitlik geçmişini sorgular")
+    parser.add_argument("--db", default=AVAILABILITY_HISTORY_PATH)
+    parser.add_argument("--from", dest="from_id", type=int, required=True, help="kalkış istasyonu id")
+    parser.add_argument("--to", dest="to_id", type=int, required=True, help="varış istasyonu id")
+    parser.add_argument("--date", required=True, help="sefer tarihi (YYYY-MM-DD)")
+    parser.add_argument("--train", help="sadece bu tren (örn. 'YHT 81001')")
+    parser.add_argument("--cabin", help="sadece bu vagon sınıfı")
+    args = parser.parse_args()
+
+    history = AvailabilityHistory(args.db)
+    started = time.perf_counter()
+    if args.train:
+        rows = [(at, args.train) + rest for at, *rest in history.seat_history(args.from_id, args.to_id, args.date, args.train, args.cabin)]
+    else:
+        rows = history.route_history(args.from_id, args.to_id, args.date)
+    elapsed = time.perf_counter() - started
+    for observed_at, train, departure, cabin, seats, min_price in rows:
+        stamp = datetime.fromtimestamp(observed_at).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{stamp}  {train} {departure}  {cabin:<20} {seats:>4} koltuk  {min_price if min_price is not None else '-'} TRY")
+    print(f"{len(rows)} satır, {elapsed * 1000:.1f} ms")
+    history.close()
+
+
+if __name__ == "__main__":
+    main()
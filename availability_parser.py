@@ -0,0 +1,111 @@
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from train_filters import DEFAULT_FILTER, TrainFilter
+
+log = logging.getLogger(__name__)
+
+# --- TRAIN-AVAILABILITY YANIT AYRIŞTIRICI ---
+# Ham JSON'u sadece okunan alanları taşıyan küçük __slots__ kayıtlarına çevirir.
+# Mesaj oluşturma (render) ayrı bir adımdır; bu modül metin üretmez. Filtre (train_filters)
+# ayrıştırma sırasında uygulanır: reddedilen trenlerin vagonları okunmaz, listeye hiç girmez.
+
+# API zamanları UTC milisaniye; Türkiye 2016'dan beri sabit UTC+3. Sunucunun (ör. Docker'da UTC)
+# yerel saat dilimine bakan datetime.fromtimestamp yerine doğrudan dakika aritmetiği yapılır.
+TURKEY_UTC_OFFSET_MINUTES = 180
+
+_HHMM = [f"{hour:02d}:{minute:02d}" for hour in range(24) for minute in range(60)]
+
+
+def loads(content):
+    """orjson kuruluysa onunla, değilse standart json ile çözer (bytes veya str)."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def format_departure(timestamp_ms: int) -> str:
+    """UTC milisaniye zaman damgasını Türkiye saatiyle 'SS:DD' olarak döndürür."""
+    return _HHMM[(timestamp_ms // 60000 + TURKEY_UTC_OFFSET_MINUTES) % 1440]
+
+
+class CabinAvailability:
+    __slots__ = ('name', 'seats', 'min_price')
+
+    def __init__(self, name: str, seats: int, min_price):
+        self.name = name
+        self.seats = seats
+        self.min_price = min_price
+
+
+class Segment:
+    __slots__ = ('departure_time',)
+
+    def __init__(self, departure_time: int):
+        self.departure_time = departure_time
+
+
+class Train:
+    """
+    Bir sefer. cabins sadece boş koltuğu olan ve filtreye uyan vagonları içerir;
+    None ise API vagon bilgisi vermemiştir. parse_error True ise bu trenin verisi okunamamıştır.
+    """
+    __slots__ = ('name', 'departure', 'segments', 'cabins', 'parse_error')
+
+    def __init__(self, name: str, departure: str = None, segments: list = None, cabins: list = None, parse_error: bool = False):
+        self.name = name
+        self.departure = departure
+        self.segments = segments
+        self.cabins = cabins
+        self.parse_error = parse_error
+
+
+def parse_train(train: dict, fallback_name: str, train_filter: TrainFilter = DEFAULT_FILTER):
+    """Ham tren sözlüğünü Train'e çevirir; tren filtreye uymuyorsa None döndürür."""
+    name = train.get("trainName", fallback_name)
+    try:
+        segments = [Segment(train["segments"][0]["departureTime"])]
+        minute = (segments[0].departure_time // 60000 + TURKEY_UTC_OFFSET_MINUTES) % 1440
+        if not train_filter.accepts_train(name, minute):
+            return None
+        departure = _HHMM[minute]
+
+        cabin_classes = train["availableFareInfo"][0]["cabinClasses"]
+        if not cabin_classes:
+            return Train(name, departure, segments, None)
+
+        cabins = []
+        for cabin in cabin_classes:
+            seats = cabin["availabilityCount"]
+            if seats <= 0:
+                continue
+            cabin_name = cabin["cabinClass"]["name"]
+            min_price = cabin["minPrice"]
+            if not train_filter.accepts_cabin(cabin_name, seats, min_price):
+                continue
+            cabins.append(CabinAvailability(cabin_name, seats, min_price))
+        return Train(name, departure, segments, cabins)
+    except (KeyError, IndexError, TypeError) as e:
+        log.warning("Parsing error for one train: %s", e)
+        return Train(name, parse_error=True)
+
+
+def parse_train_leg(train_leg: dict, train_filter: TrainFilter = DEFAULT_FILTER):
+    """
+    Bir trainLegs elemanını (filtreye uyan) Train listesine çevirir. Leg'in kendi yapısı bozuksa
+    KeyError/TypeError yükseltir; tek bir trenin bozuk olması sadece o treni işaretler.
+    """
+    trains = []
+    position = 0
+    for availability in train_leg["trainAvailabilities"]:
+        for train in availability.get("trains") or ():
+            position += 1
+            parsed = parse_train(train, f"Tren {position}", train_filter)
+            if parsed is not None:
+                trains.append(parsed)
+    return trains
@@ -0,0 +1,179 @@
+"""
+Ağ kullanmadan sıcak yol (hot path) ölçümü: kayıtlı train-availability yanıtlarının çözülmesi,
+ayrıştırılması ve mesajın oluşturulması (e_bilet_V3.check_api_and_parse'ın ağ sonrası kısmı),
+ayrıca istasyon ve tarih klavyelerinin oluşturulması.
+
+    python benchmarks/bench_hot_path.py                  # ölç ve baseline ile karşılaştır
+    python benchmarks/bench_hot_path.py --save-baseline  # sonucu yeni baseline olarak kaydet
+
+Her durum için ops/sn, çağrı başına p50/p99 süresi ve çağrı başına tepe bellek ayırımı
+(tracemalloc) raporlanır. Baseline'a göre ops/sn düşüşü veya p99 artışı --max-regression
+oranını aşarsa çıkış kodu 1 olur.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import availability_parser  # noqa: E402
+import e_bilet_V3  # noqa: E402
+
+FIXTURE_DIR = os.path.join(BENCH_DIR, "fixtures")
+DEFAULT_BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+FIXTURE_SIZES = {
+    "small": "train_availability_small.json",
+    "medium": "train_availability_medium.json",
+    "full_yht_day": "train_availability_full_yht_day.json",
+}
+
+FROM_ID = 1325  # SÖĞÜTLÜÇEŞME
+TO_ID = 98  # ANKARA GAR
+TARGET_DATE = datetime(2026, 10, 23)
+
+
+def load_fixture(file_name: str) -> bytes:
+    with open(os.path.join(FIXTURE_DIR, file_name), "rb") as f:
+        return f.read()
+
+
+def build_cases():
+    """{ durum adı: argümansız çağrılabilir } sözlüğü."""
+    cases = {}
+    for size, file_name in FIXTURE_SIZES.items():
+        raw = load_fixture(file_name)
+        train_leg = availability_parser.loads(raw)["trainLegs"][0]
+
+        cases[f"decode[{size}]"] = lambda raw=raw: availability_parser.loads(raw)
+        cases[f"parse_render[{size}]"] = lambda leg=train_leg: e_bilet_V3.build_leg_result(leg, FROM_ID, TO_ID, TARGET_DATE)
+        cases[f"decode_parse_render[{size}]"] = lambda raw=raw: e_bilet_V3.build_leg_result(
+            availability_parser.loads(raw)["trainLegs"][0], FROM_ID, TO_ID, TARGET_DATE
+        )
+
+    cases["station_keyboard[from]"] = lambda: e_bilet_V3.create_station_keyboard("check")
+    cases["station_keyboard[to]"] = lambda: e_bilet_V3.create_station_keyboard("check", from_id=FROM_ID)
+    cases["date_keyboard"] = lambda: e_bilet_V3.create_date_keyboard("check", FROM_ID, TO_ID)
+    return cases
+
+
+def measure_time(fn, iterations: int):
+    for _ in range(min(100, iterations)):
+        fn()
+    durations = []
+    perf_counter_ns = time.perf_counter_ns
+    for _ in range(iterations):
+        start = perf_counter_ns()
+        fn()
+        durations.append(perf_counter_ns() - start)
+    durations.sort()
+    total_seconds = sum(durations) / 1e9
+    return {
+        "ops_per_sec": iterations / total_seconds,
+        "p50_us": durations[len(durations) // 2] / 1000,
+        "p99_us": durations[min(len(durations) - 1, int(len(durations) * 0.99))] / 1000,
+    }
+
+
+def measure_allocations(fn, calls: int = 20):
+    """Çağrı başına ortalama tepe bellek ayırımı (KiB)."""
+    fn()
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            result = fn()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            del result
+    finally:
+        tracemalloc.stop()
+    return {"peak_kib_per_call": sum(peaks) / len(peaks) / 1024}
+
+
+def run(iterations: int, selected: str = None):
+    results = {}
+    for name, fn in build_cases().items():
+        if selected and selected not in name:
+            continue
+        result = measure_time(fn, iterations)
+        result.update(measure_allocations(fn))
+        results[name] = result
+    return results
+
+
+def print_results(results: dict, baseline: dict = None):
+    header = f"{'durum':<34}{'ops/sn':>12}{'p50 µs':>10}{'p99 µs':>10}{'KiB/çağrı':>11}"
+    if baseline:
+        header += f"{'Δ ops/sn':>11}{'Δ p99':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        line = f"{name:<34}{r['ops_per_sec']:>12.0f}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{r['peak_kib_per_call']:>11.1f}"
+        base = baseline.get(name) if baseline else None
+        if base:
+            line += f"{_change(r['ops_per_sec'], base['ops_per_sec']):>11}{_change(r['p99_us'], base['p99_us']):>9}"
+        print(line)
+
+
+def _change(value: float, base: float) -> str:
+    return f"{(value - base) / base * 100:+.0f}%" if base else "-"
+
+
+def find_regressions(results: dict, baseline: dict, max_regression: float):
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if r["ops_per_sec"] < base["ops_per_sec"] * (1 - max_regression):
+            regressions.append(f"{name}: ops/sn {base['ops_per_sec']:.0f} -> {r['ops_per_sec']:.0f}")
+        if r["p99_us"] > base["p99_us"] * (1 + max_regression):
+            regressions.append(f"{name}: p99 {base['p99_us']:.1f} -> {r['p99_us']:.1f} µs")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ağsız parse/render ve klavye ölçümleri")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--only", help="sadece adında bu metin geçen durumları çalıştır")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="baseline'a göre izin verilen en fazla kötüleşme oranı (0.25 = %%25)")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.only)
+
+    if args.save_baseline:
+        print_results(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            rounded = {name: {key: round(value, 2) for key, value in r.items()} for name, r in results.items()}
+            json.dump({"python": sys.version.split()[0], "results": rounded}, f, indent=2, ensure_ascii=False)
+        print(f"\nBaseline kaydedildi: {args.baseline}")
+        return 0
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if baseline:
+        regressions = find_regressions(results, baseline, args.max_regression)
+        if regressions:
+            print("\nGERİLEME:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+Yük testi için yerel TCDD ve Telegram taklidi. Tek bir HTTP sunucusu şunları sunar:
+
+    GET  /                                  ebilet ana sayfası (hash'li index.*.js bağlantısı ile)
+    GET  /js/index.<hash>.js                 'case "TCDD-PROD"' token'ını içeren JS paketi
+    POST /tms/train/train-availability       searchRoutes başına bir trainLegs elemanı
+    POST /bot<token>/sendMessage             Telegram mesaj havuzu (mesajlar sadece sayılır)
+    GET  /_stats                             sayaçlar ve bildirim gecikmeleri (JSON)
+
+train-availability gecikmesi, hata oranı ve koltuk değişim olasılığı ayarlanabilir. Her değişiklik
+vagonun fiyatını benzersiz bir değere (10000 + değişiklik no) çeker; Telegram'a gelen mesajdaki
+"<fiyat> TRY" değeri değişikliğin zamanıyla eşleştirilerek uçtan uca bildirim gecikmesi ölçülür.
+
+    python benchmarks/fake_tcdd.py --port 8765 --latency-ms 150 --error-rate 0.02 --change-rate 0.05
+"""
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+JS_HASH = "5f3c9a1e"
+CABIN_CLASSES = ["EKONOMİ", "BUSİNESS", "PULMAN"]
+PRICE_PATTERN = re.compile(r"(\d+(?:\.\d+)?) TRY")
+
+
+def make_token(ttl_seconds: int = 24 * 3600) -> str:
+    def b64(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    return f"{b64({'alg': 'HS256', 'typ': 'JWT'})}.{b64({'exp': int(time.time()) + ttl_seconds})}.ZmFrZQ"
+
+
+def percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class FakeUpstream:
+    """Sunucunun paylaşılan durumu; handler thread'leri tarafından kilitle korunarak kullanılır."""
+
+    def __init__(self, latency_ms: float, error_rate: float, change_rate: float, trains_per_route: int, seed: int = 1):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.change_rate = change_rate
+        self.trains_per_route = trains_per_route
+        self.token = make_token()
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.routes = {}  # { (kalkış id, varış id, departureDate): [tren sözlüğü, ...] }
+        self.change_times = {}  # { fiyat: değişiklik zamanı }
+        self.notified_prices = set()
+        self.latencies = []
+        self.counters = {
+            "homepage": 0, "js": 0, "availability_posts": 0, "availability_routes": 0,
+            "availability_errors": 0, "unauthorized": 0, "changes": 0, "telegram_messages": 0,
+        }
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def _new_route(self, departure_date: str):
+        # departureDate: hedef günden bir önceki gün 21:00 UTC, yani hedef gün 00:00 Türkiye saati.
+        day_start = datetime.strptime(departure_date, "%d-%m-%Y %H:%M:%S").replace(tzinfo=timezone.utc)
+        trains = []
+        for number in range(self.trains_per_route):
+            departure = day_start + timedelta(hours=5, minutes=40 * number)
+            trains.append({
+                "trainName": f"YHT 81{number:03d}",
+                "departureTime": int(departure.timestamp() * 1000),
+                "cabins": {name: [self.rng.choice([0, 0, 1, 3, 12]), float(500 + 100 * index)]
+                           for index, name in enumerate(CABIN_CLASSES)},
+            })
+        return trains
+
+    def _maybe_change(self, trains: list):
+        if self.rng.random() >= self.change_rate:
+            return
+        train = self.rng.choice(trains)
+        cabin = train["cabins"][self.rng.choice(CABIN_CLASSES)]
+        self.counters["changes"] += 1
+        price = float(10000 + self.counters["changes"])
+        cabin[0] = self.rng.choice([1, 2, 4, 9, 20])
+        cabin[1] = price
+        self.change_times[price] = time.monotonic()
+
+    def train_legs(self, search_routes: list):
+        legs = []
+        with self.lock:
+            for route in search_routes:
+                key = (route["departureStationId"], route["arrivalStationId"], route["departureDate"])
+                trains = self.routes.get(key)
+                if trains is None:
+                    trains = self.routes[key] = self._new_route(route["departureDate"])
+                self._maybe_change(trains)
+                legs.append({"trainAvailabilities": [{"trains": [
+                    {
+                        "trainName": train["trainName"],
+                        "segments": [{"departureTime": train["departureTime"]}],
+                        "availableFareInfo": [{"cabinClasses": [
+                            {"cabinClass": {"name": name}, "availabilityCount": seats, "minPrice": price}
+                            for name, (seats, price) in train["cabins"].items()
+                        ]}],
+                    }
+                    for train in trains
+                ]}]})
+        return legs
+
+    def record_message(self, text: str):
+        now = time.monotonic()
+        with self.lock:
+            self.counters["telegram_messages"] += 1
+            for match in PRICE_PATTERN.finditer(text):
+                price = float(match.group(1))
+                changed_at = self.change_times.get(price)
+                if changed_at is not None and price not in self.notified_prices:
+                    self.notified_prices.add(price)
+                    self.latencies.append(now - changed_at)
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return {
+                "uptime_seconds": time.monotonic() - self.started_at,
+                "counters": dict(self.counters),
+                "routes": len(self.routes),
+                "notified_changes": len(latencies),
+                "notification_latency_seconds": {
+                    "p50": percentile(latencies, 0.5),
+                    "p95": percentile(latencies, 0.95),
+                    "p99": percentile(latencies, 0.99),
+                    "max": latencies[-1] if latencies else None,
+                },
+            }
+
+
+def make_handler(upstream: FakeUpstream):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body, content_type: str = "application/json"):
+            if not isinstance(body, bytes):
+                body = (body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/":
+                upstream.count("homepage")
+                self._send(200, f'<html><head><script src="/js/index.{JS_HASH}.js?v=1"></script></head></html>', "text/html")
+            elif path == f"/js/index.{JS_HASH}.js":
+                upstream.count("js")
+                self._send(200, f'switch(e){{case "TCDD-TEST":return "eyJhtest";case "TCDD-PROD":return "{upstream.token}"}}', "application/javascript")
+            elif path == "/_stats":
+                self._send(200, upstream.stats())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            path = self.path.split("?", 1)[0]
+            body = self._read_body()
+            if path == "/tms/train/train-availability":
+                self._availability(body)
+            elif path.startswith("/bot") and path.endswith("/sendMessage"):
+                form = parse_qs(body.decode("utf-8"))
+                upstream.record_message(form.get("text", [""])[0])
+                self._send(200, {"ok": True, "result": {}})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def _availability(self, body: bytes):
+            upstream.count("availability_posts")
+            if upstream.latency_ms:
+                time.sleep(random.uniform(0.5, 1.5) * upstream.latency_ms / 1000)
+            if self.headers.get("Authorization") != f"Bearer {upstream.token}":
+                upstream.count("unauthorized")
+                self._send(401, {"error": "unauthorized"})
+                return
+            if random.random() < upstream.error_rate:
+                upstream.count("availability_errors")
+                self._send(503, {"error": "bakım"})
+                return
+            search_routes = json.loads(body)["searchRoutes"]
+            upstream.count("availability_routes", len(search_routes))
+            self._send(200, {"trainLegs": upstream.train_legs(search_routes)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Yerel TCDD + Telegram taklidi")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=150, help="train-availability ortalama gecikmesi")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503 döndürülen isteklerin oranı")
+    parser.add_argument("--change-rate", type=float, default=0.05, help="sorgu başına koltuk değişikliği olasılığı")
+    parser.add_argument("--trains", type=int, default=12, help="güzergah başına sefer sayısı")
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(args.latency_ms, args.error_rate, args.change_rate, args.trains)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(upstream))
+    server.daemon_threads = True
+    print(f"Sahte TCDD/Telegram sunucusu http://{args.host}:{args.port} adresinde.", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Çok sayıda eşzamanlı izlemeyi e_bilet_V3'ün gerçek kod yolları (subscribe_monitor -> poller ->
+get_availability -> toplu sorgu -> token önbelleği -> telegram_outbox) üzerinden yerel sahte
+sunucuya (fake_tcdd.py) karşı çalıştırır ve şunları raporlar:
+
+    upstream istek hızı, bildirim gecikmesi (koltuk değişikliğinden Telegram'a), CPU ve RSS
+
+    python benchmarks/load_test.py --monitors 500 --routes 60 --duration 120
+    python benchmarks/load_test.py --monitors 2000 --routes 200 --latency-ms 400 --error-rate 0.05 --json sonuc.json
+
+Sahte sunucu ayrı bir süreçte çalışır; CPU ve RSS sadece botun çalıştığı bu süreci ölçer. Botun
+ortam değişkenleri (AVAILABILITY_RATE_PER_SECOND, POLL_* vb.) her zamanki gibi geçerlidir.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+
+def start_fake_server(args):
+    command = [
+        sys.executable, os.path.join(BENCH_DIR, "fake_tcdd.py"),
+        "--port", str(args.port),
+        "--latency-ms", str(args.latency_ms),
+        "--error-rate", str(args.error_rate),
+        "--change-rate", str(args.change_rate),
+        "--trains", str(args.trains),
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            fetch_stats(args.port)
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Sahte sunucu başlatılamadı.")
+
+
+def fetch_stats(port: int):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def read_rss_kib():
+    """Güncel RSS (KiB); /proc okunamazsa tepe RSS'e düşer."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def run_monitors(bot, args):
+    """N sohbeti R farklı (güzergah, tarih) anahtarına dağıtıp süre boyunca çalıştırır."""
+    station_ids = bot.FAVORITE_STATION_IDS
+    today = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+    route_pairs = [(a, b) for a, b in itertools.permutations(station_ids, 2)]
+    keys = [
+        (from_id, to_id, today + timedelta(days=1 + day))
+        for day in range(12) for from_id, to_id in route_pairs
+    ][:args.routes]
+
+    bot.telegram_outbox.start()
+    for index in range(args.monitors):
+        from_id, to_id, target_date = keys[index % len(keys)]
+        bot.subscribe_monitor(f"load-{index}", from_id, to_id, target_date, args.interval, persist=False)
+
+    samples = []
+    started = time.monotonic()
+    cpu_started = cpu_seconds()
+    while time.monotonic() - started < args.duration:
+        await asyncio.sleep(1)
+        samples.append(read_rss_kib())
+    elapsed = time.monotonic() - started
+    cpu_used = cpu_seconds() - cpu_started
+    # Sayaçlar kapanıştaki kuyruk boşaltmasını içermesin diye ölçüm penceresinin sonunda alınır.
+    server_stats = await asyncio.to_thread(fetch_stats, args.port)
+
+    for chat_id in list(bot.monitor_jobs):
+        bot.unsubscribe_monitor(chat_id)
+    await asyncio.sleep(0)
+    await bot.telegram_outbox.close(drain_timeout=5)
+    for client in (bot.ebilet_client, bot.tcdd_api_client, bot.telegram_client):
+        await client.aclose()
+
+    return server_stats, {
+        "elapsed_seconds": elapsed,
+        "cpu_seconds": cpu_used,
+        "cpu_percent": 100 * cpu_used / elapsed,
+        "rss_kib_avg": sum(samples) / len(samples) if samples else read_rss_kib(),
+        "rss_kib_max": max(samples) if samples else read_rss_kib(),
+        "routes": len(keys),
+    }
+
+
+def print_report(args, bot_result: dict, server_stats: dict):
+    counters = server_stats["counters"]
+    elapsed = bot_result["elapsed_seconds"]
+    latency = server_stats["notification_latency_seconds"]
+
+    def ms(value):
+        return f"{value * 1000:.0f} ms" if value is not None else "-"
+
+    print(f"\nİzleme: {args.monitors}  (güzergah/tarih: {bot_result['routes']}, süre: {elapsed:.0f} sn)")
+    print(f"  train-availability POST    {counters['availability_posts']:>8}  ({counters['availability_posts'] / elapsed:.2f}/sn)")
+    print(f"  sorgulanan güzergah        {counters['availability_routes']:>8}  ({counters['availability_routes'] / elapsed:.2f}/sn)")
+    print(f"  503 / 401                  {counters['availability_errors']:>8} / {counters['unauthorized']}")
+    print(f"  token kazıma (ana sayfa)   {counters['homepage']:>8}")
+    print(f"  koltuk değişikliği         {counters['changes']:>8}  (bildirilen: {server_stats['notified_changes']})")
+    print(f"  Telegram mesajı            {counters['telegram_messages']:>8}  ({counters['telegram_messages'] / elapsed:.2f}/sn)")
+    print(f"  bildirim gecikmesi         p50 {ms(latency['p50'])}  p95 {ms(latency['p95'])}  p99 {ms(latency['p99'])}  max {ms(latency['max'])}")
+    print(f"  CPU                        {bot_result['cpu_seconds']:.1f} sn  (%{bot_result['cpu_percent']:.1f})")
+    print(f"  RSS                        ort {bot_result['rss_kib_avg'] / 1024:.1f} MiB  en fazla {bot_result['rss_kib_max'] / 1024:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sahte upstream'e karşı e_bilet_V3 yük testi")
+    parser.add_argument("--monitors", type=int, default=200, help="eşzamanlı izleme (sohbet) sayısı")
+    parser.add_argument("--routes", type=int, default=40, help="farklı (güzergah, tarih) anahtarı sayısı")
+    parser.add_argument("--duration", type=float, default=60, help="ölçüm süresi (saniye)")
+    parser.add_argument("--interval", type=float, default=30, help="izleme taban aralığı (saniye)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--change-rate", type=float, default=0.05)
+    parser.add_argument("--trains", type=int, default=12)
+    parser.add_argument("--json", help="sonuçları bu dosyaya JSON olarak da yaz")
+    parser.add_argument("--verbose", action="store_true", help="botun kendi çıktısını gösterir")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    os.environ.update({
+        "EBILET_BASE_URL": base_url,
+        "TCDD_API_BASE_URL": base_url,
+        "TELEGRAM_API_BASE_URL": base_url,
+        "TELEGRAM_API_TOKEN": "load-test",
+        "METRICS_PORT": "0",
+    })
+
+    server = start_fake_server(args)
+    try:
+        real_stdout = sys.stdout
+        if not args.verbose:
+            sys.stdout = open(os.devnull, "w", encoding="utf-8")
+        try:
+            import e_bilet_V3 as bot
+            import structured_logging
+
+            if args.verbose:
+                structured_logging.setup_logging(fmt="text")
+            else:
+                logging.disable(logging.CRITICAL)
+            server_stats, bot_result = asyncio.run(run_monitors(bot, args))
+        finally:
+            if sys.stdout is not real_stdout:
+                sys.stdout.close()
+                sys.stdout = real_stdout
+    finally:
+        server.terminate()
+        server.wait()
+
+    print_report(args, bot_result, server_stats)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "bot": bot_result, "server": server_stats}, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
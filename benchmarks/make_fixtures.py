@@ -0,0 +1,112 @@
+"""
+train-availability yanıt örneklerini (fixture) üretir. Alan adları ve iç içe yapı canlı API
+yanıtından alınmıştır; ayrıştırıcının hiç okumadığı alanlar da gerçekçi boyut için eklenir.
+
+    python benchmarks/make_fixtures.py
+"""
+import json
+import os
+import random
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# (dosya adı, sefer sayısı, tren başına vagon sınıfı sayısı)
+FIXTURES = [
+    ("train_availability_small.json", 3, 3),
+    ("train_availability_medium.json", 12, 5),
+    ("train_availability_full_yht_day.json", 40, 7),
+]
+
+CABIN_CLASSES = ["EKONOMİ", "BUSİNESS", "TEKERLEKLİ SANDALYE", "YATAKLI", "LOCA", "PULMAN", "KUŞETLİ"]
+
+# 2026-10-23 05:00 İstanbul (UTC 02:00)
+FIRST_DEPARTURE_MS = 1792720800000
+
+
+def make_cabin(rng: random.Random, name: str, index: int):
+    seats = rng.choice([0, 0, 0, 1, 2, 5, 17, 42])
+    return {
+        "cabinClass": {
+            "id": index + 1,
+            "code": name[:3],
+            "name": name,
+            "additionalServices": [],
+            "bookingClassModels": None,
+            "showAvailabilityOnQuery": True,
+        },
+        "availabilityCount": seats,
+        "minPrice": round(rng.uniform(350, 2400), 2),
+        "minPriceCurrency": "TRY",
+        "bookingClassAvailabilities": [
+            {"bookingClass": {"id": index * 10 + k, "code": f"Y{k}", "name": "TAM"}, "price": 500.0 + k, "availability": seats}
+            for k in range(3)
+        ],
+    }
+
+
+def make_train(rng: random.Random, number: int, cabin_count: int):
+    departure = FIRST_DEPARTURE_MS + number * 25 * 60 * 1000
+    return {
+        "id": 100000 + number,
+        "number": f"81{number:03d}",
+        "name": f"YHT 81{number:03d}",
+        "trainName": f"YHT 81{number:03d}",
+        "commercialName": "YÜKSEK HIZLI TREN",
+        "type": "YHT",
+        "line": None,
+        "reversed": False,
+        "scheduleId": 20000 + number,
+        "departureStationId": 1325,
+        "arrivalStationId": 98,
+        "minPrice": {"type": None, "priceAmount": 780.0, "priceCurrency": "TRY"},
+        "reservationLockTime": 15,
+        "reservable": True,
+        "bookingClassCapacities": [],
+        "segments": [
+            {
+                "id": 300000 + number,
+                "departureTime": departure,
+                "arrivalTime": departure + 4 * 3600 * 1000,
+                "stops": True,
+                "duration": 14400000,
+                "stopDuration": 0,
+                "distance": 533.4,
+                "segment": {"id": 1, "name": "İSTANBUL(SÖĞÜTLÜÇEŞME) - ANKARA GAR", "departureStation": {"id": 1325}, "arrivalStation": {"id": 98}},
+            }
+        ],
+        "cars": [{"id": k, "name": f"{k}", "trainId": 100000 + number, "templateId": 7, "carIndex": k} for k in range(8)],
+        "availableFareInfo": [
+            {
+                "fareFamily": {"id": 1, "name": "STANDART"},
+                "cabinClasses": [make_cabin(rng, CABIN_CLASSES[k % len(CABIN_CLASSES)], k) for k in range(cabin_count)],
+            }
+        ],
+    }
+
+
+def make_response(seed: int, train_count: int, cabin_count: int):
+    rng = random.Random(seed)
+    return {
+        "trainLegs": [
+            {
+                "trainAvailabilities": [
+                    {"trains": [make_train(rng, i, cabin_count)], "totalTripTime": 14400000, "minPrice": 780.0, "connection": False, "dayChanged": False}
+                    for i in range(train_count)
+                ],
+                "resultCount": train_count,
+            }
+        ]
+    }
+
+
+def main():
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for seed, (file_name, train_count, cabin_count) in enumerate(FIXTURES):
+        path = os.path.join(FIXTURE_DIR, file_name)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(make_response(seed, train_count, cabin_count), f, ensure_ascii=False)
+        print(f"{path}: {os.path.getsize(path) // 1024} KiB")
+
+
+if __name__ == "__main__":
+    main()
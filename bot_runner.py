@@ -0,0 +1,41 @@
+import logging
+import os
+import secrets
+
+from telegram.ext import Application
+
+log = logging.getLogger(__name__)
+
+# --- WEBHOOK / LONG POLLING ---
+# TELEGRAM_WEBHOOK_URL ayarlıysa bot, güncellemeleri gömülü bir HTTP sunucusunda webhook ile alır;
+# boşsa eskisi gibi long polling kullanılır. Telegram her isteği X-Telegram-Bot-Api-Secret-Token
+# başlığıyla gönderir; başlık TELEGRAM_WEBHOOK_SECRET ile eşleşmeyen istekler 403 ile reddedilir.
+# Örnek: TELEGRAM_WEBHOOK_URL=https://bot.example.com  TELEGRAM_WEBHOOK_PORT=8443
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "").rstrip("/")
+TELEGRAM_WEBHOOK_LISTEN = os.getenv("TELEGRAM_WEBHOOK_LISTEN", "0.0.0.0")
+TELEGRAM_WEBHOOK_PORT = int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8443"))
+TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "telegram").strip("/")
+# Ayarlanmazsa her açılışta rastgele üretilir ve setWebhook ile Telegram'a bildirilir.
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+# Sertifika verilirse TLS'i sunucu kendisi sonlandırır (ters vekil yoksa).
+TELEGRAM_WEBHOOK_CERT = os.getenv("TELEGRAM_WEBHOOK_CERT") or None
+TELEGRAM_WEBHOOK_KEY = os.getenv("TELEGRAM_WEBHOOK_KEY") or None
+
+
+def run_application(app: Application):
+    """Uygulamayı ayara göre webhook veya long polling ile çalıştırır (bloklar)."""
+    if not TELEGRAM_WEBHOOK_URL:
+        app.run_polling()
+        return
+
+    webhook_url = f"{TELEGRAM_WEBHOOK_URL}/{TELEGRAM_WEBHOOK_PATH}"
+    log.info("Webhook modu: %s:%d/%s -> %s", TELEGRAM_WEBHOOK_LISTEN, TELEGRAM_WEBHOOK_PORT, TELEGRAM_WEBHOOK_PATH, webhook_url)
+    app.run_webhook(
+        listen=TELEGRAM_WEBHOOK_LISTEN,
+        port=TELEGRAM_WEBHOOK_PORT,
+        url_path=TELEGRAM_WEBHOOK_PATH,
+        webhook_url=webhook_url,
+        secret_token=TELEGRAM_WEBHOOK_SECRET,
+        cert=TELEGRAM_WEBHOOK_CERT,
+        key=TELEGRAM_WEBHOOK_KEY,
+    )
@@ -8,13 +8,21 @@ import re
 import random
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
-import requests
+import httpx
 from dotenv import load_dotenv
 import os
+import asyncio
 import threading
 import locale # <-- Türkçe tarihler için eklendi
 
 # Telegram Bot Kütüphaneleri
+import metrics
+import poll_policy
+import structured_logging
+from train_filters import is_unwanted_cabin
+from monitor_store import MonitorStore, restore_delays
+from telegram_outbox import TelegramOutbox
+from bot_runner import run_application
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup # <-- Butonlar için eklendi
 from telegram.ext import Application, CommandHandler, CallbackContext, CallbackQueryHandler # <-- Buton yakalayıcı eklendi
 
@@ -34,7 +42,22 @@ load_dotenv()
 # --- Global Ayarlar ---
 TELEGRAM_API_TOKEN = os.getenv("TELEGRAM_API_TOKEN")
 ADMIN_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID") 
-monitor_jobs = {} # { chat_id: (threading.Thread, threading.Event) }
+monitor_jobs = {} # { chat_id: asyncio.Task }
+# Süren tek seferlik kontroller. İzlemeler gibi bunlar da application.create_task ile değil event loop'ta
+# açılır: Application.stop() kendi görevlerinin bitmesini bekler ve hiç bitmeyen izleme döngüleri
+# kapanışı sonsuza kadar kilitler. Kapanışta shutdown_engine ikisini de iptal eder.
+one_time_checks = set()
+
+# Bot yeniden başladığında izlemeler buradan geri yüklenir (istasyonlar isim olarak saklanır).
+MONITOR_STORE_PATH = os.getenv("MONITOR_STORE_PATH", "monitors_v2.sqlite3")
+monitor_store = None
+
+# --- METRİKLER ---
+CHECK_SECONDS = metrics.Histogram("selenium_check_seconds", "Bir sonuç sayfası kontrolünün (check_trips) süresi")
+CHROME_DRIVERS = metrics.Gauge("chrome_drivers_active", "Açık Chrome driver sayısı")
+metrics.Gauge("monitor_jobs_active", "Aktif izleme yapan sohbet sayısı", callback=lambda: len(monitor_jobs))
+metrics.Gauge("process_threads", "Süreçteki thread sayısı", callback=threading.active_count)
+# -----------------
 
 # --- YENİ: İSTASYON LİSTESİ ---
 # select_station fonksiyonunun 'in' ile arama özelliğine güvenerek
@@ -57,18 +80,13 @@ STATIONS_OF_INTEREST = [
 # -------------------------------
 
 # --- Telegram Mesajlaşma ---
+# Tüm mesajlar tek bir bağlantı havuzu üzerinden, kuyruklu ve hız sınırına uygun gönderilir.
+telegram_client = httpx.AsyncClient(base_url="https://api.telegram.org", timeout=httpx.Timeout(15, connect=5))
+telegram_outbox = TelegramOutbox(telegram_client, TELEGRAM_API_TOKEN, parse_mode='Markdown')
+
 def send_telegram_message(message: str, chat_id: str):
-    """(Thread içinden mesaj göndermek için)"""
-    url = f'https://api.telegram.org/bot{TELEGRAM_API_TOKEN}/sendMessage'
-    payload = {'chat_id': chat_id, 'text': message, 'parse_mode': 'Markdown'}
-    try:
-        response = requests.post(url, data=payload)
-        if response.status_code == 200:
-            print(f"Telegram mesajı {chat_id} için gönderildi.")
-        else:
-            print(f"Telegram mesajı {chat_id} için gönderilemedi:", response.text)
-    except Exception as e:
-        print(f"Telegram mesajı {chat_id} için gönderme hatası:", e)
+    """(Thread içinden mesaj göndermek için) Mesajı kuyruğa ekler ve beklemeden döner."""
+    telegram_outbox.enqueue_threadsafe(chat_id, message)
 
 # --- Selenium Yardımcı Fonksiyonları (İyileştirilmiş) ---
 def get_driver():
@@ -84,11 +102,18 @@ def get_driver():
     try:
         driver = uc.Chrome(headless=True, use_subprocess=True, options=options)
         driver.set_page_load_timeout(45)
+        CHROME_DRIVERS.inc()
         return driver
     except Exception as e:
         print(f"Driver başlatılamadı: {e}")
         return None
 
+def close_driver(driver):
+    try:
+        driver.quit()
+    finally:
+        CHROME_DRIVERS.dec()
+
 def select_station(driver, input_id, station_name):
     """İstasyon seçme işlemini, önce tam eşleşme, sonra kısmi eşleşme ile yapar."""
     try:
@@ -249,9 +274,7 @@ def check_trips(driver, chat_id_to_notify: str):
                 status_element = wagon.find("p", class_="price")
                 status = status_element.text.strip() if status_element else "DOLU"
                 
-                unwanted_types = ["TEKERLEKLİ SANDALYE", "YATAKLI", "LOCA"]
-
-                if status != "DOLU" and wagon_type not in unwanted_types:
+                if status != "DOLU" and not is_unwanted_cabin(wagon_type):
                     available_wagons_in_this_trip = True
                     message += f"\n  ✅ {wagon_type}: *{status}*"
             
@@ -268,95 +291,132 @@ def check_trips(driver, chat_id_to_notify: str):
         return False
 
 # --- Ana İş Mantığı (Worker) ---
-def monitoring_loop(chat_id: str, stop_event: threading.Event, from_station: str, to_station: str, target_date: datetime, interval_seconds: int):
+# Selenium çağrıları bloklayıcı olduğu için asyncio.to_thread ile çalıştırılır; bekleme
+# süreleri ise event loop üzerinde asyncio.sleep ile geçer, böylece boşta bekleyen bir
+# izleme thread tutmaz ve /stop görevi doğrudan iptal edebilir.
+def open_search_page(driver, from_station: str, to_station: str, target_date: datetime):
+    """Ana sayfayı açar, istasyonları ve tarihi seçip seferleri arar."""
+    driver.get('https://ebilet.tcddtasimacilik.gov.tr/')
+    time.sleep(random.uniform(2, 4))
+
+    if not select_station(driver, 'fromTrainInput', from_station):
+        raise Exception(f"Kalkış istasyonu bulunamadı: {from_station}")
+    time.sleep(random.uniform(1, 2))
+
+    if not select_station(driver, 'toTrainInput', to_station):
+        raise Exception(f"Varış istasyonu bulunamadı: {to_station}")
+    time.sleep(random.uniform(1, 2))
+
+    if not select_date(driver, target_date):
+        raise Exception(f"Tarih seçilemedi: {target_date.strftime('%d.%m.%Y')}")
+    time.sleep(random.uniform(1, 2))
+
+    if not search_trips(driver):
+        raise Exception("Sefer arama butonuna tıklanamadı.")
+
+def refresh_page(driver):
+    driver.refresh()
+    print("Sayfa yenilendi.")
+    time.sleep(random.uniform(4, 7))
+
+async def monitoring_loop(chat_id: str, from_station: str, to_station: str, target_date: datetime, interval_seconds: int, start_delay: float = 0):
     """
-    Belirli bir kullanıcı için arka planda çalışan izleme döngüsü.
+    Belirli bir kullanıcı için event loop üzerinde çalışan izleme görevi. interval_seconds taban
+    aralıktır; her turdaki bekleme poll_policy ile kalkışa yakınlığa ve son değişikliğe göre hesaplanır.
+    start_delay, yeniden başlatmada geri yüklenen izlemelerin Chrome'u aynı anda açmaması içindir.
+    Yolculuk günü geçince izleme sonlandırılır ve kaydı silinir.
     """
-    driver = get_driver()
+    if start_delay:
+        await asyncio.sleep(start_delay)
+    if await end_if_expired(chat_id, from_station, to_station, target_date):
+        return
+    driver = await asyncio.to_thread(get_driver)
     if not driver:
-        send_telegram_message("Tarayıcı (Chrome Driver) başlatılamadı. İzleme durduruldu.", chat_id)
+        forget_monitor(chat_id)
+        await asyncio.to_thread(send_telegram_message, "Tarayıcı (Chrome Driver) başlatılamadı. İzleme durduruldu.", chat_id)
         return
 
     try:
         print(f"İzleme başladı: {chat_id} | {from_station} -> {to_station} | {target_date.strftime('%d.%m.%Y')}")
-        driver.get('https://ebilet.tcddtasimacilik.gov.tr/')
-        time.sleep(random.uniform(2, 4))
+        await asyncio.to_thread(open_search_page, driver, from_station, to_station, target_date)
 
-        if not select_station(driver, 'fromTrainInput', from_station):
-            raise Exception(f"Kalkış istasyonu bulunamadı: {from_station}")
-        time.sleep(random.uniform(1, 2))
-        
-        if not select_station(driver, 'toTrainInput', to_station):
-            raise Exception(f"Varış istasyonu bulunamadı: {to_station}")
-        time.sleep(random.uniform(1, 2))
-
-        if not select_date(driver, target_date):
-            raise Exception(f"Tarih seçilemedi: {target_date.strftime('%d.%m.%Y')}")
-        time.sleep(random.uniform(1, 2))
-        
-        if not search_trips(driver):
-            raise Exception("Sefer arama butonuna tıklanamadı.")
-
-        while not stop_event.is_set():
+        last_found = None
+        last_change_at = None
+        while True:
             print(f"Kontrol ediliyor ({chat_id})...")
-            check_trips(driver, chat_id) 
-            print(f"{interval_seconds} saniye bekleniyor...")
-            if stop_event.wait(interval_seconds):
-                break
-            
-            driver.refresh()
-            print("Sayfa yenilendi.")
-            time.sleep(random.uniform(4, 7))
-
+            with CHECK_SECONDS.time():
+                found = await asyncio.to_thread(check_trips, driver, chat_id)
+            if last_found is not None and found != last_found:
+                last_change_at = poll_policy.turkey_now()
+            last_found = found
+
+            wait_seconds, reasons = poll_policy.next_interval(target_date, last_change_at=last_change_at, base_seconds=interval_seconds)
+            print(f"{wait_seconds:.0f} saniye bekleniyor ({chat_id}; {', '.join(reasons) or 'taban aralık'})...")
+            await asyncio.sleep(wait_seconds)
+            if await end_if_expired(chat_id, from_station, to_station, target_date):
+                return
+            await asyncio.to_thread(refresh_page, driver)
+
+    except asyncio.CancelledError:
+        print(f"İzleme görevi iptal edildi ({chat_id}).")
+        raise
     except Exception as e:
         print(f"İzleme döngüsünde hata ({chat_id}): {e}")
-        send_telegram_message(f"Bir hata oluştu, izleme durduruldu: {e}", chat_id)
+        forget_monitor(chat_id)
+        await asyncio.to_thread(send_telegram_message, f"Bir hata oluştu, izleme durduruldu: {e}", chat_id)
     finally:
-        driver.quit()
+        await asyncio.to_thread(close_driver, driver)
         print(f"Driver kapatıldı ({chat_id}).")
-        if chat_id in monitor_jobs:
+        if monitor_jobs.get(chat_id) is asyncio.current_task():
             del monitor_jobs[chat_id]
             print(f"İzleme işi listeden kaldırıldı ({chat_id}).")
 
-def run_one_time_check(chat_id: str, from_station: str, to_station: str, target_date: datetime):
+async def end_if_expired(chat_id: str, from_station: str, to_station: str, target_date: datetime) -> bool:
+    """Yolculuk günü geçtiyse kullanıcıyı bilgilendirir, kaydı siler ve True döndürür."""
+    if poll_policy.seconds_until_expiry(target_date) > 0:
+        return False
+    print(f"Yolculuk tarihi geçti, izleme sonlandırılıyor ({chat_id}).")
+    forget_monitor(chat_id)
+    await asyncio.to_thread(
+        send_telegram_message,
+        f"📅 *{from_station} ➡ {to_station}* | {target_date.strftime('%d %B %Y')}: yolculuk tarihi geçti, izleme sonlandırıldı.",
+        chat_id,
+    )
+    return True
+
+def forget_monitor(chat_id: str):
+    """İzleme kalıcı olarak bittiyse (/stop veya hata) kaydını siler; kapanışta kayıtlar korunur."""
+    if monitor_store is not None:
+        monitor_store.delete(chat_id)
+
+def _run_one_time_check(driver, chat_id: str, from_station: str, to_station: str, target_date: datetime):
+    open_search_page(driver, from_station, to_station, target_date)
+
+    if not check_trips(driver, chat_id):
+        send_telegram_message(
+            f"Maalesef, {target_date.strftime('%d %B %Y')} tarihi için\n"
+            f"*{from_station} ➡ {to_station}* yönüne boş yer bulunamadı.", 
+            chat_id
+        )
+
+async def run_one_time_check(chat_id: str, from_station: str, to_station: str, target_date: datetime):
     """
     Sadece bir kez kontrol yapar ve sonucu bildirir.
     """
-    driver = get_driver()
+    driver = await asyncio.to_thread(get_driver)
     if not driver:
-        send_telegram_message("Tarayıcı (Chrome Driver) başlatılamadı. Kontrol başarısız.", chat_id)
+        await asyncio.to_thread(send_telegram_message, "Tarayıcı (Chrome Driver) başlatılamadı. Kontrol başarısız.", chat_id)
         return
         
     print(f"Tek seferlik kontrol: {chat_id} | {from_station} -> {to_station} | {target_date.strftime('%d.%m.%Y')}")
     
     try:
-        driver.get('https://ebilet.tcddtasimacilik.gov.tr/')
-        time.sleep(random.uniform(2, 4))
-        
-        if not select_station(driver, 'fromTrainInput', from_station):
-            raise Exception(f"Kalkış istasyonu bulunamadı: {from_station}")
-        time.sleep(random.uniform(1, 2))
-        if not select_station(driver, 'toTrainInput', to_station):
-            raise Exception(f"Varış istasyonu bulunamadı: {to_station}")
-        time.sleep(random.uniform(1, 2))
-        if not select_date(driver, target_date):
-            raise Exception(f"Tarih seçilemedi: {target_date.strftime('%d.%m.%Y')}")
-        time.sleep(random.uniform(1, 2))
-        if not search_trips(driver):
-            raise Exception("Sefer arama butonuna tıklanamadı.")
-            
-        if not check_trips(driver, chat_id):
-            send_telegram_message(
-                f"Maalesef, {target_date.strftime('%d %B %Y')} tarihi için\n"
-                f"*{from_station} ➡ {to_station}* yönüne boş yer bulunamadı.", 
-                chat_id
-            )
-            
+        await asyncio.to_thread(_run_one_time_check, driver, chat_id, from_station, to_station, target_date)
     except Exception as e:
         print(f"Tek seferlik kontrol hatası ({chat_id}): {e}")
-        send_telegram_message(f"Kontrol sırasında bir hata oluştu: {e}", chat_id)
+        await asyncio.to_thread(send_telegram_message, f"Kontrol sırasında bir hata oluştu: {e}", chat_id)
     finally:
-        driver.quit()
+        await asyncio.to_thread(close_driver, driver)
         print(f"Driver kapatıldı (tek seferlik - {chat_id}).")
 
 # --- KLAVYE OLUŞTURUCU FONKSİYONLAR (GÜNCELLENDİ) ---
@@ -467,9 +527,10 @@ async def stop_command(update: Update, context: CallbackContext):
     chat_id = str(update.message.chat_id)
     
     if chat_id in monitor_jobs:
-        monitor_thread, stop_event = monitor_jobs.pop(chat_id)
-        print(f"Durdurma sinyali gönderiliyor: {chat_id}")
-        stop_event.set()
+        monitor_task = monitor_jobs.pop(chat_id)
+        forget_monitor(chat_id)
+        print(f"İzleme görevi iptal ediliyor: {chat_id}")
+        monitor_task.cancel()
         await update.message.reply_text("İzleme durduruluyor... 🛑")
     else:
         await update.message.reply_text("Aktif bir izlemeniz bulunmuyor.")
@@ -531,13 +592,14 @@ async def button_callback(update: Update, context: CallbackContext):
                 parse_mode='Markdown'
             )
 
-            # Eyleme göre ilgili worker'ı (thread) başlat
+            # Eyleme göre ilgili worker'ı (asyncio görevi) başlat
             if action == "check":
                 print(f"Callback -> check_command: {chat_id}, {from_station}, {to_station}, {target_date}")
-                threading.Thread(
-                    target=run_one_time_check, 
-                    args=(chat_id, from_station, to_station, target_date)
-                ).start()
+                task = asyncio.get_running_loop().create_task(
+                    run_one_time_check(chat_id, from_station, to_station, target_date)
+                )
+                one_time_checks.add(task)
+                task.add_done_callback(one_time_checks.discard)
             
             elif action == "monitor":
                 if chat_id in monitor_jobs:
@@ -545,27 +607,81 @@ async def button_callback(update: Update, context: CallbackContext):
                     return
 
                 print(f"Callback -> monitor_command: {chat_id}, {from_station}, {to_station}, {target_date}")
-                check_interval = 30
-                stop_event = threading.Event()
-                monitor_thread = threading.Thread(
-                    target=monitoring_loop,
-                    args=(chat_id, stop_event, from_station, to_station, target_date, check_interval)
+                check_interval = poll_policy.POLL_BASE_INTERVAL_SECONDS
+                monitor_jobs[chat_id] = asyncio.get_running_loop().create_task(
+                    monitoring_loop(chat_id, from_station, to_station, target_date, check_interval)
                 )
-                
-                monitor_jobs[chat_id] = (monitor_thread, stop_event)
-                monitor_thread.start()
+                if monitor_store is not None:
+                    monitor_store.save(chat_id, from_station, to_station, date_iso_str, check_interval)
 
     except Exception as e:
         print(f"Callback hatası: {e}")
         await query.message.reply_text(f"Buton işlemi sırasında bir hata oluştu: {e}")
 
+# --- Kalıcı İzlemeler ---
+async def startup_engine(application: Application):
+    telegram_outbox.start()
+    await restore_monitors(application)
+
+async def restore_monitors(application: Application):
+    """Kayıtlı izlemeleri tek sorguda okuyup görevlerini, başlangıçları yayılmış şekilde yeniden başlatır."""
+    rows = await asyncio.to_thread(monitor_store.load_all)
+    today = datetime.today().strftime("%Y-%m-%d")
+    active_rows = []
+    for row in rows:
+        if row['target_date'] < today:
+            monitor_store.delete(row['chat_id'])
+        else:
+            active_rows.append(row)
+
+    for row, delay in zip(active_rows, restore_delays(len(active_rows))):
+        target_date = datetime.strptime(row['target_date'], "%Y-%m-%d")
+        # application.create_task değil: Application.stop() bitmeyen izlemeleri beklerdi ve
+        # shutdown_engine (kayıtların diske yazılması) hiç çalışmazdı.
+        monitor_jobs[row['chat_id']] = asyncio.get_running_loop().create_task(
+            monitoring_loop(row['chat_id'], row['from_station'], row['to_station'], target_date, row['interval_seconds'], delay)
+        )
+    if active_rows:
+        print(f"{len(active_rows)} izleme geri yüklendi.")
+
+async def stop_monitors(application: Application):
+    """
+    Kapanışta izleme ve kontrol görevlerini iptal eder. Kapanış bir /stop değildir; iptal edilen
+    izlemelerin kayıtları silinmez, bir sonraki açılışta geri yüklenir.
+    """
+    tasks = list(monitor_jobs.values()) + list(one_time_checks)
+    for task in tasks:
+        task.cancel()
+    # Görevler finally bloklarında Chrome driver'larını kapatır; bitmelerini bekle.
+    await asyncio.gather(*tasks, return_exceptions=True)
+    monitor_jobs.clear()
+    one_time_checks.clear()
+
+async def shutdown_engine(application: Application):
+    """İzleme görevlerini durdurur; bekleyen izleme kayıtlarını diske, kuyruktaki mesajları Telegram'a aktarır."""
+    await stop_monitors(application)
+    await asyncio.to_thread(monitor_store.close)
+    await telegram_outbox.close()
+    await telegram_client.aclose()
+
 # --- Botu Başlatma (GÜNCELLENDİ) ---
 def main():
+    global monitor_store
     if not TELEGRAM_API_TOKEN:
         print("HATA: TELEGRAM_API_TOKEN bulunamadı. Lütfen .env dosyanızı kontrol edin.")
         return
 
-    builder = Application.builder().token(TELEGRAM_API_TOKEN)
+    # Paylaşılan modüllerin (giden kuyruk, izleme kaydı) günlükleri; bu betiğin kendi çıktısı print ile kalır.
+    structured_logging.setup_logging()
+    monitor_store = MonitorStore(MONITOR_STORE_PATH)
+    monitor_store.start()
+
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_API_TOKEN)
+        .post_init(startup_engine)
+        .post_shutdown(shutdown_engine)
+    )
     app = builder.build()
 
     # Komut handler'ları
@@ -579,8 +695,9 @@ def main():
     app.add_handler(CallbackQueryHandler(button_callback, pattern='^(from_|to_|date_)'))
     # -----------------------------------
 
+    metrics.start_metrics_server()
     print("Bot başlatıldı...")
-    app.run_polling()
+    run_application(app)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
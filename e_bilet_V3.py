@@ -1,33 +1,70 @@
-import requests
+import httpx
 import json
+from collections import OrderedDict
 from datetime import datetime, timedelta
-import requests
 from dotenv import load_dotenv
 import os
-import threading
-import locale
+import asyncio
+import logging
 import re
+import time
+import base64
+import contextvars
+import importlib.util
+import math
+import random
+import signal
+import threading
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackContext, CallbackQueryHandler
+from telegram.ext import Application, CommandHandler, CallbackContext, CallbackQueryHandler, MessageHandler, filters
 
-# --- LOKAL AYARI (TÜRKÇE TARİHLER İÇİN) ---
-try:
-    locale.setlocale(locale.LC_TIME, 'tr_TR.UTF-8')
-except locale.Error:
-    try:
-        locale.setlocale(locale.LC_TIME, 'tr_TR')
-    except locale.Error:
-        print("Turkish locale (tr_TR) bulunamadı, varsayılan locale kullanılıyor. Tarihler İngilizce görünebilir.")
-# ---------------------------------------------
+import availability_parser
+import message_rendering
+import metrics
+import poll_policy
+import profiling
+import structured_logging
+import tracing
+import train_filters
+from monitor_store import MonitorStore, restore_delays
+from availability_history import AVAILABILITY_HISTORY_PATH, AvailabilityHistory
+from telegram_outbox import TelegramOutbox
+from bot_runner import run_application
+from worker_pool import WORKER_FRONT_RATE_SHARE, WORKER_PROCESSES, WorkerPool
+from station_catalog import StationCatalog, fold, load_station_catalog, turkish_title
+
+log = logging.getLogger("e_bilet_V3")
+# Her sorgu turunda yazılan satırlar; seviyesi LOG_LEVELS="e_bilet_V3.poll=DEBUG" ile ayrıca açılır.
+poll_log = logging.getLogger("e_bilet_V3.poll")
 
 load_dotenv()
 
 TELEGRAM_API_TOKEN = os.getenv("TELEGRAM_API_TOKEN")
 ADMIN_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID") 
+# /profil özetinin Telegram'a gönderilen kısmı (mesaj sınırı 4096 karakter)
+PROFILE_SUMMARY_CHARS = 3500
 
+# { chat_id: (from_id, to_id, tarih) } - her sohbetin abone olduğu izleme anahtarı
 monitor_jobs = {}
+# { (from_id, to_id, tarih): {'subscribers': {chat_id: son bildirilen snapshot}, 'task': asyncio.Task} }
+subscriptions = {}
+# { chat_id: TrainFilter } - /filtre ile tanımlanmış izleme filtreleri (filtresi olmayan sohbetler yer almaz)
+monitor_filters = {}
+# Süren /profil görevleri. application.create_task kullanılmaz: Application.stop() onları (en fazla
+# PROFILE_MAX_SECONDS) beklerdi ve shutdown_engine kayıtları diske yazamadan süreç öldürülebilirdi.
+profile_tasks = set()
 
+# Bot yeniden başladığında izlemeler buradan geri yüklenir (istasyonlar id olarak saklanır).
+MONITOR_STORE_PATH = os.getenv("MONITOR_STORE_PATH", "monitors_v3.sqlite3")
+monitor_store = None
+# Her taze sorgu sonucu değişiklik varsa buraya eklenir (AVAILABILITY_HISTORY_PATH boşsa kapalı).
+history_store = None
+
+# WORKER_PROCESSES > 0 ise poller'lar işçi süreçlerde çalışır; bu süreç sadece bildirimleri dağıtır.
+worker_pool = None
+
+# Klavyede varsayılan olarak gösterilen favori istasyonlar; diğerleri katalogdan isimle aranır.
 STATION_MAP = {
     "SÖĞÜTLÜÇEŞME": {'id': 1325, 'fullName': 'İSTANBUL(SÖĞÜTLÜÇEŞME)'},
     "ARİFİYE":       {'id': 5,    'fullName': 'ARİFİYE'},
@@ -44,56 +81,285 @@ STATION_MAP = {
     "SİNCAN":       {'id': 192, 'fullName': 'SİNCAN'},
     "ANKARA GAR":   {'id': 98, 'fullName': 'ANKARA GAR'},
 }
+FAVORITE_STATION_IDS = [station['id'] for station in STATION_MAP.values()]
+FAVORITE_LABELS = {station['id']: turkish_title(key) for key, station in STATION_MAP.items()}
+STATION_SEARCH_LIMIT = 10
+
+# main() içinde tam TCDD kataloğu ile değiştirilir; o zamana kadar sadece favoriler bilinir.
+catalog = StationCatalog({station['id']: station['fullName'] for station in STATION_MAP.values()}, "seed")
+
+# --- METRİKLER ---
+TOKEN_FETCH_SECONDS = metrics.Histogram("tcdd_token_fetch_seconds", "get_dynamic_token süresi (ana sayfa + JS paketi)")
+TOKEN_REFRESHES = metrics.Counter("tcdd_token_refreshes_total", "Token yenileme denemeleri (result=ok|error)")
+AVAILABILITY_REQUEST_SECONDS = metrics.Histogram("tcdd_availability_request_seconds", "train-availability POST süresi (hız sınırı beklemesi hariç)")
+AVAILABILITY_RESPONSES = metrics.Counter("tcdd_availability_responses_total", "train-availability yanıtları, HTTP durum koduna göre (code)")
+AVAILABILITY_REQUEST_ERRORS = metrics.Counter("tcdd_availability_request_errors_total", "train-availability ağ/zaman aşımı hataları")
+AVAILABILITY_PARSE_SECONDS = metrics.Histogram("availability_parse_seconds", "Bir trainLegs elemanının ayrıştırılıp mesajın oluşturulma süresi", buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05))
+AVAILABILITY_PARSE_ERRORS = metrics.Counter("availability_parse_errors_total", "Ayrıştırılamayan leg veya tren sayısı (scope=leg|train)")
+NOTIFICATIONS_SENT = metrics.Counter("monitor_notifications_total", "İzlemelerin abonelere gönderdiği bildirimler")
+POLL_ERRORS = metrics.Counter("monitor_poll_errors_total", "Beklenmeyen bir hatayla biten izleme turları")
+metrics.Gauge("monitor_jobs_active", "Aktif izleme yapan sohbet sayısı", callback=lambda: len(monitor_jobs))
+metrics.Gauge("monitor_pollers_active", "Çalışan (güzergah, tarih) poller sayısı", callback=lambda: len(subscriptions))
+metrics.Gauge("process_threads", "Süreçteki thread sayısı", callback=threading.active_count)
+# -----------------
+
+# İzlemelerde bildirim biçimi: 'delta' sadece değişen satırları, 'full' değişiklik olunca tüm listeyi gönderir.
+MONITOR_NOTIFY_MODE = os.getenv("MONITOR_NOTIFY_MODE", "delta")
 
 params = {
     'environment': 'dev',
     'userId': '1',
 }
 
+# --- PAYLAŞILAN HTTP İSTEMCİLERİ ---
+# Her upstream host için tek bir bağlantı havuzu; tüm görevler aynı istemciyi kullanır.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "15"))
+# 'h2' paketi kuruluysa HTTP/2, değilse keep-alive HTTP/1.1 kullanılır.
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+ACCEPT_ENCODING = "gzip, deflate, br" if importlib.util.find_spec("brotli") else "gzip, deflate"
+
+def _build_http_client(base_url: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=HTTP2_ENABLED,
+        headers={'Accept-Encoding': ACCEPT_ENCODING},
+        limits=httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_POOL_SIZE,
+        ),
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    )
+
+# Yük testinde (benchmarks/load_test.py) yerel sahte sunucuya yönlendirmek için değiştirilebilir.
+EBILET_BASE_URL = os.getenv("EBILET_BASE_URL", "https://ebilet.tcddtasimacilik.gov.tr")
+TCDD_API_BASE_URL = os.getenv("TCDD_API_BASE_URL", "https://web-api-prod-ytp.tcddtasimacilik.gov.tr")
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org")
+
+ebilet_client = _build_http_client(EBILET_BASE_URL)
+tcdd_api_client = _build_http_client(TCDD_API_BASE_URL)
+telegram_client = _build_http_client(TELEGRAM_API_BASE_URL)
+telegram_outbox = TelegramOutbox(telegram_client, TELEGRAM_API_TOKEN, parse_mode='HTML')
+# ------------------------------------
+
+# --- TOKEN ÖNBELLEĞİ ---
+# Token JWT'nin 'exp' alanına göre, süresi dolmadan bu kadar saniye önce yenilenir.
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+# 'exp' alanı okunamazsa token bu süre boyunca geçerli sayılır.
+TOKEN_FALLBACK_TTL_SECONDS = int(os.getenv("TOKEN_FALLBACK_TTL_SECONDS", "3600"))
+
+# asyncio.Lock ilk kullanımda, botun event loop'u içinde oluşturulur.
+_token_lock = None
+_token_cache = {'token': None, 'expires_at': 0.0}
+# -------------------------
+
+# --- HIZ SINIRLAYICI (train-availability) ---
+# Tüm izlemeler ve tek seferlik kontroller bu bütçeyi paylaşır; bütçeyi aşan istekler sırada bekler.
+# İşçi modunda her süreç bütçenin bir payını alır (bkz. worker_pool.WORKER_FRONT_RATE_SHARE).
+AVAILABILITY_RATE_PER_SECOND = float(os.getenv("AVAILABILITY_RATE_PER_SECOND", "2"))
+AVAILABILITY_BURST = int(os.getenv("AVAILABILITY_BURST", "5"))
+
+class TokenBucket:
+    """Süreç genelinde token-bucket; acquire() sırayla (FIFO) bekletir, asla hata vermez."""
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Kilit bekleyenleri geliş sırasına göre sıraya koyar.
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def reconfigure(self, rate_per_second: float, burst: int):
+        """Hızı ve kapasiteyi yerinde değiştirir; sırada bekleyenler yeni hıza göre devam eder."""
+        self._refill()
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self.tokens = min(self.tokens, self.capacity)
+
+availability_limiter = TokenBucket(AVAILABILITY_RATE_PER_SECOND, AVAILABILITY_BURST)
+
+def set_limiter_share(share: float):
+    """Bu sürecin sınırlayıcısını hız ve patlama bütçesinin share kadarlık payına ayarlar (işçi modu)."""
+    availability_limiter.reconfigure(AVAILABILITY_RATE_PER_SECOND * share, max(1, round(AVAILABILITY_BURST * share)))
+# ---------------------------------------------
+
+# --- DEVRE KESİCİLER (token ve train-availability) ---
+# Art arda BREAKER_FAILURE_THRESHOLD hatadan sonra devre açılır ve istekler upstream'e hiç gitmeden
+# hemen hata döner. Bekleme süresi dolunca tek bir deneme isteğine izin verilir (yarı açık); başarılıysa
+# devre kapanır, değilse bekleme süresi iki katına çıkarak (en fazla BREAKER_MAX_RESET_SECONDS) yeniden açılır.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+BREAKER_MAX_RESET_SECONDS = float(os.getenv("BREAKER_MAX_RESET_SECONDS", "300"))
+
+BREAKER_REJECTIONS = metrics.Counter("circuit_breaker_rejections_total", "Devre açık olduğu için upstream'e gönderilmeyen istekler (breaker)")
+
+class CircuitBreaker:
+    """
+    Kapalı / açık / yarı açık devre kesici. Sadece event loop'tan kullanılır, kilit gerektirmez.
+    allow() bir izin döndürür; isteğin sonucu bu izinle record_success/record_failure'a, sonucu
+    kaydedilmeden biten istek release()'e bildirilir. Yarı açık durumda izin tek deneme isteğine özeldir
+    ve devreyi sadece o kapatır ya da yeniden açar; devre açılmadan önce gönderilmiş isteklerin geç gelen
+    sonuçları yok sayılır.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+    # Kapalı devrede verilen ortak izin
+    PASS = object()
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float, max_reset_seconds: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_reset_seconds = reset_seconds
+        self.max_reset_seconds = max_reset_seconds
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_until = 0.0
+        self.probe = None  # yarı açık durumdaki deneme isteğinin izni
+        metrics.Gauge(f"{name}_breaker_state", f"{name} devre kesici durumu (0 kapalı, 1 yarı açık, 2 açık)",
+                      callback=lambda: {self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[self.state])
+
+    def accepting(self) -> bool:
+        """İzin almadan, allow()'un şu an izin verip vermeyeceği (istek kuyruğa girmeden önceki hızlı kontrol)."""
+        if self.state == self.CLOSED:
+            return True
+        return self.probe is None and time.monotonic() >= self.opened_until
+
+    def allow(self):
+        """
+        İstek upstream'e gönderilebilirse izni, gönderilemezse None döndürür. Yarı açık durumda aynı
+        anda tek deneme isteğine izin verilir.
+        """
+        if self.state == self.CLOSED:
+            return self.PASS
+        if self.state == self.OPEN and time.monotonic() >= self.opened_until:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and self.probe is None:
+            self.probe = object()
+            log.info("Devre kesici (%s) yarı açık, deneme isteği gönderiliyor.", self.name)
+            return self.probe
+        BREAKER_REJECTIONS.inc(breaker=self.name)
+        return None
+
+    def retry_in(self) -> int:
+        return max(0, math.ceil(self.opened_until - time.monotonic()))
+
+    def _decides(self, permit) -> bool:
+        """Bu iznin sonucu devrenin durumunu etkiler mi? Kapalıyken her istek, değilse sadece deneme isteği."""
+        return self.state == self.CLOSED or (self.probe is not None and permit is self.probe)
+
+    def record_success(self, permit):
+        if not self._decides(permit):
+            return
+        if self.state != self.CLOSED:
+            log.info("Devre kesici (%s) kapandı, upstream tekrar yanıt veriyor.", self.name)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.reset_seconds = self.base_reset_seconds
+        self.probe = None
+
+    def record_failure(self, permit):
+        if not self._decides(permit):
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.reset_seconds = min(self.reset_seconds * 2, self.max_reset_seconds)
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_until = time.monotonic() + self.reset_seconds
+            log.warning("Devre kesici (%s) açıldı, %.0f saniye upstream'e istek gönderilmeyecek.", self.name, self.reset_seconds)
+        self.probe = None
+
+    def release(self, permit):
+        """Sonucu kaydedilmeden biten (iptal edilen veya upstream'e ulaşmayan) deneme isteğinin iznini bırakır."""
+        if self.probe is not None and permit is self.probe:
+            self.probe = None
+
+token_breaker = CircuitBreaker("tcdd_token", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, BREAKER_MAX_RESET_SECONDS)
+availability_breaker = CircuitBreaker("tcdd_availability", BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, BREAKER_MAX_RESET_SECONDS)
+# ------------------------------------------------------
+
+# --- TOPLU SORGU (train-availability) ---
+# Pencere içinde biriken farklı güzergah/tarih sorguları tek POST'ta 'searchRoutes' listesi olarak gönderilir.
+AVAILABILITY_BATCH_SIZE = int(os.getenv("AVAILABILITY_BATCH_SIZE", "5"))
+AVAILABILITY_BATCH_WINDOW_SECONDS = float(os.getenv("AVAILABILITY_BATCH_WINDOW_SECONDS", "0.5"))
+# Küçülen limit, bu kadar dolu toplu sorgu art arda başarılı olunca ikiye katlanır (AVAILABILITY_BATCH_SIZE'a kadar).
+AVAILABILITY_BATCH_GROW_AFTER = int(os.getenv("AVAILABILITY_BATCH_GROW_AFTER", "20"))
+# Sadece bu kodlar "toplu istek fazla büyük" sayılır ve istek bölünür; 5xx ve 429 upstream arızası/yavaşlatmasıdır,
+# bölmek yükü artırır.
+BATCH_REJECT_STATUSES = frozenset([400, 413, 422])
+
+# limit: upstream bir toplu isteği reddettikçe küçülen, başarılı toplu sorgularla tekrar büyüyen etkin boyut
+# successes: limit küçükken art arda başarılı olan dolu toplu sorgu sayısı
+_batch_state = {'limit': AVAILABILITY_BATCH_SIZE, 'successes': 0, 'pending': [], 'flush_task': None}
+# ----------------------------------------------
+
+# --- SONUÇ ÖNBELLEĞİ (train-availability) ---
+AVAILABILITY_CACHE_TTL_SECONDS = float(os.getenv("AVAILABILITY_CACHE_TTL_SECONDS", "20"))
+AVAILABILITY_CACHE_SIZE = int(os.getenv("AVAILABILITY_CACHE_SIZE", "256"))
+
+# { (from_id, to_id, tarih): (alındığı zaman, (found, message, snapshot)) } - en eski kullanılan başta
+_availability_cache = OrderedDict()
+# { (from_id, to_id, tarih): asyncio.Task } - o an devam eden sorgular
+_availability_inflight = {}
+# ----------------------------------------------
+
+# --- KLAVYE ÖNBELLEĞİ ---
+# İstasyon ve tarih klavyeleri her buton basışında yeniden kurulmak yerine bir kez oluşturulup
+# paylaşılır (InlineKeyboardMarkup değiştirilemez olduğu için güvenlidir). Önbellek gün değişince
+# (yerel gece yarısı) veya istasyon kataloğunun sürümü değişince tamamen boşaltılır.
+KEYBOARD_CACHE_SIZE = int(os.getenv("KEYBOARD_CACHE_SIZE", "512"))
+
+# { ('station'|'date', action, ...): InlineKeyboardMarkup } - en eski kullanılan başta
+_keyboard_cache = OrderedDict()
+# generation: önbelleğin ait olduğu (katalog sürümü, gün); date_labels: o günün tarih butonu metinleri
+_keyboard_cache_state = {'generation': None, 'date_labels': None}
+KEYBOARD_CACHE_LOOKUPS = metrics.Counter("keyboard_cache_lookups_total", "Klavye önbelleği aramaları (result=hit|miss)")
+# ----------------------------------------------
+
 def send_telegram_message(message: str, chat_id: str):
-    """(Thread içinden mesaj göndermek için)"""
-    url = f'https://api.telegram.org/bot{TELEGRAM_API_TOKEN}/sendMessage'
-    payload = {'chat_id': chat_id, 'text': message, 'parse_mode': 'HTML'}
-    try:
-        response = requests.post(url, data=payload, timeout=10)
-        if response.status_code == 400:
-            print(f"HTML formatı hatası algılandı, düz metin olarak tekrar deneniyor...")            
-            payload.pop('parse_mode')
-            retry_response = requests.post(url, data=payload, timeout=10)
-            if retry_response.status_code == 200:
-                 print(f"Telegram mesajı (Düz Metin) {chat_id} için kurtarıldı ve gönderildi.")
-            else:
-                 print(f"Mesaj kurtarılamadı: {retry_response.text}")
-        elif response.status_code == 200:
-            print(f"Telegram mesajı {chat_id} için gönderildi.")
-        else:
-            print(f"Telegram mesajı {chat_id} için gönderilemedi:", response.text)
-    except Exception as e:
-        print(f"Telegram mesajı {chat_id} için gönderme hatası:", e)
+    """Mesajı giden kuyruğuna ekler ve hemen döner; gönderim, birleştirme, bölme ve hız sınırı telegram_outbox'ta."""
+    telegram_outbox.enqueue(chat_id, message)
 
-def get_dynamic_token():
-    base_url = "https://ebilet.tcddtasimacilik.gov.tr"
+async def get_dynamic_token():
+    base_url = EBILET_BASE_URL
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.0.0 Safari/537.36',
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
     }
     
     try:
-        print(f"Ana sayfa ({base_url}) alınıyor...")
-        main_page_response = requests.get(base_url, headers=headers, timeout=10)
+        log.info("Ana sayfa (%s) alınıyor...", base_url)
+        main_page_response = await ebilet_client.get("/", headers=headers)
         main_page_response.raise_for_status()
         
         html_content = main_page_response.text
         
         js_match = re.search(r'src="(/js/index\.[a-f0-9]+\.js\?.*?)"', html_content)
         if not js_match:
-            print("HATA: Ana JS dosyası (index...js) HTML'de bulunamadı.")
+            log.error("Ana JS dosyası (index...js) HTML'de bulunamadı.")
             return None
         
         js_file_url = base_url + js_match.group(1)
-        print(f"Bulunan JS dosyası: {js_file_url}")
+        log.debug("Bulunan JS dosyası: %s", js_file_url)
         
-        js_response = requests.get(js_file_url, headers=headers, timeout=10)
+        js_response = await ebilet_client.get(js_match.group(1), headers=headers)
         js_response.raise_for_status()
         
         js_content = js_response.text
@@ -103,35 +369,171 @@ def get_dynamic_token():
             js_content, 
             re.DOTALL
         )
-        print(token_match)
-        
+
         if not token_match:
-            print("HATA: 'TCDD-PROD' token'ı JS dosyası içinde bulunamadı. (RegEx başarısız)")
+            log.error("'TCDD-PROD' token'ı JS dosyası içinde bulunamadı. (RegEx başarısız)")
             return None
             
         access_token = token_match.group(1)
-        print("Dinamik token başarıyla bulundu ve ayıklandı.")
+        log.info("Dinamik token başarıyla bulundu ve ayıklandı.")
         return f"Bearer {access_token}"
 
-    except requests.exceptions.RequestException as e:
-        print(f"HATA: Token alma işlemi sırasında ağ hatası: {e}")
+    except httpx.HTTPError as e:
+        log.error("Token alma işlemi sırasında ağ hatası: %s", e)
         return None
     except Exception as e:
-        print(f"HATA: Token ayrıştırılırken genel bir hata oluştu: {e}")
+        log.exception("Token ayrıştırılırken genel bir hata oluştu: %s", e)
         return None
 
-def check_api_and_parse(from_key: str, to_key: str, target_date: datetime):
+def _jwt_expiry(bearer_token: str):
+    """'Bearer eyJ...' token'ının 'exp' alanını (unix saniye) döndürür, okunamazsa None."""
+    try:
+        payload_b64 = bearer_token.split(' ', 1)[-1].split('.')[1]
+        payload_b64 += '=' * (-len(payload_b64) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(payload_b64))
+        return float(payload['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
 
-    dynamic_token = get_dynamic_token()
+async def get_cached_token(stale_token: str = None):
+    """
+    Süreç genelinde paylaşılan token'ı döndürür; gerekirse tek bir yenileme yapar.
+    stale_token verilirse (örn. 401 alındıysa) o token artık geçersiz sayılır.
+    Aynı anda yenileme isteyen görevler kilitte bekler ve aynı sonucu kullanır.
+    """
+    global _token_lock
+    token = _token_cache['token']
+    if token and token != stale_token and time.time() < _token_cache['expires_at']:
+        return token
+
+    if _token_lock is None:
+        _token_lock = asyncio.Lock()
+    async with _token_lock:
+        # Kilidi beklerken başka bir görev token'ı yenilemiş olabilir.
+        token = _token_cache['token']
+        if token and token != stale_token and time.time() < _token_cache['expires_at']:
+            return token
+
+        permit = token_breaker.allow()
+        if permit is None:
+            return None
+        try:
+            with TOKEN_FETCH_SECONDS.time():
+                token = await get_dynamic_token()
+            if token:
+                token_breaker.record_success(permit)
+            else:
+                token_breaker.record_failure(permit)
+        finally:
+            token_breaker.release(permit)
+        if not token:
+            TOKEN_REFRESHES.inc(result="error")
+            return None
+        TOKEN_REFRESHES.inc(result="ok")
+
+        expiry = _jwt_expiry(token)
+        if expiry is None:
+            expires_at = time.time() + TOKEN_FALLBACK_TTL_SECONDS
+        else:
+            # Süresi zaten dolmak üzere olan bir token'ı her çağrıda yeniden kazımamak için alt sınır.
+            expires_at = max(expiry - TOKEN_REFRESH_MARGIN_SECONDS, time.time() + 60)
+        _token_cache['token'] = token
+        _token_cache['expires_at'] = expires_at
+        log.info("Token önbelleğe alındı, %d saniye geçerli.", expires_at - time.time())
+        return token
+
+async def _post_availability(headers: dict, json_data: dict):
+    """
+    Hız sınırlayıcıdan sıra alıp POST'u gönderir ve sonucu devre kesiciye bildirir. Sırada beklerken
+    devre açıldıysa istek gönderilmez ve None döner.
+    """
+    await availability_limiter.acquire()
+    permit = availability_breaker.allow()
+    if permit is None:
+        return None
+    try:
+        with AVAILABILITY_REQUEST_SECONDS.time(), tracing.span("availability_post"):
+            response = await tcdd_api_client.post(
+                '/tms/train/train-availability',
+                params=params,
+                headers=headers,
+                json=json_data,
+            )
+    except httpx.HTTPError:
+        availability_breaker.record_failure(permit)
+        raise
+    finally:
+        availability_breaker.release(permit)
+    AVAILABILITY_RESPONSES.inc(code=response.status_code)
+    _record_availability_response(response, permit)
+    return response
+
+def station_label(station_id: int) -> str:
+    """Kullanıcıya gösterilecek istasyon adı: favorilerde kısa ad, değilse katalogdaki ad."""
+    label = FAVORITE_LABELS.get(station_id)
+    if label:
+        return label
+    station = catalog.get(station_id)
+    return station['title'] if station else str(station_id)
+
+def build_search_route(from_id: int, to_id: int, target_date: datetime):
+    """
+    Bir (kalkış, varış, tarih) sorgusunu train-availability 'searchRoutes' elemanına çevirir.
+    İstasyonlardan biri katalogda yoksa (ör. katalog güncellenip istasyon kaldırıldıysa) None döndürür.
+    """
+    from_station = catalog.get(from_id)
+    to_station = catalog.get(to_id)
+    if from_station is None or to_station is None:
+        return None
+
+    api_search_date = target_date - timedelta(days=1)
+
+    date_str = api_search_date.strftime("%d-%m-%Y") + " 21:00:00"
+
+    return {
+        'departureStationId': from_station['id'],
+        'departureStationName': from_station['name'],
+        'arrivalStationId': to_station['id'],
+        'arrivalStationName': to_station['name'],
+        'departureDate': date_str,
+    }
+
+async def request_train_legs(search_routes: list):
+    """
+    Verilen güzergahlar için tek bir train-availability POST'u yapar.
+    (trainLegs, None, False) ya da (None, hata mesajı, rejected) döndürür; rejected, isteğin upstream
+    tarafından boyutu yüzünden reddedildiğini (BATCH_REJECT_STATUSES; bölünerek tekrar denenebileceğini) belirtir.
+    Devre kesici açıksa (ya da istek hız sınırlayıcıda beklerken açılırsa) upstream'e gidilmeden hata döner.
+    """
+    if not availability_breaker.accepting():
+        BREAKER_REJECTIONS.inc(breaker=availability_breaker.name)
+        return _availability_breaker_error()
+    return await _request_train_legs(search_routes)
+
+def _availability_breaker_error():
+    return (None, f"❌ HATA: TCDD API'si şu an yanıt vermiyor (bakım olabilir). {availability_breaker.retry_in()} saniye sonra tekrar denenecek.", False)
+
+def _record_availability_response(response: httpx.Response, permit):
+    # 5xx upstream arızasıdır, 429 upstream'in yavaşlama isteğidir; ikisi de hata sayılır ve devre açılınca
+    # istekler bekletilir. Diğer 4xx'ler (yetki, çok büyük toplu istek) upstream'in sağlıklı olduğunu gösterir.
+    if response.status_code >= 500 or response.status_code == 429:
+        availability_breaker.record_failure(permit)
+    else:
+        availability_breaker.record_success(permit)
+
+async def _request_train_legs(search_routes: list):
+    with tracing.span("token"):
+        dynamic_token = await get_cached_token()
 
     if not dynamic_token:
-        return (False, "❌ HATA: Dinamik Authorization Token'ı alınamadı. Botun 'get_dynamic_token' fonksiyonunu kontrol edin.")
+        if token_breaker.state != CircuitBreaker.CLOSED:
+            return (None, f"❌ HATA: TCDD e-bilet sitesine şu an ulaşılamıyor (bakım olabilir). {token_breaker.retry_in()} saniye sonra tekrar denenecek.", False)
+        return (None, "❌ HATA: Dinamik Authorization Token'ı alınamadı. Botun 'get_dynamic_token' fonksiyonunu kontrol edin.", False)
 
     headers = {
         'Accept': 'application/json, text/plain, */*',
         'Accept-Language': 'tr',
         'Authorization': dynamic_token,
-        'Connection': 'keep-alive',
         'Content-Type': 'application/json',
         'Origin': 'https://ebilet.tcddtasimacilik.gov.tr',
         'Sec-Fetch-Dest': 'empty',
@@ -144,23 +546,8 @@ def check_api_and_parse(from_key: str, to_key: str, target_date: datetime):
         'unit-id': '3895',
     }
 
-    from_station = STATION_MAP[from_key]
-    to_station = STATION_MAP[to_key]
-
-    api_search_date = target_date - timedelta(days=1)
-
-    date_str = api_search_date.strftime("%d-%m-%Y") + " 21:00:00"
-
     json_data = {
-        'searchRoutes': [
-            {
-                'departureStationId': from_station['id'],
-                'departureStationName': from_station['fullName'],
-                'arrivalStationId': to_station['id'],
-                'arrivalStationName': to_station['fullName'],
-                'departureDate': date_str,
-            },
-        ],
+        'searchRoutes': search_routes,
         'passengerTypeCounts': [
             {
                 'id': 0,
@@ -175,183 +562,662 @@ def check_api_and_parse(from_key: str, to_key: str, target_date: datetime):
     }
 
     try:
-        response = requests.post(
-            'https://web-api-prod-ytp.tcddtasimacilik.gov.tr/tms/train/train-availability',
-            params=params,
-            headers=headers,
-            json=json_data,
-            timeout=15
-        )
+        response = await _post_availability(headers, json_data)
+        if response is None:
+            return _availability_breaker_error()
+
+        if response.status_code == 401:
+            # Token erken geçersiz kılınmış olabilir; bir kez yenileyip tekrar dene.
+            log.warning("API 401 döndü, token yenilenip tekrar deneniyor...")
+            with tracing.span("token"):
+                dynamic_token = await get_cached_token(stale_token=dynamic_token)
+            if dynamic_token:
+                headers['Authorization'] = dynamic_token
+                response = await _post_availability(headers, json_data)
+                if response is None:
+                    return _availability_breaker_error()
 
         if response.status_code == 401:
-            return (False, "❌ HATA: API Yetki (Authorization) Token'ı geçersiz veya süresi dolmuş. Botun sahibinin `.env` dosyasında token'ı güncellemesi gerekiyor.")
+            return (None, "❌ HATA: API Yetki (Authorization) Token'ı geçersiz veya süresi dolmuş. Botun sahibinin `.env` dosyasında token'ı güncellemesi gerekiyor.", False)
         elif response.status_code != 200:
-            return (False, f"❌ HATA: API'den beklenmedik bir yanıt alındı. Durum Kodu: {response.status_code}\nYanıt: {response.text[:100]}")
+            return (None, f"❌ HATA: API'den beklenmedik bir yanıt alındı. Durum Kodu: {response.status_code}\nYanıt: {message_rendering.escape(response.text[:100])}", response.status_code in BATCH_REJECT_STATUSES)
 
-        data = response.json()
-        
-        sefer_gruplari_listesi = data["trainLegs"][0]["trainAvailabilities"]
-        
-        date_tr_str = target_date.strftime("%d %B %Y")
-        route_str = f"<b>{from_key.capitalize()} ➡ {to_key.capitalize()}</b> | <b>{date_tr_str}</b>"
+        with tracing.span("decode"):
+            return (availability_parser.loads(response.content)["trainLegs"], None, False)
 
-        if not sefer_gruplari_listesi:
-            return (False, f"ℹ️ Maalesef, {route_str} yönüne uygun sefer bulunamadı.")
+    except httpx.HTTPError as e:
+        AVAILABILITY_REQUEST_ERRORS.inc()
+        return (None, f"❌ HATA: API'ye bağlanırken bir sorun oluştu: {message_rendering.escape(e)}", False)
+    except (KeyError, TypeError, ValueError) as e:
+        return (None, f"❌ HATA: API'den gelen yanıtın yapısı değişmiş. Yanıt ayrıştırılamadı. Hata: {message_rendering.escape(e)}", False)
 
-        result_message = f"✅ <b>{route_str}</b>\n\nBulunan seferler:\n"
-        
-        toplam_tren_sayaci = 0
-        bulunan_koltuk = False
-        
-        for i, sefer_grubu in enumerate(sefer_gruplari_listesi):
-            trenler_listesi = sefer_grubu.get("trains")
-            if not trenler_listesi:
-                continue
-                
-            for j, tren in enumerate(trenler_listesi):
-                toplam_tren_sayaci += 1
-
-                tren_mesaj_taslagi = ""
-                vagon_bulundu_bu_trende = False
-                
-                try:
-                    timestamp_ms = tren["segments"][0]["departureTime"]
-                    timestamp_sn = timestamp_ms / 1000
-                    kalkis_saati_str = datetime.fromtimestamp(timestamp_sn).strftime("%H:%M")
-                    tren_adi = tren.get("trainName", f"Tren {toplam_tren_sayaci}")
-                    
-                    tren_mesaj_taslagi += f"\n<b>{tren_adi} (Kalkış: {kalkis_saati_str})</b>:\n"
-                    
-                    vagon_bilgisi_sozlugu = tren["availableFareInfo"][0]
-                    vagon_siniflari_listesi = vagon_bilgisi_sozlugu["cabinClasses"]
-                    
-                    if not vagon_siniflari_listesi:
-                        result_message += "   - (Vagon bilgisi bulunamadı)\n"
-                        continue
-
-                    for vagon in vagon_siniflari_listesi:
-                        sinif_adi = vagon["cabinClass"]["name"]
-                        uygun_koltuk = vagon["availabilityCount"]
-                        
-                        unwanted_types = ["TEKERLEKLİ SANDALYE", "YATAKLI", "LOCA"]
-                        if sinif_adi.upper() in unwanted_types:
-                            continue
-                            
-                        if uygun_koltuk > 0:
-                            bulunan_koltuk = True
-                            vagon_bulundu_bu_trende = True
-                            minimum_fiyat = vagon["minPrice"]
-                            tren_mesaj_taslagi += f"   ✅ <b>{sinif_adi}: {uygun_koltuk} adet</b> (min {minimum_fiyat} TRY)\n"
-
-                    if vagon_bulundu_bu_trende:
-                         result_message += tren_mesaj_taslagi
-                         
-                except (KeyError, IndexError, TypeError) as e:
-                    print(f"Parsing error for one train: {e}")
-                    result_message += "   - (Bu trenin verisi okunurken hata oluştu)\n"
-
-        if not bulunan_koltuk:
-            return (False, f"ℹ️ {route_str} yönüne sefer bulundu, ancak <b>tüm vagonlar dolu</b>.")
+def route_title(from_id: int, to_id: int, target_date: datetime) -> str:
+    return message_rendering.route_title(station_label(from_id), station_label(to_id), target_date)
+
+def _train_header(train_name: str, departure: str) -> str:
+    return f"\n{message_rendering.train_header(train_name, departure)}\n"
+
+def _cabin_line(cabin_name: str, seats: int, min_price) -> str:
+    return f"{message_rendering.cabin_line(cabin_name, seats, min_price)}\n"
+
+def render_trains(trains: list, route_str: str):
+    """Ayrıştırılmış Train listesinden (found, message, snapshot) sonucunu üretir."""
+    if not trains:
+        return (False, f"ℹ️ Maalesef, {route_str} yönüne uygun sefer bulunamadı.", {})
+
+    parts = [f"✅ {route_str}\n\nBulunan seferler:\n"]
+    # { (tren adı, kalkış saati, vagon sınıfı): (boş koltuk, min fiyat) } - izlemelerde değişiklik tespiti için
+    snapshot = {}
+
+    for train in trains:
+        if train.parse_error:
+            parts.append("   - (Bu trenin verisi okunurken hata oluştu)\n")
+            continue
+        if train.cabins is None:
+            parts.append("   - (Vagon bilgisi bulunamadı)\n")
+            continue
+        if not train.cabins:
+            continue
+
+        parts.append(_train_header(train.name, train.departure))
+        for cabin in train.cabins:
+            snapshot[(train.name, train.departure, cabin.name)] = (cabin.seats, cabin.min_price)
+            parts.append(_cabin_line(cabin.name, cabin.seats, cabin.min_price))
+
+    if not snapshot:
+        return (False, f"ℹ️ {route_str} yönüne sefer bulundu, ancak <b>tüm vagonlar dolu</b>.", snapshot)
+    return (True, "".join(parts), snapshot)
+
+def render_filtered(train_filter, snapshot: dict, route_str: str):
+    """
+    Ortak sonucun snapshot'ını bir izleme filtresinden geçirir ve sadece kalan satırları yazar:
+    (found, message, filtrelenmiş snapshot). Reddedilen seferler mesaja hiç girmez.
+    """
+    snapshot = train_filter.filter_snapshot(snapshot)
+    description = message_rendering.escape(train_filter.describe())
+    if not snapshot:
+        return (False, f"ℹ️ {route_str} yönünde filtrenize ({description}) uyan boş yer yok.", snapshot)
+
+    parts = [f"✅ {route_str}\n\nBulunan seferler ({description}):\n"]
+    last_train = None
+    for (train_name, departure, cabin_name), (seats, min_price) in snapshot.items():
+        if (train_name, departure) != last_train:
+            parts.append(_train_header(train_name, departure))
+            last_train = (train_name, departure)
+        parts.append(_cabin_line(cabin_name, seats, min_price))
+    return (True, "".join(parts), snapshot)
+
+def build_leg_result(train_leg: dict, from_id: int, to_id: int, target_date: datetime):
+    """Tek bir trainLegs elemanını (found, message, snapshot) sonucuna çevirir."""
+    with AVAILABILITY_PARSE_SECONDS.time():
+        try:
+            with tracing.span("parse"):
+                trains = availability_parser.parse_train_leg(train_leg)
+        except (KeyError, IndexError, TypeError) as e:
+            AVAILABILITY_PARSE_ERRORS.inc(scope="leg")
+            return (False, f"❌ HATA: API'den gelen yanıtın yapısı değişmiş. Yanıt ayrıştırılamadı. Hata: {message_rendering.escape(e)}", None)
+
+        broken_trains = sum(1 for train in trains if train.parse_error)
+        if broken_trains:
+            AVAILABILITY_PARSE_ERRORS.inc(broken_trains, scope="train")
+
+        with tracing.span("render"):
+            return render_trains(trains, route_title(from_id, to_id, target_date))
+
+async def check_api_and_parse_batch(queries: list, traces: list = None):
+    """
+    Birden fazla (from_id, to_id, target_date) sorgusunu tek bir POST ile sorgular ve
+    trainLegs[i] sonuçlarını sırasıyla her sorguya dağıtır. Upstream toplu isteği reddederse
+    (hata kodu ya da eksik trainLegs) istek ikiye bölünerek tekrar denenir.
+    traces verilirse (sorgu başına trace demeti) ayrıştırma ve yazım süreleri sorgunun kendi trace'ine yazılır.
+    """
+    search_routes = [build_search_route(*query) for query in queries]
+    if None in search_routes:
+        return await _check_known_stations(queries, search_routes, traces)
+    train_legs, error_message, rejected = await request_train_legs(search_routes)
+
+    if train_legs is not None and len(train_legs) != len(queries):
+        error_message = f"❌ HATA: API {len(queries)} güzergah için {len(train_legs)} sonuç döndürdü."
+        train_legs, rejected = None, True
+
+    if train_legs is None:
+        if rejected and len(queries) > 1:
+            # Upstream bu boyutu kabul etmiyor; sonraki toplu sorgular da küçültülür.
+            # Eşzamanlı bölünen yarılar limiti ikinci kez yarıya indirmesin diye reddedilen boyuta göre hesaplanır.
+            _batch_state['limit'] = max(1, min(_batch_state['limit'], len(queries) // 2))
+            _batch_state['successes'] = 0
+            log.warning("Toplu sorgu (%d güzergah) reddedildi, bölünüyor. Yeni limit: %d", len(queries), _batch_state['limit'])
+            middle = len(queries) // 2
+            first_half, second_half = await asyncio.gather(
+                check_api_and_parse_batch(queries[:middle], traces and traces[:middle]),
+                check_api_and_parse_batch(queries[middle:], traces and traces[middle:]),
+            )
+            return first_half + second_half
+        return [(False, error_message, None)] * len(queries)
+
+    _record_batch_success(len(queries))
+    if traces is None:
+        return [build_leg_result(train_leg, *query) for train_leg, query in zip(train_legs, queries)]
+    results = []
+    for train_leg, query, query_traces in zip(train_legs, queries, traces):
+        with tracing.attach(query_traces):
+            results.append(build_leg_result(train_leg, *query))
+    return results
+
+async def _check_known_stations(queries: list, search_routes: list, traces: list = None):
+    """Katalogda olmayan istasyonlu sorgulara hata sonucu döndürür; kalanları upstream'e toplu sorgular."""
+    known = [i for i, route in enumerate(search_routes) if route is not None]
+    results = []
+    for query, route in zip(queries, search_routes):
+        if route is None:
+            log.warning("İstasyon katalogda yok, sorgu atlanıyor.", extra=route_fields(subscription_key(*query)))
+            results.append((False, "❌ HATA: İstasyonlardan biri artık TCDD istasyon listesinde yok. Lütfen güzergahı yeniden seçin.", None))
         else:
-            return (True, result_message)
+            results.append(None)
+    if known:
+        known_results = await check_api_and_parse_batch(
+            [queries[i] for i in known], traces and [traces[i] for i in known]
+        )
+        for i, result in zip(known, known_results):
+            results[i] = result
+    return results
 
-    except requests.exceptions.RequestException as e:
-        return (False, f"❌ HATA: API'ye bağlanırken bir sorun oluştu: {e}")
-    except (KeyError, IndexError, TypeError) as e:
-        return (False, f"❌ HATA: API'den gelen yanıtın yapısı değişmiş. Yanıt ayrıştırılamadı. Hata: {e}")
+def _record_batch_success(size: int):
+    """Küçültülmüş limit dolu toplu sorgular art arda başarılı oldukça tekrar büyütülür."""
+    limit = _batch_state['limit']
+    if limit >= AVAILABILITY_BATCH_SIZE or size < limit:
+        return
+    _batch_state['successes'] += 1
+    if _batch_state['successes'] >= AVAILABILITY_BATCH_GROW_AFTER:
+        _batch_state['limit'] = min(AVAILABILITY_BATCH_SIZE, limit * 2)
+        _batch_state['successes'] = 0
+        log.info("Toplu sorgular başarılı, limit büyütüldü: %d", _batch_state['limit'])
 
-def run_one_time_check(chat_id: str, from_key: str, to_key: str, target_date: datetime):
+async def check_api_and_parse(from_id: int, to_id: int, target_date: datetime):
+    results = await check_api_and_parse_batch([(from_id, to_id, target_date)])
+    return results[0]
 
-    print(f"Tek seferlik API kontrolü: {chat_id} | {from_key} -> {to_key} | {target_date.strftime('%d.%m.%Y')}")
-    
-    found, message = check_api_and_parse(from_key, to_key, target_date)
-    
-    send_telegram_message(message, chat_id)
-    print(f"Tek seferlik kontrol tamamlandı ({chat_id}).")
+def _detached_task(coro) -> asyncio.Task:
+    """
+    Görevi çağıranın contextvars'ı (günlük bağlamı, trace'ler) olmadan başlatır. Toplu sorgu ve ortak
+    sorgu görevleri birden fazla çağırana hizmet eder; ilk çağıranın sohbet/güzergah alanları onların
+    günlük satırlarına yapışmamalıdır. (create_task(context=...) Python 3.11'de geldi.)
+    """
+    return contextvars.Context().run(asyncio.get_running_loop().create_task, coro)
 
-def monitoring_loop(chat_id: str, stop_event: threading.Event, from_key: str, to_key: str, target_date: datetime, interval_seconds: int):
+async def _run_batch(batch: list):
+    # Toplu sorgunun günlük satırları (reddedilme, 401 sonrası tekrar) tek bir güzergaha ait değildir.
+    structured_logging.bind_context(routes=len(batch))
+    traces = [query_traces for _, _, query_traces in batch]
+    try:
+        # Ortak aşamalar (token, POST, decode) toplu sorgudaki her sorgunun trace'ine yazılır.
+        with tracing.attach(tuple({trace for query_traces in traces for trace in query_traces})):
+            results = await check_api_and_parse_batch([query for query, _, _ in batch], traces)
+    except Exception as e:
+        results = [(False, f"❌ HATA: Toplu sorgu sırasında beklenmedik hata: {message_rendering.escape(e)}", None)] * len(batch)
+    for (_, future, _), result in zip(batch, results):
+        if not future.done():
+            future.set_result(result)
 
-    print(f"API İzleme başladı: {chat_id} | {from_key} -> {to_key} | {target_date.strftime('%d.%m.%Y')}")
-    send_telegram_message(
-        f"Takip başladı: *{from_key.capitalize()} ➡ {to_key.capitalize()}* | {target_date.strftime('%d %B')}. "
-        f"{interval_seconds} saniyede bir kontrol edilecek. Sadece boş yer bulunca haber vereceğim. 🤫",
-        chat_id
-    )
-    
-    while not stop_event.is_set():
-        print(f"API Kontrol ediliyor ({chat_id})...")
-        
-        found, message = check_api_and_parse(from_key, to_key, target_date)
-        
-        if found:
-            print(f"BOŞ YER BULUNDU! ({chat_id})")
-            send_telegram_message("🚨 BİLET BULUNDU! 🚨\n\n" + message, chat_id)
-            # İsteğe bağlı: Bulunca dursun
-            # stop_event.set() 
-            # break
-        
-        print(f"{interval_seconds} saniye bekleniyor...")
-        if stop_event.wait(interval_seconds):
-            break
-            
-    print(f"API İzleme durdu ({chat_id}).")
-    if chat_id in monitor_jobs:
+async def _flush_batches():
+    pending, _batch_state['pending'] = _batch_state['pending'], []
+    limit = _batch_state['limit']
+    await asyncio.gather(*(
+        _run_batch(pending[i:i + limit]) for i in range(0, len(pending), limit)
+    ))
+
+async def _flush_after_window():
+    await asyncio.sleep(AVAILABILITY_BATCH_WINDOW_SECONDS)
+    _batch_state['flush_task'] = None
+    await _flush_batches()
+
+async def query_availability(from_id: int, to_id: int, target_date: datetime):
+    """
+    Sorguyu toplu sorgu kuyruğuna ekler ve kendi sonucunu bekler. Kuyruk, pencere süresi
+    dolunca ya da limit kadar sorgu birikince tek bir POST olarak gönderilir.
+    """
+    if _batch_state['limit'] <= 1 or AVAILABILITY_BATCH_WINDOW_SECONDS <= 0:
+        return await check_api_and_parse(from_id, to_id, target_date)
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    _batch_state['pending'].append(((from_id, to_id, target_date), future, tracing.current_traces()))
+
+    if len(_batch_state['pending']) >= _batch_state['limit']:
+        _detached_task(_flush_batches())
+    elif _batch_state['flush_task'] is None:
+        _batch_state['flush_task'] = _detached_task(_flush_after_window())
+    return await future
+
+def _cache_availability(key: tuple, result: tuple):
+    _availability_cache[key] = (time.monotonic(), result)
+    _availability_cache.move_to_end(key)
+    while len(_availability_cache) > AVAILABILITY_CACHE_SIZE:
+        _availability_cache.popitem(last=False)
+
+async def _fetch_availability(key: tuple, from_id: int, to_id: int, target_date: datetime, traces: tuple = ()):
+    # Ortak sorgu kendi bağlamında çalışır: günlüğe sadece güzergah alanları eklenir, aşama süreleri
+    # sorguyu başlatan çağıranın trace'lerine yazılır.
+    structured_logging.bind_context(**route_fields(key))
+    try:
+        with tracing.attach(traces):
+            result = await query_availability(from_id, to_id, target_date)
+        # Hata sonuçları (snapshot None) önbelleğe alınmaz; bir sonraki çağrı yeniden dener.
+        if result[2] is not None:
+            _cache_availability(key, result)
+            if history_store is not None:
+                history_store.record(key, result[2])
+        return result
+    finally:
+        _availability_inflight.pop(key, None)
+
+def format_age(seconds: float) -> str:
+    if seconds < 60:
+        return f"{int(seconds)} saniye"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} dakika"
+    return f"{int(seconds // 3600)} saat {int(seconds % 3600 // 60)} dakika"
+
+async def get_availability(from_id: int, to_id: int, target_date: datetime, max_age: float = None, allow_stale: bool = False):
+    """
+    check_api_and_parse sonucunu önbellekten veya upstream'den döndürür.
+    max_age saniyeden eski olmayan bir sonuç varsa o kullanılır (varsayılan: TTL, 0: her zaman taze).
+    Aynı anahtar için süren bir sorgu varsa yenisi açılmaz, onun sonucu beklenir.
+    allow_stale True ise ve upstream hata verirse (örn. devre açık), önbellekteki son sonuç yaşı
+    belirtilerek döndürülür.
+    """
+    if max_age is None:
+        max_age = AVAILABILITY_CACHE_TTL_SECONDS
+    key = subscription_key(from_id, to_id, target_date)
+
+    cached = _availability_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] <= max_age:
+        _availability_cache.move_to_end(key)
+        return cached[1]
+
+    task = _availability_inflight.get(key)
+    if task is None:
+        task = _detached_task(_fetch_availability(key, from_id, to_id, target_date, tracing.current_traces()))
+        _availability_inflight[key] = task
+    # shield: bekleyenlerden biri iptal edilirse (örn. /stop) ortak sorgu diğerleri için sürer.
+    result = await asyncio.shield(task)
+
+    stale = _availability_cache.get(key)
+    if allow_stale and result[2] is None and stale is not None:
+        fetched_at, (found, message, snapshot) = stale
+        log.warning("Upstream hatası, önbellekteki eski sonuç kullanılıyor.", extra=route_fields(key))
+        notice = f"⚠️ TCDD'ye şu an ulaşılamıyor. Aşağıdaki sonuç <b>{format_age(time.monotonic() - fetched_at)} önce</b> alındı:\n\n"
+        return (found, notice + message, snapshot)
+    return result
+
+async def run_one_time_check(chat_id: str, from_id: int, to_id: int, target_date: datetime):
+
+    structured_logging.bind_context(chat=chat_id, **route_fields(subscription_key(from_id, to_id, target_date)))
+    log.info("Tek seferlik API kontrolü başladı.")
+
+    with tracing.trace("check"):
+        with tracing.span("availability"):
+            found, message, _ = await get_availability(from_id, to_id, target_date, allow_stale=True)
+
+        send_telegram_message(message, chat_id)
+    log.info("Tek seferlik kontrol tamamlandı.")
+
+def route_fields(key: tuple) -> dict:
+    """Günlük kayıtlarına eklenecek güzergah ve tarih alanları."""
+    return {'route': f"{key[0]}-{key[1]}", 'date': key[2]}
+
+def subscription_key(from_id: int, to_id: int, target_date: datetime):
+    """Aynı güzergah ve tarihi izleyen tüm sohbetler için ortak anahtar: (from_id, to_id, tarih)."""
+    return (from_id, to_id, target_date.strftime("%Y-%m-%d"))
+
+def subscribe_monitor(chat_id: str, from_id: int, to_id: int, target_date: datetime, interval_seconds: int,
+                      last_snapshot: dict = None, start_delay: float = None, persist: bool = True, train_filter=None):
+    """
+    Sohbeti ilgili aboneliğe ekler. Bu anahtar için çalışan bir poller yoksa görev olarak başlatır,
+    varsa mevcut poller'a yeniden başlatmadan abone olur. Botun event loop'u içinden çağrılmalıdır.
+    Filtreler poller'ı etkilemez; ortak sonuç her abonenin filtresinden deliver_result'ta geçirilir.
+    """
+    key = subscription_key(from_id, to_id, target_date)
+    subscription = subscriptions.get(key)
+    if subscription is None:
+        subscription = {'subscribers': {}}
+        if worker_pool is not None:
+            poller = remote_monitoring_loop(key, interval_seconds, start_delay)
+        else:
+            poller = monitoring_loop(key, from_id, to_id, target_date, interval_seconds, start_delay)
+        subscription['task'] = asyncio.get_running_loop().create_task(poller)
+        subscriptions[key] = subscription
+    # None: bu sohbete henüz sonuç bildirilmedi, ilk bulunan sonuç tam mesaj olarak gider.
+    subscription['subscribers'][chat_id] = last_snapshot
+    monitor_jobs[chat_id] = key
+    if train_filter:
+        monitor_filters[chat_id] = train_filter
+    else:
+        monitor_filters.pop(chat_id, None)
+    if persist and monitor_store is not None:
+        monitor_store.save(
+            chat_id, from_id, to_id, key[2], interval_seconds, encode_snapshot(last_snapshot),
+            train_filter.spec if train_filter else None,
+        )
+
+    log.info("Abonelik eklendi (%d abone).", len(subscription['subscribers']), extra={'chat': chat_id, **route_fields(key)})
+
+def unsubscribe_monitor(chat_id: str):
+    """Sohbeti aboneliğinden çıkarır; son abone de ayrılırsa poller görevi iptal edilir."""
+    key = monitor_jobs.pop(chat_id, None)
+    if key is None:
+        return False
+    monitor_filters.pop(chat_id, None)
+    if monitor_store is not None:
+        monitor_store.delete(chat_id)
+    subscription = subscriptions.get(key)
+    if subscription is not None:
+        subscription['subscribers'].pop(chat_id, None)
+        if not subscription['subscribers']:
+            log.info("Son abone ayrıldı, poller durduruluyor.", extra={'chat': chat_id, **route_fields(key)})
+            subscription['task'].cancel()
+            del subscriptions[key]
+    return True
+
+def stations_known(from_id: int, to_id: int) -> bool:
+    """İki istasyon da katalogda mı? Katalog güncellenip istasyon kaldırıldıysa izleme sorgulanamaz."""
+    return catalog.get(from_id) is not None and catalog.get(to_id) is not None
+
+def end_subscription(key: tuple):
+    """
+    Sorgulanamayacak hale gelen (yolculuk tarihi geçmiş ya da istasyonu katalogdan kalkmış) aboneliği
+    sonlandırır: aboneler nedenini bildiren bir mesaj alır, izlemeleri bellekten ve kalıcı kayıttan silinir.
+    Poller görevinin kendisinden, döngüsü bittikten sonra çağrılır.
+    """
+    subscription = subscriptions.pop(key, None)
+    if subscription is None:
+        return
+    from_id, to_id, target_date = key_arguments(key)
+    if stations_known(from_id, to_id):
+        reason = "Yolculuk tarihi geçti"
+        text = f"📅 {route_title(from_id, to_id, target_date)}: yolculuk tarihi geçti, izleme sonlandırıldı."
+    else:
+        reason = "İstasyon katalogda yok"
+        text = (f"⚠️ {route_title(from_id, to_id, target_date)}: istasyonlardan biri artık TCDD istasyon "
+                f"listesinde yok, izleme sonlandırıldı. Güzergahı /monitor ile yeniden seçebilirsiniz.")
+    for chat_id in subscription['subscribers']:
+        if monitor_jobs.get(chat_id) != key:
+            continue
         del monitor_jobs[chat_id]
-        print(f"İzleme işi listeden kaldırıldı ({chat_id}).")
+        monitor_filters.pop(chat_id, None)
+        if monitor_store is not None:
+            monitor_store.delete(chat_id)
+        send_telegram_message(text, chat_id)
+    log.info("%s, abonelik silindi (%d abone).", reason, len(subscription['subscribers']), extra=route_fields(key))
 
-def create_station_keyboard(action: str, from_station: str = None) -> InlineKeyboardMarkup:
-    keyboard = []
-    row = []
-    
-    if from_station:
-        stations_to_show = [s for s in STATION_MAP.keys() if s != from_station]
-        prefix = f"to_{action}_{from_station}"
+def set_monitor_filter(chat_id: str, train_filter) -> bool:
+    """
+    Aktif izlemenin filtresini değiştirir (None: filtreyi kaldırır). Sohbetin son gördüğü durum
+    sıfırlanır; bir sonraki sonuç yeni filtreye göre tam liste olarak gider. İzleme yoksa False.
+    """
+    key = monitor_jobs.get(chat_id)
+    if key is None:
+        return False
+    if train_filter:
+        monitor_filters[chat_id] = train_filter
     else:
-        stations_to_show = list(STATION_MAP.keys())
-        prefix = f"from_{action}"
-        
-    for station_key in stations_to_show:
-        callback_data = f"{prefix}_{station_key}"
-        row.append(InlineKeyboardButton(station_key.capitalize(), callback_data=callback_data))
-        
-        if len(row) == 2:
-            keyboard.append(row)
-            row = []
-    
-    if row:
-        keyboard.append(row)
-        
-    return InlineKeyboardMarkup(keyboard)
+        monitor_filters.pop(chat_id, None)
+    subscriptions[key]['subscribers'][chat_id] = None
+    if monitor_store is not None:
+        monitor_store.save_filters(chat_id, train_filter.spec if train_filter else None)
+        monitor_store.save_snapshot(chat_id, None)
+    return True
 
-def create_date_keyboard(action: str, from_station: str, to_station: str) -> InlineKeyboardMarkup:
-    keyboard = []
-    today = datetime.today()
-    
-    row = []
-    for i in range(0, 13):
-        day = today + timedelta(days=i)
-        date_str_iso = day.strftime("%Y-%m-%d")
-        
-        callback_data = f"date_{action}_{from_station}_{to_station}_{date_str_iso}"
-        
-        if i == 0:
-            day_name = "Bugün"
-        elif i == 1:
-            day_name = "Yarın"
+def encode_snapshot(snapshot: dict):
+    """Snapshot'ı (tuple anahtarlı) kalıcı kayıt için JSON uyumlu satır listesine çevirir."""
+    if snapshot is None:
+        return None
+    return [[train_name, departure, cabin, seats, min_price] for (train_name, departure, cabin), (seats, min_price) in snapshot.items()]
+
+def decode_snapshot(rows: list):
+    if rows is None:
+        return None
+    return {(train_name, departure, cabin): (seats, min_price) for train_name, departure, cabin, seats, min_price in rows}
+
+def diff_snapshots(old_snapshot: dict, new_snapshot: dict):
+    """İki snapshot arasındaki eklenen, tükenen ve değişen vagon satırlarını (kalkışa göre sıralı) döndürür."""
+    changes = []
+    escape = message_rendering.escape
+    for seat_key, (count, price) in new_snapshot.items():
+        cabin = escape(seat_key[2])
+        old = old_snapshot.get(seat_key)
+        if old is None:
+            changes.append((seat_key, f"🆕 <b>{cabin}: {count} adet</b> (min {escape(price)} TRY)"))
+            continue
+        old_count, old_price = old
+        if old_count != count:
+            changes.append((seat_key, f"{'📈' if count > old_count else '📉'} {cabin}: {old_count} ➡ <b>{count} adet</b>"))
+        if old_price != price:
+            changes.append((seat_key, f"💸 {cabin}: min {escape(old_price)} ➡ <b>{escape(price)} TRY</b>"))
+    for seat_key in old_snapshot.keys() - new_snapshot.keys():
+        changes.append((seat_key, f"❌ {escape(seat_key[2])}: tükendi"))
+
+    changes.sort(key=lambda change: (change[0][1], change[0][0]))
+    return changes
+
+def build_monitor_notification(last_snapshot, snapshot: dict, found: bool, message: str, route_str: str):
+    """Bir abone için gönderilecek mesajı döndürür; yeni bilgi yoksa None."""
+    if not last_snapshot:
+        return "🚨 BİLET BULUNDU! 🚨\n\n" + message if found else None
+
+    changes = diff_snapshots(last_snapshot, snapshot)
+    if not changes:
+        return None
+
+    if MONITOR_NOTIFY_MODE == "full":
+        return "🔔 BİLET DURUMU DEĞİŞTİ 🔔\n\n" + message
+
+    lines = [f"🔔 {route_str} değişiklikler:"]
+    last_train = None
+    for (train_name, departure, _), line in changes:
+        if (train_name, departure) != last_train:
+            lines.append(f"\n{message_rendering.train_header(train_name, departure)}")
+            last_train = (train_name, departure)
+        lines.append(f"   {line}")
+    return "\n".join(lines)
+
+def key_arguments(key: tuple):
+    """(from_id, to_id, 'YYYY-MM-DD') anahtarından (from_id, to_id, target_date) üretir."""
+    from_id, to_id, date_iso = key
+    return from_id, to_id, datetime.strptime(date_iso, "%Y-%m-%d")
+
+async def poll_route(key: tuple, from_id: int, to_id: int, target_date: datetime, interval_seconds: int, start_delay: float, publish):
+    """
+    Bir (from_id, to_id, tarih) anahtarını sorgulayan döngü; her sonucu publish(key, (found, message, snapshot))
+    ile bildirir. start_delay None ise ilk sorgu 0..interval_seconds arasında rastgele bir anda atılır.
+    interval_seconds taban aralıktır; her turdaki bekleme poll_policy ile yeniden hesaplanır.
+    Yolculuk günü geçince ya da istasyonlardan biri katalogda yoksa döner (iptal edilmedikçe başka türlü bitmez).
+    """
+    structured_logging.bind_context(**route_fields(key))
+    log.info("API izleme başladı.")
+
+    try:
+        # Aynı dakikada başlayan izlemeler aynı anda sorgu atmasın diye rastgele faz kayması.
+        await asyncio.sleep(random.uniform(0, interval_seconds) if start_delay is None else start_delay)
+        previous_snapshot = None
+        last_change_at = None
+        consecutive_errors = 0
+        while True:
+            if poll_policy.seconds_until_expiry(target_date) <= 0:
+                log.info("Yolculuk tarihi geçti, izleme sonlandırılıyor.")
+                return
+            if not stations_known(from_id, to_id):
+                log.warning("İstasyon katalogda yok, izleme sonlandırılıyor.")
+                return
+            try:
+                # Her tur ayrı bir trace'tir; sonuç işçiden geliyorsa trace kimliği publish ile ana sürece taşınır.
+                with tracing.trace("poll"):
+                    poll_log.debug("API kontrol ediliyor...")
+
+                    # İzlemeler her zaman taze sonuç ister; sonuç /check için önbelleğe de yazılır.
+                    with tracing.span("availability"):
+                        result = await get_availability(from_id, to_id, target_date, max_age=0)
+                    snapshot = result[2]
+
+                    if snapshot is None:
+                        consecutive_errors += 1
+                    else:
+                        consecutive_errors = 0
+                        if previous_snapshot is not None and snapshot != previous_snapshot:
+                            last_change_at = poll_policy.turkey_now()
+                        previous_snapshot = snapshot
+
+                    with tracing.span("deliver"):
+                        publish(key, result)
+            except Exception:
+                # Beklenmeyen bir hata (ayrıştırma, kayıt...) poller'ı öldürmesin; abonelikler kayıtlı kaldıkça
+                # izleme sürmeli. Tur hata sayılır ve bekleme geri çekilmeyle uzar.
+                POLL_ERRORS.inc()
+                consecutive_errors += 1
+                log.exception("İzleme turunda beklenmeyen hata, sonraki turda tekrar denenecek.")
+
+            departures = {departure for _, departure, _ in previous_snapshot or ()}
+            wait_seconds, reasons = poll_policy.next_interval(
+                target_date, departures, last_change_at, consecutive_errors, interval_seconds
+            )
+            poll_log.debug("%.0f saniye bekleniyor (%s)...", wait_seconds, ", ".join(reasons) or "taban aralık")
+            await asyncio.sleep(wait_seconds)
+    finally:
+        log.info("API izleme durdu.")
+
+def deliver_result(key: tuple, result: tuple):
+    """Bir sorgu sonucunu anahtarın tüm abonelerine, her birinin son gördüğü duruma göre bildirir."""
+    found, message, snapshot = result
+    subscription = subscriptions.get(key)
+    # Hata durumunda (snapshot None) son bildirilen durum korunur.
+    if snapshot is None:
+        return
+    # İşçi süreçlerinden gelen sonuçlar bu sürecin önbelleğine (/check aynı sonucu kullanır) ve geçmişine
+    # yazılır (işçiler veritabanı açmaz).
+    if worker_pool is not None:
+        _cache_availability(key, result)
+        if history_store is not None:
+            history_store.record(key, snapshot)
+    if not subscription:
+        return
+
+    from_id, to_id, target_date = key_arguments(key)
+    route_str = route_title(from_id, to_id, target_date)
+    notified = 0
+    # { TrainFilter: (found, message, snapshot) } - aynı filtreyi kullanan aboneler için bir kez hesaplanır
+    filtered_views = {}
+    subscribers = subscription['subscribers']
+    for chat_id, last_snapshot in subscribers.items():
+        train_filter = monitor_filters.get(chat_id)
+        if train_filter is None:
+            view = result
         else:
-            day_name = day.strftime("%A")
-        
-        button_text = f"{day_name.capitalize()} ({day.strftime('%d %b').capitalize()})"
-        row.append(InlineKeyboardButton(button_text, callback_data=callback_data))
-        
-        if len(row) == 2:
-            keyboard.append(row)
-            row = []
-    
-    if row: 
-        keyboard.append(row)
-        
-    return InlineKeyboardMarkup(keyboard)
+            view = filtered_views.get(train_filter)
+            if view is None:
+                view = filtered_views[train_filter] = render_filtered(train_filter, snapshot, route_str)
+        view_found, view_message, view_snapshot = view
+        notification = build_monitor_notification(last_snapshot, view_snapshot, view_found, view_message, route_str)
+        subscribers[chat_id] = view_snapshot
+        if monitor_store is not None and view_snapshot != last_snapshot:
+            monitor_store.save_snapshot(chat_id, encode_snapshot(view_snapshot))
+        if notification:
+            send_telegram_message(notification, chat_id)
+            notified += 1
+    if notified:
+        log.info("Değişiklik bildirildi (%d abone).", notified, extra=route_fields(key))
+        NOTIFICATIONS_SENT.inc(notified)
+
+async def monitoring_loop(key: tuple, from_id: int, to_id: int, target_date: datetime, interval_seconds: int, start_delay: float = None):
+    """Bir (from_id, to_id, tarih) anahtarı için tek poller; sonucu tüm abonelere dağıtır."""
+    await poll_route(key, from_id, to_id, target_date, interval_seconds, start_delay, deliver_result)
+    end_subscription(key)
+
+async def remote_monitoring_loop(key: tuple, interval_seconds: int, start_delay: float = None):
+    """
+    Poller'ı işçi havuzunda çalıştırır; bu görev sadece aboneliğin ömrünü temsil eder ve
+    iptal edildiğinde işçiye durdurma komutu gönderir. Sonuçlar deliver_result'a gelir.
+    """
+    from_id, to_id, target_date = key_arguments(key)
+    # İşçiler kataloğu aynı dosyadan yükler; istasyonu katalogda olmayan anahtar işçiye hiç gönderilmez.
+    if not stations_known(from_id, to_id):
+        end_subscription(key)
+        return
+    worker_pool.assign(key, interval_seconds, start_delay)
+    try:
+        # İşçideki poller yolculuk günü geçince kendiliğinden durur; abonelik burada aynı anda sonlandırılır.
+        await asyncio.sleep(poll_policy.seconds_until_expiry(target_date))
+    finally:
+        worker_pool.release(key)
+    end_subscription(key)
+
+def _cached_keyboard(key: tuple, build) -> InlineKeyboardMarkup:
+    """Klavyeyi önbellekten döndürür; yoksa build() ile kurup ekler. Gün veya katalog sürümü değiştiyse önce önbelleği boşaltır."""
+    generation = (catalog.version, datetime.today().date())
+    if _keyboard_cache_state['generation'] != generation:
+        _keyboard_cache.clear()
+        _keyboard_cache_state['generation'] = generation
+        _keyboard_cache_state['date_labels'] = None
+
+    markup = _keyboard_cache.get(key)
+    if markup is not None:
+        _keyboard_cache.move_to_end(key)
+        KEYBOARD_CACHE_LOOKUPS.inc(result="hit")
+        return markup
+
+    KEYBOARD_CACHE_LOOKUPS.inc(result="miss")
+    markup = build()
+    _keyboard_cache[key] = markup
+    while len(_keyboard_cache) > KEYBOARD_CACHE_SIZE:
+        _keyboard_cache.popitem(last=False)
+    return markup
+
+def _button_rows(buttons: list) -> list:
+    """Butonları ikişerli satırlara böler."""
+    return [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+
+def create_station_keyboard(action: str, from_id: int = None, station_ids: list = None) -> InlineKeyboardMarkup:
+    """Kalkış veya (from_id verilirse) varış istasyonu butonları; varsayılan olarak favoriler."""
+    station_ids = tuple(FAVORITE_STATION_IDS if station_ids is None else station_ids)
+
+    def build():
+        if from_id:
+            stations_to_show = [s for s in station_ids if s != from_id]
+            prefix = f"to_{action}_{from_id}"
+        else:
+            stations_to_show = station_ids
+            prefix = f"from_{action}"
+        return InlineKeyboardMarkup(_button_rows([
+            InlineKeyboardButton(station_label(station_id), callback_data=f"{prefix}_{station_id}")
+            for station_id in stations_to_show
+        ]))
+
+    return _cached_keyboard(('station', action, from_id, station_ids), build)
+
+def _date_labels() -> list:
+    """Bugünden itibaren 13 gün için (YYYY-MM-DD, buton metni) listesi; gün başına bir kez hesaplanır."""
+    if _keyboard_cache_state['date_labels'] is None:
+        today = datetime.today()
+        labels = []
+        for i in range(0, 13):
+            day = today + timedelta(days=i)
+            if i == 0:
+                day_name = "Bugün"
+            elif i == 1:
+                day_name = "Yarın"
+            else:
+                day_name = message_rendering.weekday_name(day)
+            labels.append((day.strftime("%Y-%m-%d"), f"{day_name} ({message_rendering.format_short_date(day)})"))
+        _keyboard_cache_state['date_labels'] = labels
+    return _keyboard_cache_state['date_labels']
+
+def create_date_keyboard(action: str, from_id: int, to_id: int) -> InlineKeyboardMarkup:
+    def build():
+        return InlineKeyboardMarkup(_button_rows([
+            InlineKeyboardButton(button_text, callback_data=f"date_{action}_{from_id}_{to_id}_{date_str_iso}")
+            for date_str_iso, button_text in _date_labels()
+        ]))
+
+    return _cached_keyboard(('date', action, from_id, to_id), build)
 
 async def start(update: Update, context: CallbackContext):
     """/start komutu"""
@@ -364,16 +1230,19 @@ Senin için istediğin seferleri *ışık hızında* kontrol edebilirim.
 • `/check` - Tek seferlik bilet kontrolü için adımları başlatır.
 • `/monitor` - Sürekli bilet takibi için adımları başlatır.
 • `/stop` - Aktif izlemeyi durdurur.
+• `/filtre` - İzleme filtresini gösterir veya ayarlar (saat, sınıf, fiyat, koltuk, tren).
 
 Kalkış, varış ve tarih bilgilerini komutu verdikten sonra seçeceksin.
+Listede olmayan bir istasyon için adının başını yazman yeterli.
     """
     await update.message.reply_text(message, parse_mode='Markdown')
 
 async def check_command(update: Update, context: CallbackContext):
     """/check komutu"""
     keyboard = create_station_keyboard(action="check")
+    context.chat_data['station_step'] = {'action': "check"}
     await update.message.reply_text(
-        "Lütfen *kalkış* istasyonunu seçin:", 
+        "Lütfen *kalkış* istasyonunu seçin (listede yoksa adını yazın):", 
         reply_markup=keyboard,
         parse_mode='Markdown'
     )
@@ -386,8 +1255,9 @@ async def monitor_command(update: Update, context: CallbackContext):
         return
     
     keyboard = create_station_keyboard(action="monitor")
+    context.chat_data['station_step'] = {'action': "monitor"}
     await update.message.reply_text(
-        "Lütfen *kalkış* istasyonunu seçin:", 
+        "Lütfen *kalkış* istasyonunu seçin (listede yoksa adını yazın):", 
         reply_markup=keyboard,
         parse_mode='Markdown'
     )
@@ -396,14 +1266,112 @@ async def stop_command(update: Update, context: CallbackContext):
     """/stop komutu"""
     chat_id = str(update.message.chat_id)
     
-    if chat_id in monitor_jobs:
-        monitor_thread, stop_event = monitor_jobs.pop(chat_id)
-        print(f"Durdurma sinyali gönderiliyor: {chat_id}")
-        stop_event.set()
+    if unsubscribe_monitor(chat_id):
+        log.info("Abonelik iptal edildi.", extra={'chat': chat_id})
         await update.message.reply_text("İzleme durduruluyor... 🛑")
     else:
         await update.message.reply_text("Aktif bir izlemeniz bulunmuyor.")
 
+FILTER_USAGE = (
+    "Kullanım: /filtre saat=06:00-12:00 sinif=ekonomi,business fiyat=800 koltuk=2 tren=YHT\n"
+    "Her anahtar isteğe bağlıdır. Filtreyi kaldırmak için: /filtre sil"
+)
+
+async def filter_command(update: Update, context: CallbackContext):
+    """/filtre komutu: argümansız mevcut filtreyi gösterir, 'sil' kaldırır, aksi halde yeni filtreyi derleyip uygular."""
+    chat_id = str(update.message.chat_id)
+    if not context.args:
+        current = monitor_filters.get(chat_id) or context.chat_data.get('train_filter')
+        description = current.describe() if current else "filtre yok"
+        await update.message.reply_text(f"Filtreniz: {description}\n\n{FILTER_USAGE}")
+        return
+
+    if len(context.args) == 1 and fold(context.args[0]) in ('sil', 'kaldir', 'yok'):
+        train_filter = None
+    else:
+        train_filter, error = train_filters.parse_filter_spec(" ".join(context.args))
+        if error:
+            await update.message.reply_text(f"❌ {error}\n\n{FILTER_USAGE}")
+            return
+
+    # Sonraki /monitor da bu filtreyi kullanır.
+    context.chat_data['train_filter'] = train_filter
+    description = train_filter.describe() if train_filter else "filtre yok"
+    if set_monitor_filter(chat_id, train_filter):
+        await update.message.reply_text(f"Aktif izlemenizin filtresi güncellendi: {description}")
+    else:
+        await update.message.reply_text(f"Filtre kaydedildi ({description}); bir sonraki /monitor izlemesine uygulanacak.")
+
+async def run_profile(seconds: float, chat_id: str = None):
+    """Event loop'u seconds saniye profiller; özet (ve .pstats yolu) chat_id verilmişse oraya gönderilir."""
+    summary, result = await profiling.profile_for(seconds)
+    if summary is None:
+        text = f"⚠️ {result}"
+    else:
+        # Mesaj tek parça gitsin (<pre> bölünemez) diye özetin sadece başlığın yanına sığan başı gönderilir; tamamı dosyada.
+        header = f"📊 Profil kaydedildi: <code>{message_rendering.escape(result)}</code>\n"
+        limit = min(PROFILE_SUMMARY_CHARS, message_rendering.TELEGRAM_MESSAGE_LIMIT - len(header))
+        text = header + message_rendering.preformatted(summary, limit)
+    if chat_id:
+        send_telegram_message(text, chat_id)
+
+def start_profile(seconds: float, chat_id: str = None):
+    """run_profile'ı arka planda başlatır; görev kapanışta shutdown_engine tarafından iptal edilir."""
+    task = asyncio.get_running_loop().create_task(run_profile(seconds, chat_id))
+    profile_tasks.add(task)
+    task.add_done_callback(profile_tasks.discard)
+
+async def profile_command(update: Update, context: CallbackContext):
+    """/profil [saniye]: sadece yönetici (TELEGRAM_CHAT_ID) kullanabilir; profil arka planda alınır."""
+    chat_id = str(update.message.chat_id)
+    if not ADMIN_CHAT_ID or chat_id != ADMIN_CHAT_ID.strip():
+        await update.message.reply_text("Bu komut sadece bot yöneticisi içindir.")
+        return
+    try:
+        seconds = float(context.args[0]) if context.args else profiling.PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        await update.message.reply_text("Kullanım: /profil [saniye]")
+        return
+    if profiling.is_running():
+        await update.message.reply_text("Zaten çalışan bir profil var.")
+        return
+    seconds = min(max(seconds, 1), profiling.PROFILE_MAX_SECONDS)
+    await update.message.reply_text(f"⏱ {seconds:.0f} saniyelik profil başladı; bitince özet gönderilecek.")
+    start_profile(seconds, chat_id)
+
+async def worker_command(update: Update, context: CallbackContext):
+    """/isci [sayı]: sadece yönetici; işçi sayısını gösterir ya da değiştirir (sadece sahibi değişen izlemeler taşınır)."""
+    chat_id = str(update.message.chat_id)
+    if not ADMIN_CHAT_ID or chat_id != ADMIN_CHAT_ID.strip():
+        await update.message.reply_text("Bu komut sadece bot yöneticisi içindir.")
+        return
+    if worker_pool is None:
+        await update.message.reply_text("İşçi modu kapalı (WORKER_PROCESSES=0).")
+        return
+    if context.args:
+        try:
+            size = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("Kullanım: /isci [sayı]")
+            return
+        await worker_pool.resize(size)
+    await update.message.reply_text(f"⚙️ {worker_pool.size} işçi, {len(worker_pool.keys)} izlenen güzergah.")
+
+async def station_search(update: Update, context: CallbackContext):
+    """İstasyon seçimi sırasında yazılan metni katalogda önek olarak arar ve eşleşenleri buton olarak sunar."""
+    step = context.chat_data.get('station_step')
+    if not step:
+        return
+
+    matches = catalog.search(update.message.text, limit=STATION_SEARCH_LIMIT)
+    matches = [station['id'] for station in matches if station['id'] != step.get('from_id')]
+    if not matches:
+        await update.message.reply_text("Bu isimle başlayan bir istasyon bulunamadı. Tekrar deneyin.")
+        return
+
+    keyboard = create_station_keyboard(action=step['action'], from_id=step.get('from_id'), station_ids=matches)
+    await update.message.reply_text("Eşleşen istasyonlar:", reply_markup=keyboard)
+
 async def button_callback(update: Update, context: CallbackContext):
     """Tüm inline butonlara basıldığında tetiklenir."""
     query = update.callback_query
@@ -417,80 +1385,177 @@ async def button_callback(update: Update, context: CallbackContext):
 
         if prefix == 'from':
             action = parts[1]
-            from_station_key = parts[2]
+            from_id = int(parts[2])
             
-            keyboard = create_station_keyboard(action=action, from_station=from_station_key)
+            keyboard = create_station_keyboard(action=action, from_id=from_id)
+            context.chat_data['station_step'] = {'action': action, 'from_id': from_id}
             await query.edit_message_text(
-                text=f"Kalkış: *{from_station_key.capitalize()}*\n\nŞimdi *varış* istasyonunu seçin:",
+                text=f"Kalkış: {message_rendering.bold(station_label(from_id))}\n\nŞimdi <b>varış</b> istasyonunu seçin (listede yoksa adını yazın):",
                 reply_markup=keyboard,
-                parse_mode='Markdown'
+                parse_mode='HTML'
             )
         
         elif prefix == 'to':
             action = parts[1]
-            from_station_key = parts[2]
-            to_station_key = parts[3]
+            from_id = int(parts[2])
+            to_id = int(parts[3])
             
-            keyboard = create_date_keyboard(action=action, from_station=from_station_key, to_station=to_station_key)
+            keyboard = create_date_keyboard(action=action, from_id=from_id, to_id=to_id)
+            context.chat_data.pop('station_step', None)
             await query.edit_message_text(
-                text=f"Kalkış: *{from_station_key.capitalize()}*\nVarış: *{to_station_key.capitalize()}*\n\nLütfen bir *tarih* seçin:",
+                text=f"Kalkış: {message_rendering.bold(station_label(from_id))}\nVarış: {message_rendering.bold(station_label(to_id))}\n\nLütfen bir <b>tarih</b> seçin:",
                 reply_markup=keyboard,
-                parse_mode='Markdown'
+                parse_mode='HTML'
             )
             
         elif prefix == 'date':
             action = parts[1]
-            from_station_key = parts[2]
-            to_station_key = parts[3]
+            from_id = int(parts[2])
+            to_id = int(parts[3])
             date_iso_str = parts[4]
             target_date = datetime.strptime(date_iso_str, "%Y-%m-%d")
             
-            date_tr_str = target_date.strftime("%d %B %Y")
             await query.edit_message_text(
-                text=f"Seçimleriniz:\n🚆 *{from_station_key.capitalize()}* ➡ *{to_station_key.capitalize()}*\n🗓 *{date_tr_str}*\n\nAPI sorgulanıyor, lütfen bekleyin...", 
-                parse_mode='Markdown'
+                text=f"Seçimleriniz:\n🚆 {message_rendering.bold(station_label(from_id))} ➡ {message_rendering.bold(station_label(to_id))}\n🗓 <b>{message_rendering.format_date(target_date)}</b>\n\nAPI sorgulanıyor, lütfen bekleyin...",
+                parse_mode='HTML'
             )
 
             if action == "check":
-                print(f"Callback -> check_api_once: {chat_id}, {from_station_key}, {to_station_key}, {target_date}")
-                threading.Thread(
-                    target=run_one_time_check,
-                    args=(chat_id, from_station_key, to_station_key, target_date)
-                ).start()
+                log.info("Callback -> tek seferlik kontrol.", extra={'chat': chat_id, **route_fields(subscription_key(from_id, to_id, target_date))})
+                context.application.create_task(
+                    run_one_time_check(chat_id, from_id, to_id, target_date)
+                )
             
             elif action == "monitor":
                 if chat_id in monitor_jobs:
                     await query.message.reply_text("Zaten aktif bir izlemeniz var. /stop")
                     return
 
-                print(f"Callback -> monitor_api_loop: {chat_id}, {from_station_key}, {to_station_key}, {target_date}")
-                check_interval = 30
-                stop_event = threading.Event()
-                monitor_thread = threading.Thread(
-                    target=monitoring_loop,
-                    args=(chat_id, stop_event, from_station_key, to_station_key, target_date, check_interval)
+                log.info("Callback -> izleme.", extra={'chat': chat_id, **route_fields(subscription_key(from_id, to_id, target_date))})
+                check_interval = poll_policy.POLL_BASE_INTERVAL_SECONDS
+                train_filter = context.chat_data.get('train_filter')
+                subscribe_monitor(chat_id, from_id, to_id, target_date, check_interval, train_filter=train_filter)
+                send_telegram_message(
+                    f"Takip başladı: <b>{message_rendering.escape(station_label(from_id))} ➡ {message_rendering.escape(station_label(to_id))}</b> | {message_rendering.format_date(target_date, with_year=False)}. "
+                    f"Kontrol aralığı kalkışa yakınlığa ve hareketliliğe göre {poll_policy.POLL_MIN_INTERVAL_SECONDS:.0f}-{poll_policy.POLL_MAX_INTERVAL_SECONDS:.0f} saniye arasında ayarlanacak. Boş yer bulunca ve sonra sadece değişiklik olunca haber vereceğim. 🤫"
+                    + (f"\nFiltre: {message_rendering.escape(train_filter.describe())}" if train_filter else ""),
+                    chat_id
                 )
-                
-                monitor_jobs[chat_id] = (monitor_thread, stop_event)
-                monitor_thread.start()
 
     except Exception as e:
-        print(f"Callback hatası: {e}")
+        log.exception("Callback hatası: %s", e, extra={'chat': chat_id})
         await query.message.reply_text(f"Buton işlemi sırasında bir hata oluştu: {e}")
 
+async def startup_engine(application: Application):
+    """Bot başlarken giden mesaj kuyruğunu ve (ayarlıysa) işçi havuzunu başlatır, kayıtlı izlemeleri geri yükler."""
+    global worker_pool
+    telegram_outbox.start()
+    if WORKER_PROCESSES > 0:
+        # Poller'lar işçilerde; bu süreç sadece /check sorgularını yapar ve bütçenin kendi payıyla sınırlanır.
+        set_limiter_share(WORKER_FRONT_RATE_SHARE)
+        worker_pool = WorkerPool(WORKER_PROCESSES, deliver_result)
+        worker_pool.start()
+    # kill -USR1 <pid>: /profil ile aynı, varsayılan süreyle; özet yöneticiye gönderilir.
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1, lambda: start_profile(profiling.PROFILE_DEFAULT_SECONDS, ADMIN_CHAT_ID)
+        )
+    except (AttributeError, NotImplementedError):
+        # Windows'ta SIGUSR1 ve loop sinyal handler'ları yok; sadece /profil kullanılabilir.
+        pass
+    await restore_monitors(application)
+
+async def restore_monitors(application: Application):
+    """
+    Kayıtlı izlemeleri tek sorguda okuyup yeniden abone eder. Tarihi geçmiş olanlar silinir.
+    Poller'ların ilk sorguları MONITOR_RESTORE_SPREAD_SECONDS'a eşit aralıklarla yayılır.
+    """
+    rows = await asyncio.to_thread(monitor_store.load_all)
+    today = datetime.today().strftime("%Y-%m-%d")
+    active_rows = []
+    for row in rows:
+        if row['target_date'] < today:
+            monitor_store.delete(row['chat_id'])
+        else:
+            active_rows.append(row)
+
+    keys = sorted({(row['from_station'], row['to_station'], row['target_date']) for row in active_rows})
+    delays = dict(zip(keys, restore_delays(len(keys))))
+    for row in active_rows:
+        try:
+            from_id, to_id = int(row['from_station']), int(row['to_station'])
+            target_date = datetime.strptime(row['target_date'], "%Y-%m-%d")
+            subscribe_monitor(
+                row['chat_id'], from_id, to_id, target_date, row['interval_seconds'],
+                last_snapshot=decode_snapshot(row['last_snapshot']),
+                start_delay=delays[(row['from_station'], row['to_station'], row['target_date'])],
+                persist=False,
+                train_filter=train_filters.load_filter(row['filters']),
+            )
+        except (ValueError, TypeError) as e:
+            log.warning("İzleme kaydı geri yüklenemedi: %s", e, extra={'chat': row['chat_id']})
+            monitor_store.delete(row['chat_id'])
+    if active_rows:
+        log.info("%d izleme geri yüklendi (%d poller).", len(active_rows), len(keys))
+
+async def shutdown_engine(application: Application):
+    """Bot kapanırken izleme ve profil görevlerini iptal eder, izleme kaydını ve giden kuyruğu boşaltır, HTTP havuzlarını kapatır."""
+    for task in profile_tasks:
+        task.cancel()
+    await asyncio.gather(*profile_tasks, return_exceptions=True)
+    for subscription in subscriptions.values():
+        subscription['task'].cancel()
+    await asyncio.gather(*(s['task'] for s in subscriptions.values()), return_exceptions=True)
+    # Kapanış bir /stop değildir; kayıtlar silinmez, sadece bellekteki tablolar temizlenir.
+    subscriptions.clear()
+    monitor_jobs.clear()
+    if worker_pool is not None:
+        await worker_pool.close()
+    if monitor_store is not None:
+        await asyncio.to_thread(monitor_store.close)
+    if history_store is not None:
+        await asyncio.to_thread(history_store.close)
+    await telegram_outbox.close()
+    for client in (ebilet_client, tcdd_api_client, telegram_client):
+        await client.aclose()
+
+def load_catalog():
+    """İstasyon kataloğunu yükler (favoriler her zaman dahil); işçi süreçler de bunu çağırır."""
+    global catalog
+    catalog = load_station_catalog({station['id']: station['fullName'] for station in STATION_MAP.values()})
+
 def main():
-    builder = Application.builder().token(TELEGRAM_API_TOKEN)
+    global monitor_store, history_store
+    structured_logging.setup_logging()
+    load_catalog()
+    metrics.start_metrics_server()
+    monitor_store = MonitorStore(MONITOR_STORE_PATH)
+    monitor_store.start()
+    if AVAILABILITY_HISTORY_PATH:
+        history_store = AvailabilityHistory(AVAILABILITY_HISTORY_PATH)
+        history_store.start()
+
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_API_TOKEN)
+        .post_init(startup_engine)
+        .post_shutdown(shutdown_engine)
+    )
     app = builder.build()
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("check", check_command))
     app.add_handler(CommandHandler("monitor", monitor_command))
     app.add_handler(CommandHandler("stop", stop_command))
+    app.add_handler(CommandHandler("filtre", filter_command))
+    app.add_handler(CommandHandler("profil", profile_command))
+    app.add_handler(CommandHandler("isci", worker_command))
     
     app.add_handler(CallbackQueryHandler(button_callback, pattern='^(from_|to_|date_)'))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, station_search))
 
-    print("API Tabanlı Bot başlatıldı...")
-    app.run_polling()
+    log.info("API Tabanlı Bot başlatıldı...")
+    run_application(app)
 
 if __name__ == "__main__":
     main()            
\ No newline at end of file
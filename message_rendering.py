@@ -0,0 +1,112 @@
+import html
+
+# --- MESAJ BİÇİMLENDİRME ---
+# Telegram'a HTML olarak giden mesajlar buradaki yardımcılarla kurulur. Mesaja giren her dış değer
+# (istasyon, tren ve vagon adları, hata metinleri, filtre tanımları) escape edilir; böylece mesaj ilk
+# gönderimde geçerlidir ve düz metin olarak yeniden gönderilmesi gerekmez. Etiketler bir satırın içinde
+# açılıp kapanır, bu yüzden uzun mesajlar satır sonlarından (öncelikle trenler arasındaki boş satırlardan)
+# güvenle bölünebilir. Tek istisna çok satırlı <pre> bloğudur; preformatted() onu verilen sınıra sığacak
+# şekilde kırptığından bu bloğu içeren mesaj hiç bölünmez.
+# Türkçe ay ve gün adları sabit tablolardan gelir; locale.setlocale süreç genelidir ve thread-safe değildir.
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+TURKISH_MONTHS = ("Ocak", "Şubat", "Mart", "Nisan", "Mayıs", "Haziran",
+                  "Temmuz", "Ağustos", "Eylül", "Ekim", "Kasım", "Aralık")
+TURKISH_MONTHS_SHORT = ("Oca", "Şub", "Mar", "Nis", "May", "Haz", "Tem", "Ağu", "Eyl", "Eki", "Kas", "Ara")
+TURKISH_WEEKDAYS = ("Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma", "Cumartesi", "Pazar")
+
+
+def escape(value) -> str:
+    """Değeri HTML metni olarak güvenli hale getirir (&, <, >)."""
+    return html.escape(str(value), quote=False)
+
+
+def bold(value) -> str:
+    return f"<b>{escape(value)}</b>"
+
+
+def format_date(day, with_year: bool = True) -> str:
+    """'05 Ekim 2026' (with_year False ise '05 Ekim')."""
+    text = f"{day.day:02d} {TURKISH_MONTHS[day.month - 1]}"
+    return f"{text} {day.year}" if with_year else text
+
+
+def format_short_date(day) -> str:
+    """'05 Eki' - tarih butonları için."""
+    return f"{day.day:02d} {TURKISH_MONTHS_SHORT[day.month - 1]}"
+
+
+def weekday_name(day) -> str:
+    return TURKISH_WEEKDAYS[day.weekday()]
+
+
+def route_title(from_label: str, to_label: str, day) -> str:
+    """'<b>Kalkış ➡ Varış</b> | <b>05 Ekim 2026</b>'"""
+    return f"<b>{escape(from_label)} ➡ {escape(to_label)}</b> | <b>{format_date(day)}</b>"
+
+
+def train_header(train_name: str, departure: str) -> str:
+    return f"<b>{escape(train_name)} (Kalkış: {escape(departure)})</b>:"
+
+
+def cabin_line(cabin_name: str, seats: int, min_price) -> str:
+    return f"   ✅ <b>{escape(cabin_name)}: {seats} adet</b> (min {escape(min_price)} TRY)"
+
+
+def preformatted(text: str, limit: int) -> str:
+    """
+    Metni <pre> bloğu olarak döndürür; sonuç (etiketler dahil) limit'i aşacaksa sondaki satırlar atılır.
+    Blok birden fazla satıra yayıldığı için split_message onu bölemez: limit, mesajın geri kalanıyla
+    birlikte Telegram sınırına sığacak şekilde seçilmelidir.
+    """
+    budget = limit - len("<pre></pre>")
+    lines = []
+    size = 0
+    for line in text.splitlines():
+        line = escape(line)
+        if size + len(line) + 1 > budget:
+            break
+        lines.append(line)
+        size += len(line) + 1
+    return "<pre>" + "\n".join(lines) + "</pre>"
+
+
+def _pieces(text: str, separator: str) -> list:
+    """Metni separator'dan böler; ayırıcı sonraki parçanın başında kalır, böylece parçalar art arda eklenince metin aynen oluşur."""
+    parts = text.split(separator)
+    return [parts[0]] + [separator + part for part in parts[1:]]
+
+
+def _blocks(text: str, limit: int) -> list:
+    """Limit'i aşmayan parçalar: önce tren blokları (boş satır), sığmayanlar satır satır, o da sığmazsa sabit uzunlukta."""
+    blocks = []
+    for block in _pieces(text, "\n\n"):
+        if len(block) <= limit:
+            blocks.append(block)
+            continue
+        for line in _pieces(block, "\n"):
+            if len(line) <= limit:
+                blocks.append(line)
+            else:
+                blocks.extend(line[i:i + limit] for i in range(0, len(line), limit))
+    return blocks
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list:
+    """
+    Mesajı Telegram sınırını aşmayan parçalara böler. Bölme tren blokları arasından yapılır; tek bir
+    tren bloğu sınırı aşıyorsa satır aralarından. Sınırın altındaki mesaj olduğu gibi döner.
+    """
+    if len(text) <= limit:
+        return [text]
+    chunks = []
+    current = ""
+    for block in _blocks(text, limit):
+        if current and len(current) + len(block) > limit:
+            chunks.append(current)
+            current = block.lstrip("\n")
+        else:
+            current += block
+    if current:
+        chunks.append(current)
+    return chunks
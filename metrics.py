@@ -0,0 +1,198 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+# --- METRİKLER ---
+# Prometheus metin formatında sayaç, gösterge ve histogramlar. Ek bağımlılık gerektirmez;
+# değerler bir kilitle korunduğu için hem event loop'tan hem de thread'lerden güncellenebilir.
+# METRICS_PORT boş veya 0 ise HTTP uç noktası başlatılmaz.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108") or 0)
+
+# Saniye cinsinden varsayılan histogram sınırları (Telegram ve TCDD çağrıları için)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{name}="{_escape_label_value(str(value))}"' for name, value in labels)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with _lock:
+            values = list(self._values.items()) or [((), 0)]
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Gauge:
+    """callback verilirse değer her okumada ondan alınır (örn. lambda: len(monitor_jobs))."""
+
+    def __init__(self, name: str, documentation: str, callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self._value = 0
+        _registry.append(self)
+
+    def set(self, value: float):
+        with _lock:
+            self._value = value
+
+    def inc(self, amount: float = 1):
+        with _lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        if self.callback is not None:
+            value = self.callback()
+        else:
+            with _lock:
+                value = self._value
+        yield f"{self.name} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        _registry.append(self)
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        """with bloğunun süresini kaydeder; blok içinde await kullanılabilir."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with _lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{le="{bound}"}} {cumulative}'
+        cumulative += counts[-1]
+        yield f'{self.name}_bucket{{le="+Inf"}} {cumulative}'
+        yield f"{self.name}_sum {total_sum}"
+        yield f"{self.name}_count {cumulative}"
+
+
+def drain() -> dict:
+    """
+    Sayaç ve histogramların son drain()'den beri biriken değerlerini döndürür ve sıfırlar. İşçi süreçler
+    bunları sonuç kuyruğuyla ana sürece yollar, ana süreç merge() ile kendi metriklerine ekler.
+    Göstergeler süreç yereldir, dahil edilmez.
+    """
+    state = {}
+    with _lock:
+        for metric in _registry:
+            if isinstance(metric, Counter) and metric._values:
+                state[metric.name] = ('counter', metric._values)
+                metric._values = {}
+            elif isinstance(metric, Histogram) and any(metric._counts):
+                state[metric.name] = ('histogram', (metric._counts, metric._sum))
+                metric._counts = [0] * len(metric._counts)
+                metric._sum = 0.0
+    return state
+
+
+def merge(state: dict):
+    """Başka bir süreçten gelen drain() çıktısını aynı adlı metriklere ekler; bilinmeyen adlar atlanır."""
+    by_name = {metric.name: metric for metric in _registry}
+    with _lock:
+        for name, (kind, values) in state.items():
+            metric = by_name.get(name)
+            if kind == 'counter' and isinstance(metric, Counter):
+                for labels, value in values.items():
+                    metric._values[labels] = metric._values.get(labels, 0) + value
+            elif kind == 'histogram' and isinstance(metric, Histogram) and len(values[0]) == len(metric._counts):
+                counts, total_sum = values
+                metric._counts = [own + other for own, other in zip(metric._counts, counts)]
+                metric._sum += total_sum
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """/metrics uç noktasını arka plan thread'inde başlatır; port 0 ise hiçbir şey yapmaz."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        log.error("Metrik sunucusu başlatılamadı (%s:%d): %s", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    log.info("Metrikler http://%s:%d/metrics adresinde yayınlanıyor.", host, port)
+    return server
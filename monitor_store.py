@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# --- KALICI İZLEME KAYDI ---
+# Aktif izlemeler (sohbet, güzergah, tarih, aralık, son bildirilen durum) SQLite'a (WAL modunda)
+# yazılır; bot yeniden başladığında buradan geri yüklenir. Yazmalar bellekte biriktirilir ve
+# arka plandaki bir thread tarafından tek transaction'da diske aktarılır, event loop beklemez.
+MONITOR_STORE_FLUSH_SECONDS = float(os.getenv("MONITOR_STORE_FLUSH_SECONDS", "2"))
+# Yeniden başlatmada geri yüklenen izlemelerin ilk sorguları bu süreye yayılır.
+MONITOR_RESTORE_SPREAD_SECONDS = float(os.getenv("MONITOR_RESTORE_SPREAD_SECONDS", "30"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS monitors (
+    chat_id TEXT PRIMARY KEY,
+    from_station TEXT NOT NULL,
+    to_station TEXT NOT NULL,
+    target_date TEXT NOT NULL,
+    interval_seconds INTEGER NOT NULL,
+    last_snapshot TEXT,
+    updated_at REAL NOT NULL,
+    filters TEXT
+)
+"""
+
+_UPSERT = """
+INSERT INTO monitors (chat_id, from_station, to_station, target_date, interval_seconds, last_snapshot, updated_at, filters)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(chat_id) DO UPDATE SET
+    from_station = excluded.from_station,
+    to_station = excluded.to_station,
+    target_date = excluded.target_date,
+    interval_seconds = excluded.interval_seconds,
+    last_snapshot = excluded.last_snapshot,
+    updated_at = excluded.updated_at,
+    filters = excluded.filters
+"""
+
+# Kayıt oluşturulduktan sonra tek başına güncellenebilen JSON sütunları
+_UPDATABLE_COLUMNS = ('last_snapshot', 'filters')
+
+
+class MonitorStore:
+    """
+    chat_id başına tek izleme kaydı. save/save_snapshot/save_filters/delete sadece bellekteki bekleyen
+    değişiklikleri günceller (aynı sohbete ait ardışık yazmalar birleşir); flush() bunları
+    diske yazar. İstasyonlar metin olarak saklanır (V2 istasyon adı, V3 istasyon id'si).
+    """
+
+    def __init__(self, path: str, flush_seconds: float = MONITOR_STORE_FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+        self._db_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending_rows = {}  # { chat_id: satır tuple'ı veya silme için None }
+        self._pending_fields = {}  # { chat_id: { sütun: JSON metni } }
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Bekleyen yazmaları periyodik olarak diske aktaran arka plan thread'ini başlatır."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="monitor-store", daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                log.error("İzleme kaydı diske yazılamadı: %s", e)
+
+    def close(self):
+        """Thread'i durdurur, kalan yazmaları aktarır ve veritabanını kapatır."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    def load_all(self):
+        """Kayıtlı tüm izlemeleri sözlük listesi olarak döndürür (last_snapshot JSON'dan çözülmüş)."""
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT chat_id, from_station, to_station, target_date, interval_seconds, last_snapshot, filters FROM monitors"
+            ).fetchall()
+        monitors = []
+        for chat_id, from_station, to_station, target_date, interval_seconds, last_snapshot, filters in rows:
+            monitors.append({
+                'chat_id': chat_id,
+                'from_station': from_station,
+                'to_station': to_station,
+                'target_date': target_date,
+                'interval_seconds': interval_seconds,
+                'last_snapshot': json.loads(last_snapshot) if last_snapshot else None,
+                'filters': json.loads(filters) if filters else None,
+            })
+        return monitors
+
+    def save(self, chat_id: str, from_station, to_station, target_date: str, interval_seconds: int, last_snapshot=None, filters=None):
+        row = (
+            str(chat_id), str(from_station), str(to_station), target_date, int(interval_seconds),
+            _encode(last_snapshot), time.time(), _encode(filters),
+        )
+        with self._pending_lock:
+            self._pending_rows[str(chat_id)] = row
+            self._pending_fields.pop(str(chat_id), None)
+
+    def _save_field(self, chat_id: str, column: str, value):
+        with self._pending_lock:
+            self._pending_fields.setdefault(str(chat_id), {})[column] = _encode(value)
+
+    def save_snapshot(self, chat_id: str, last_snapshot):
+        """Sadece son bildirilen durumu günceller; kaydı olmayan sohbet için etkisizdir."""
+        self._save_field(chat_id, 'last_snapshot', last_snapshot)
+
+    def save_filters(self, chat_id: str, filters):
+        """Sadece izlemenin filtre tanımını günceller; kaydı olmayan sohbet için etkisizdir."""
+        self._save_field(chat_id, 'filters', filters)
+
+    def delete(self, chat_id: str):
+        with self._pending_lock:
+            self._pending_rows[str(chat_id)] = None
+            self._pending_fields.pop(str(chat_id), None)
+
+    def flush(self):
+        with self._pending_lock:
+            rows, self._pending_rows = self._pending_rows, {}
+            fields, self._pending_fields = self._pending_fields, {}
+        if not rows and not fields:
+            return
+
+        now = time.time()
+        deletes = [(chat_id,) for chat_id, row in rows.items() if row is None]
+        upserts = [row for row in rows.values() if row is not None]
+        field_updates = {
+            column: [(values[column], now, chat_id) for chat_id, values in fields.items() if column in values]
+            for column in _UPDATABLE_COLUMNS
+        }
+        try:
+            with self._db_lock, self._db:
+                if deletes:
+                    self._db.executemany("DELETE FROM monitors WHERE chat_id = ?", deletes)
+                if upserts:
+                    self._db.executemany(_UPSERT, upserts)
+                for column, updates in field_updates.items():
+                    if updates:
+                        self._db.executemany(
+                            f"UPDATE monitors SET {column} = ?, updated_at = ? WHERE chat_id = ?", updates
+                        )
+        except sqlite3.Error:
+            # Yazılamayanlar, bu arada gelen daha yeni değişiklikleri ezmeden kuyruğa geri konur.
+            with self._pending_lock:
+                for chat_id, row in rows.items():
+                    self._pending_rows.setdefault(chat_id, row)
+                for chat_id, values in fields.items():
+                    if chat_id not in self._pending_rows:
+                        pending = self._pending_fields.setdefault(chat_id, {})
+                        for column, encoded in values.items():
+                            pending.setdefault(column, encoded)
+            raise
+
+
+def _encode(value):
+    return json.dumps(value, ensure_ascii=False) if value is not None else None
+
+
+def restore_delays(count: int, spread_seconds: float = MONITOR_RESTORE_SPREAD_SECONDS):
+    """count adet geri yüklenen iş için 0..spread_seconds arasına eşit aralıklı başlangıç gecikmeleri."""
+    if count <= 0:
+        return []
+    step = spread_seconds / count
+    return [i * step for i in range(count)]
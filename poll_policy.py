@@ -0,0 +1,123 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import metrics
+from availability_parser import TURKEY_UTC_OFFSET_MINUTES
+
+# --- UYARLANABİLİR SORGU ARALIĞI ---
+# Her izleme turundan sonra bir sonraki sorguya kadar beklenecek süre taban aralıktan başlanarak
+# hesaplanır: kalkışa uzak tarihler ve gece saatleri seyrek, yakın kalkışlar ve yeni değişiklik
+# görülen seferler sık sorgulanır; art arda hatalarda süre katlanarak uzar. Sonuç [min, max] aralığına
+# sıkıştırılır. Tüm katsayılar ortam değişkenleriyle ayarlanabilir.
+POLL_BASE_INTERVAL_SECONDS = float(os.getenv("POLL_BASE_INTERVAL_SECONDS", "30"))
+POLL_MIN_INTERVAL_SECONDS = float(os.getenv("POLL_MIN_INTERVAL_SECONDS", "15"))
+POLL_MAX_INTERVAL_SECONDS = float(os.getenv("POLL_MAX_INTERVAL_SECONDS", "600"))
+
+# Kalkışa bu kadar saat veya daha az kaldıysa NEAR, bu kadar saat veya daha fazla varsa FAR katsayısı uygulanır.
+POLL_NEAR_DEPARTURE_HOURS = float(os.getenv("POLL_NEAR_DEPARTURE_HOURS", "6"))
+POLL_NEAR_DEPARTURE_FACTOR = float(os.getenv("POLL_NEAR_DEPARTURE_FACTOR", "0.5"))
+POLL_FAR_DEPARTURE_HOURS = float(os.getenv("POLL_FAR_DEPARTURE_HOURS", "72"))
+POLL_FAR_DEPARTURE_FACTOR = float(os.getenv("POLL_FAR_DEPARTURE_FACTOR", "4"))
+
+# Türkiye saatiyle sessiz saatler "başlangıç-bitiş" (bitiş hariç); yakın kalkışlarda uygulanmaz.
+POLL_QUIET_HOURS = os.getenv("POLL_QUIET_HOURS", "1-6")
+POLL_QUIET_FACTOR = float(os.getenv("POLL_QUIET_FACTOR", "4"))
+
+# Son değişiklikten sonraki bu süre boyunca sorgular sıklaşır.
+POLL_RECENT_CHANGE_SECONDS = float(os.getenv("POLL_RECENT_CHANGE_SECONDS", "900"))
+POLL_RECENT_CHANGE_FACTOR = float(os.getenv("POLL_RECENT_CHANGE_FACTOR", "0.5"))
+
+# Art arda her hatada aralık bu katsayıyla çarpılır (üst sınır POLL_MAX_INTERVAL_SECONDS).
+POLL_ERROR_BACKOFF_FACTOR = float(os.getenv("POLL_ERROR_BACKOFF_FACTOR", "2"))
+
+POLL_INTERVAL_SECONDS = metrics.Histogram(
+    "monitor_poll_interval_seconds", "İzlemeler için seçilen bir sonraki sorgu aralığı",
+    buckets=(10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600, 1200),
+)
+POLL_INTERVAL_REASONS = metrics.Counter("monitor_poll_interval_reasons_total", "Aralık seçiminde uygulanan kurallar (reason)")
+
+
+def _parse_quiet_hours(value: str):
+    try:
+        start, end = (int(part) for part in value.split("-", 1))
+        return start % 24, end % 24
+    except ValueError:
+        return None
+
+
+_QUIET_HOURS = _parse_quiet_hours(POLL_QUIET_HOURS)
+
+
+def turkey_now() -> datetime:
+    """Sunucunun saat diliminden bağımsız olarak Türkiye saatini (naive) döndürür."""
+    return datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=TURKEY_UTC_OFFSET_MINUTES)
+
+
+def is_quiet_hour(hour: int) -> bool:
+    if _QUIET_HOURS is None:
+        return False
+    start, end = _QUIET_HOURS
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def seconds_until_expiry(target_date: datetime, now: datetime = None) -> float:
+    """Yolculuk gününün bitmesine (Türkiye saatiyle ertesi gün 00:00) kalan saniye; gün geçtiyse 0."""
+    now = now or turkey_now()
+    expires_at = target_date.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return max(0.0, (expires_at - now).total_seconds())
+
+
+def next_departure(target_date: datetime, departures, now: datetime):
+    """
+    target_date günündeki 'SS:DD' kalkışlarından henüz geçmemiş en yakınını döndürür. Bilinen
+    kalkış yoksa günün başlangıcı (geçmişse şimdiki zaman) kullanılır.
+    """
+    upcoming = []
+    for departure in departures:
+        hour, minute = departure.split(":")
+        moment = target_date.replace(hour=int(hour), minute=int(minute), second=0, microsecond=0)
+        if moment >= now:
+            upcoming.append(moment)
+    if upcoming:
+        return min(upcoming)
+    return max(target_date.replace(hour=0, minute=0, second=0, microsecond=0), now)
+
+
+def next_interval(target_date: datetime, departures=(), last_change_at: datetime = None,
+                  consecutive_errors: int = 0, base_seconds: float = POLL_BASE_INTERVAL_SECONDS, now: datetime = None):
+    """
+    Bir sonraki sorguya kadar beklenecek saniyeyi ve uygulanan kuralları döndürür: (saniye, [neden, ...]).
+    now ve last_change_at Türkiye saatiyle naive datetime'dır.
+    """
+    now = now or turkey_now()
+    interval = base_seconds
+    reasons = []
+
+    hours_to_departure = (next_departure(target_date, departures, now) - now).total_seconds() / 3600
+    near_departure = hours_to_departure <= POLL_NEAR_DEPARTURE_HOURS
+    if near_departure:
+        interval *= POLL_NEAR_DEPARTURE_FACTOR
+        reasons.append("near_departure")
+    elif hours_to_departure >= POLL_FAR_DEPARTURE_HOURS:
+        interval *= POLL_FAR_DEPARTURE_FACTOR
+        reasons.append("far_departure")
+
+    if not near_departure and is_quiet_hour(now.hour):
+        interval *= POLL_QUIET_FACTOR
+        reasons.append("quiet_hours")
+
+    if last_change_at is not None and (now - last_change_at).total_seconds() <= POLL_RECENT_CHANGE_SECONDS:
+        interval *= POLL_RECENT_CHANGE_FACTOR
+        reasons.append("recent_change")
+
+    if consecutive_errors:
+        interval *= POLL_ERROR_BACKOFF_FACTOR ** min(consecutive_errors, 16)
+        reasons.append("error_backoff")
+
+    interval = min(max(interval, POLL_MIN_INTERVAL_SECONDS), POLL_MAX_INTERVAL_SECONDS)
+    POLL_INTERVAL_SECONDS.observe(interval)
+    for reason in reasons:
+        POLL_INTERVAL_REASONS.inc(reason=reason)
+    return interval, reasons
@@ -0,0 +1,56 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+
+log = logging.getLogger(__name__)
+
+# --- İSTEĞE BAĞLI PROFİL ---
+# Yönetici komutu (/profil) veya SIGUSR1 ile event loop thread'inde belirli bir süre cProfile çalıştırılır;
+# sonuç .pstats dosyası olarak PROFILE_DIR'e yazılır ve kümülatif süreye göre en pahalı fonksiyonların
+# özeti döndürülür. Aynı anda tek profil çalışabilir. İşçi süreçler bu profile dahil değildir.
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".")
+PROFILE_DEFAULT_SECONDS = float(os.getenv("PROFILE_DEFAULT_SECONDS", "30"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "25"))
+
+_state = {'running': False}
+
+
+def is_running() -> bool:
+    return _state['running']
+
+
+def _write_stats(profiler: cProfile.Profile, top: int):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.pstats")
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.dump_stats(path)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(top)
+    return stream.getvalue(), path
+
+
+async def profile_for(seconds: float = PROFILE_DEFAULT_SECONDS, top: int = PROFILE_TOP_FUNCTIONS):
+    """
+    Event loop thread'inde seconds saniye (en fazla PROFILE_MAX_SECONDS) profil alır.
+    Başarılıysa (özet metni, .pstats yolu), başka bir profil sürüyorsa (None, hata mesajı) döndürür.
+    """
+    if _state['running']:
+        return (None, "Zaten çalışan bir profil var.")
+    seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+    _state['running'] = True
+    log.info("Profil başladı (%.0f saniye).", seconds)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+        _state['running'] = False
+    summary, path = await asyncio.to_thread(_write_stats, profiler, top)
+    log.info("Profil tamamlandı: %s", path)
+    return (summary, path)
@@ -0,0 +1,173 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+import httpx
+
+log = logging.getLogger(__name__)
+
+# --- İSTASYON KATALOĞU ---
+# TCDD'nin tüm istasyon listesi bir kez indirilir, sürüm damgasıyla diske yazılır ve
+# isim öneki / id ile arama için bellekte sıralı bir indeks kurulur.
+STATION_CATALOG_URL = os.getenv(
+    "STATION_CATALOG_URL",
+    "https://cdn-api-prod-ytp.tcddtasimacilik.gov.tr/datas/station-pairs-INTERNET.json?environment=dev&userId=1",
+)
+STATION_CATALOG_PATH = os.getenv("STATION_CATALOG_PATH", "station_catalog.json")
+# Diskteki katalog bu süreden eskiyse yeniden indirilir.
+STATION_CATALOG_MAX_AGE_SECONDS = int(os.getenv("STATION_CATALOG_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+
+# Türkçe büyük/küçük harf: 'İ' -> 'i', 'I' -> 'ı'. Ardından aramada klavye farkları önemli
+# olmasın diye Türkçe karakterler ASCII karşılıklarına indirgenir ("sogutlu" -> SÖĞÜTLÜÇEŞME).
+_TURKISH_LOWER = str.maketrans({'İ': 'i', 'I': 'ı'})
+_TURKISH_UPPER = str.maketrans({'i': 'İ', 'ı': 'I'})
+_ASCII_FOLD = str.maketrans('çğıöşüâîû', 'cgiosuaiu')
+_WORD_START = re.compile(r'[^\W_]+')
+
+
+def turkish_lower(text: str) -> str:
+    return text.translate(_TURKISH_LOWER).lower()
+
+
+def turkish_upper(text: str) -> str:
+    return text.translate(_TURKISH_UPPER).upper()
+
+
+def fold(text: str) -> str:
+    """Arama anahtarı: Türkçe kurallarıyla küçük harf, ardından ASCII'ye indirgenmiş."""
+    return turkish_lower(text).translate(_ASCII_FOLD)
+
+
+def turkish_title(text: str) -> str:
+    """'İSTANBUL(SÖĞÜTLÜÇEŞME)' -> 'İstanbul(Söğütlüçeşme)' (str.title 'i̇' üretir)."""
+    return _WORD_START.sub(lambda m: turkish_upper(m.group(0)[0]) + turkish_lower(m.group(0)[1:]), text)
+
+
+class StationCatalog:
+    """
+    İstasyon listesi üzerinde id ve isim öneki araması. İndeks, her istasyon adının her
+    kelime başlangıcından itibaren katlanmış halini içeren sıralı bir listedir; arama
+    bisect ile yapılır, liste taranmaz.
+    """
+
+    def __init__(self, stations: dict, version: str):
+        # { id: {'id': int, 'name': 'İSTANBUL(SÖĞÜTLÜÇEŞME)', 'title': 'İstanbul(Söğütlüçeşme)'} }
+        self.by_id = {}
+        self.version = version
+        index = []
+        for station_id, name in stations.items():
+            self.by_id[station_id] = {'id': station_id, 'name': name, 'title': turkish_title(name)}
+            folded = fold(name)
+            for match in _WORD_START.finditer(folded):
+                index.append((folded[match.start():], station_id))
+        index.sort()
+        self._index_keys = [key for key, _ in index]
+        self._index_ids = [station_id for _, station_id in index]
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, station_id: int):
+        return self.by_id.get(station_id)
+
+    def search(self, prefix: str, limit: int = 10):
+        """İsmin herhangi bir kelimesi 'prefix' ile başlayan istasyonları (tekrarsız) döndürür."""
+        folded_prefix = fold(prefix.strip())
+        if not folded_prefix:
+            return []
+        results = []
+        seen = set()
+        position = bisect.bisect_left(self._index_keys, folded_prefix)
+        while position < len(self._index_keys) and self._index_keys[position].startswith(folded_prefix):
+            station_id = self._index_ids[position]
+            if station_id not in seen:
+                seen.add(station_id)
+                results.append(self.by_id[station_id])
+                if len(results) >= limit:
+                    break
+            position += 1
+        return results
+
+
+def _parse_station_list(payload):
+    """station-pairs yanıtını { id: ad } sözlüğüne çevirir; tanınmayan kayıtları atlar."""
+    if isinstance(payload, dict):
+        payload = payload.get("stations") or payload.get("data") or []
+    stations = {}
+    for item in payload:
+        try:
+            station_id = int(item["id"])
+            name = str(item["name"]).strip()
+        except (KeyError, TypeError, ValueError):
+            continue
+        if name:
+            stations[station_id] = name
+    return stations
+
+
+def _read_catalog_file(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        stations = {int(station_id): name for station_id, name in data["stations"].items()}
+        return data, stations
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None, None
+
+
+def _write_catalog_file(path: str, version: str, stations: dict):
+    data = {
+        'version': version,
+        'fetched_at': time.time(),
+        'source': STATION_CATALOG_URL,
+        'stations': {str(station_id): name for station_id, name in stations.items()},
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def download_station_list():
+    """Katalog URL'inden istasyon listesini indirir: (sürüm, { id: ad })."""
+    response = httpx.get(STATION_CATALOG_URL, timeout=20)
+    response.raise_for_status()
+    stations = _parse_station_list(response.json())
+    version = (
+        response.headers.get("etag")
+        or response.headers.get("last-modified")
+        or hashlib.sha1(response.content).hexdigest()[:12]
+    )
+    return version.strip('"'), stations
+
+
+def load_station_catalog(seed_stations: dict, path: str = STATION_CATALOG_PATH):
+    """
+    Kataloğu yükler: diskteki kopya güncelse onu, değilse indirileni kullanır. İndirme
+    başarısız olursa eski disk kopyasına, o da yoksa seed_stations'a ({ id: ad }) düşer.
+    seed_stations her durumda katalogda bulunur (favori istasyonlar hiç kaybolmaz).
+    """
+    data, stations = _read_catalog_file(path)
+    if data and time.time() - data.get('fetched_at', 0) < STATION_CATALOG_MAX_AGE_SECONDS:
+        log.info("İstasyon kataloğu diskten yüklendi (%d istasyon, sürüm %s).", len(stations), data['version'])
+        return StationCatalog({**seed_stations, **stations}, data['version'])
+
+    try:
+        version, downloaded = download_station_list()
+        if not downloaded:
+            raise ValueError("boş istasyon listesi")
+        _write_catalog_file(path, version, downloaded)
+        log.info("İstasyon kataloğu indirildi (%d istasyon, sürüm %s).", len(downloaded), version)
+        return StationCatalog({**seed_stations, **downloaded}, version)
+    except (httpx.HTTPError, OSError, ValueError) as e:
+        log.warning("İstasyon kataloğu indirilemedi: %s", e)
+
+    if stations:
+        log.warning("Eski istasyon kataloğu kullanılıyor (sürüm %s).", data['version'])
+        return StationCatalog({**seed_stations, **stations}, data['version'])
+    log.warning("Sadece yerleşik istasyon listesi kullanılıyor.")
+    return StationCatalog(seed_stations, "seed")
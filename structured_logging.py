@@ -0,0 +1,245 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import metrics
+
+# --- YAPILANDIRILMIŞ GÜNLÜK (LOGGING) ---
+# Modüller standart logging kullanır; setup_logging() kök logger'a kuyruk tabanlı bir handler bağlar.
+# Çağıran thread (event loop dahil) sadece kaydı sınırlı bir kuyruğa bırakır; biçimlendirme ve
+# stdout'a yazma ayrı bir dinleyici thread'inde yapılır. Kuyruk doluysa kayıt beklemeden düşürülür.
+# Her kayda o anki bağlam (sohbet, güzergah, tarih) eklenir; aynı satır şablonunun dakikada
+# LOG_RATE_LIMIT_PER_MINUTE'ten fazlası bastırılır; sayısı pencere dolduktan sonraki ilk kayda, o şablon
+# bir daha gelmezse ayrı bir özet satırına yazılır.
+#
+#     LOG_LEVEL=INFO  LOG_LEVELS="e_bilet_V3.poll=DEBUG,telegram_outbox=WARNING"  LOG_FORMAT=json|text
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Aynı (logger, şablon) için dakikada en fazla bu kadar kayıt yazılır; 0 sınırı kapatır.
+LOG_RATE_LIMIT_PER_MINUTE = int(os.getenv("LOG_RATE_LIMIT_PER_MINUTE", "60"))
+
+LOG_RECORDS_DROPPED = metrics.Counter("log_records_dropped_total", "Düşürülen günlük kayıtları (reason=queue_full|rate_limited)")
+
+# { 'chat': ..., 'route': ..., 'date': ... } - asyncio görevleri oluşturulurken kopyalanır
+_context = contextvars.ContextVar("log_context", default={})
+# LogRecord'un kendi öznitelikleri; extra= ile gelen alanlar bunların dışında kalanlardır.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {'message', 'asctime', 'suppressed'}
+
+_listener = None
+# Süresi dolan rate-limit pencerelerini özetleyen thread ve durdurma olayı: (thread, Event)
+_summarizer = None
+
+
+def bind_context(**fields):
+    """
+    Bundan sonra bu bağlamda (ör. bir poller görevinde) atılan kayıtlara alanları ekler (chat, route, date...).
+    Önceki duruma dönmek için reset_context'e verilecek token'ı döndürür.
+    """
+    return _context.set({**_context.get(), **{key: value for key, value in fields.items() if value is not None}})
+
+
+def reset_context(token):
+    _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Bağlam alanlarını kayda ekler; extra= ile verilen değerler önceliklidir."""
+
+    def filter(self, record):
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    (logger, biçimlendirilmemiş şablon) başına dakikada en fazla `limit` kayıt geçirir. Bastırılan
+    kayıtların sayısı, pencere açıldıktan sonra geçen ilk kayda `suppressed` olarak eklenir; o şablon
+    bir daha gelmezse expired_summaries() sayıyı ayrı bir özet kaydıyla verir. WARNING ve üstü sınırlanmaz.
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT_PER_MINUTE, window_seconds: float = 60):
+        super().__init__()
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._windows = {}  # { (logger, şablon): [pencere başlangıcı, geçen, bastırılan] }
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.window_seconds:
+                suppressed = window[2] if window is not None else 0
+                if len(self._windows) > 10000:
+                    self._windows.clear()
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+        LOG_RECORDS_DROPPED.inc(reason="rate_limited")
+        return False
+
+    def expired_summaries(self, force: bool = False) -> list:
+        """
+        Süresi dolan pencereleri (force ise hepsini) siler; kayıt bastırılmış olanlar için
+        'suppressed' alanlı birer özet kaydı döndürür.
+        """
+        now = time.monotonic()
+        summaries = []
+        with self._lock:
+            for key, window in list(self._windows.items()):
+                if not force and now - window[0] < self.window_seconds:
+                    continue
+                del self._windows[key]
+                if window[2]:
+                    summaries.append(logging.makeLogRecord({
+                        'name': key[0], 'levelno': logging.INFO, 'levelname': 'INFO',
+                        'msg': f"Sınırı aşan satırlar bastırıldı: {key[1]}", 'suppressed': window[2],
+                    }))
+        return summaries
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Kaydı sadece mesajı çözülmüş haliyle kuyruğa bırakır; kuyruk doluysa beklemez, düşürür."""
+
+    def prepare(self, record):
+        # Biçimlendirme dinleyici thread'inde yapılır; burada sadece argümanlar mesaja gömülür ki
+        # sonradan değişebilecek nesnelere referans kuyrukta kalmasın.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+class JsonFormatter(logging.Formatter):
+    """Her kaydı tek satırlık JSON'a çevirir: ts, level, logger, msg, bağlam ve extra alanları."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Geliştirme için okunabilir tek satır: saat, seviye, logger, mesaj [bağlam]."""
+
+    def format(self, record):
+        line = f"{datetime.fromtimestamp(record.created).strftime('%H:%M:%S')} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        context = " ".join(f"{key}={value}" for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES)
+        if context:
+            line += f"  [{context}]"
+        if getattr(record, 'suppressed', 0):
+            line += f"  (+{record.suppressed} benzer satır bastırıldı)"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+def _parse_levels(value: str):
+    levels = {}
+    for item in value.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: str = LOG_LEVEL, levels: str = LOG_LEVELS, fmt: str = LOG_FORMAT, stream=None):
+    """
+    Kök logger'ı kuyruk handler'ına bağlar ve dinleyici thread'ini başlatır. Tekrar çağrılırsa
+    etkisizdir. Süreç çıkarken atexit ile kuyruk boşaltılır.
+    """
+    global _listener, _summarizer
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(ContextFilter())
+    rate_limit = RateLimitFilter()
+    handler.addFilter(rate_limit)
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    for name, module_level in _parse_levels(levels).items():
+        logging.getLogger(name).setLevel(module_level)
+    # Kütüphanelerin istek başına INFO satırları (httpx her istek için bir satır yazar) bastırılır.
+    for noisy in ("httpx", "httpcore", "apscheduler"):
+        if noisy not in levels:
+            logging.getLogger(noisy).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=_emit_summaries, args=(handler, rate_limit, stop), name="log-rate-summary", daemon=True,
+    )
+    thread.start()
+    _summarizer = (thread, stop)
+    atexit.register(shutdown_logging)
+
+
+def _emit_summaries(handler: NonBlockingQueueHandler, rate_limit: RateLimitFilter, stop: threading.Event):
+    """Bastırılan sayıların patlamadan sonra sessiz kalan şablonlarda kaybolmaması için pencereleri düzenli tarar."""
+    interval = max(1.0, rate_limit.window_seconds / 6)
+    while not stop.wait(interval):
+        for record in rate_limit.expired_summaries():
+            handler.enqueue(record)
+    for record in rate_limit.expired_summaries(force=True):
+        handler.enqueue(record)
+
+
+def shutdown_logging():
+    """Bastırılan kayıtların özetini ve kuyrukta kalan kayıtları yazar, dinleyiciyi durdurur."""
+    global _listener, _summarizer
+    if _summarizer is not None:
+        thread, stop = _summarizer
+        stop.set()
+        # Özet thread'i son taramayı yapıp kuyruğa bırakana kadar beklenir.
+        thread.join(timeout=1)
+        _summarizer = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
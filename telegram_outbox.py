@@ -0,0 +1,221 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+import httpx
+
+import metrics
+import tracing
+from message_rendering import TELEGRAM_MESSAGE_LIMIT, split_message
+
+log = logging.getLogger(__name__)
+
+# --- GİDEN TELEGRAM KUYRUĞU ---
+# Mesajlar beklemeden kuyruğa eklenir; gönderimi arka plandaki bir dağıtıcı yapar. Aynı sohbete kısa
+# sürede biriken mesajlar tek mesajda birleştirilir, her sohbet ve bot geneli Telegram sınırlarına
+# göre aralıklandırılır, 429 yanıtındaki retry_after süresi kadar beklenip tekrar denenir.
+# Her mesaj, kuyruğa eklendiği andaki trace kimliğini taşır; gönderim satırları bu kimliklerle yazılır.
+# Mesajlar message_rendering ile escape edilerek kurulduğu için biçim hatası (400) beklenmez; böyle bir
+# yanıt düz metinle tekrar denenmez, gönderilemedi olarak sayılır. Sınırı aşan mesajlar tren blokları
+# arasından bölünür.
+# Telegram: aynı sohbete saniyede ~1, bot genelinde saniyede ~30 mesaj.
+TELEGRAM_PER_CHAT_INTERVAL_SECONDS = float(os.getenv("TELEGRAM_PER_CHAT_INTERVAL_SECONDS", "1"))
+TELEGRAM_GLOBAL_RATE_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_RATE_PER_SECOND", "25"))
+# Bir sohbete ilk mesaj geldikten sonra birleştirme için beklenen süre.
+TELEGRAM_MERGE_WINDOW_SECONDS = float(os.getenv("TELEGRAM_MERGE_WINDOW_SECONDS", "0.5"))
+# Aynı anda açık en fazla sendMessage isteği.
+TELEGRAM_SEND_CONCURRENCY = int(os.getenv("TELEGRAM_SEND_CONCURRENCY", "8"))
+TELEGRAM_MAX_ATTEMPTS = int(os.getenv("TELEGRAM_MAX_ATTEMPTS", "5"))
+
+TELEGRAM_SEND_SECONDS = metrics.Histogram("telegram_send_seconds", "Tek bir sendMessage isteğinin süresi")
+TELEGRAM_MESSAGES = metrics.Counter("telegram_messages_total", "Telegram gönderim sonuçları (result=sent|failed)")
+TELEGRAM_RETRY_AFTER = metrics.Counter("telegram_retry_after_total", "Telegram'ın 429 ile yavaşlattığı gönderimler")
+TELEGRAM_MERGED = metrics.Counter("telegram_merged_messages_total", "Başka bir mesajla birleştirilerek gönderilen mesajlar")
+TELEGRAM_QUEUE_LATENCY_SECONDS = metrics.Histogram("telegram_queue_latency_seconds", "Mesajın kuyruğa eklenmesinden gönderilmesine kadar geçen süre")
+
+
+def merge_messages(texts: list, limit: int = TELEGRAM_MESSAGE_LIMIT):
+    """Mesajları sırayla, boş satırla ayırarak limit'i aşmayan parçalara birleştirir; tek başına limit'i aşan mesaj bölünür."""
+    chunks = []
+    current = ""
+    for text in (part for text in texts for part in split_message(text, limit)):
+        if current and len(current) + 2 + len(text) > limit:
+            chunks.append(current)
+            current = text
+        else:
+            current = f"{current}\n\n{text}" if current else text
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TelegramOutbox:
+    """
+    enqueue() event loop'tan, enqueue_threadsafe() başka thread'lerden çağrılır; ikisi de hemen döner.
+    start() bot'un event loop'u içinde çağrılmalıdır.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, token: str, parse_mode: str = None):
+        self.client = client
+        self.url = f'/bot{token}/sendMessage'
+        self.parse_mode = parse_mode
+        self._pending = {}  # { chat_id: [(metin, kuyruğa eklenme zamanı, trace kimlikleri), ...] }
+        self._due = []  # (gönderim zamanı, sıra, chat_id) heap'i; her sohbet en fazla bir kez
+        self._scheduled = set()  # heap'te veya gönderimde olan sohbetler
+        self._next_allowed = {}  # { chat_id: bu sohbete bir sonraki gönderimin en erken zamanı }
+        self._attempts = {}  # { chat_id: art arda 429 alınan deneme sayısı }
+        self._next_global_slot = 0.0
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._semaphore = None
+        self._loop = None
+        self._dispatcher = None
+        self._deliveries = set()
+        metrics.Gauge("telegram_outbox_pending", "Kuyrukta gönderilmeyi bekleyen mesajlar",
+                      callback=lambda: sum(len(items) for items in self._pending.values()))
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(TELEGRAM_SEND_CONCURRENCY)
+        self._dispatcher = self._loop.create_task(self._dispatch())
+
+    async def close(self, drain_timeout: float = 10):
+        """Kuyruktaki mesajları en fazla drain_timeout saniye göndermeye çalışır, sonra durur."""
+        if self._dispatcher is None:
+            return
+        deadline = time.monotonic() + drain_timeout
+        while (self._pending or self._deliveries) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._dispatcher.cancel()
+        for task in list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._deliveries, return_exceptions=True)
+        self._dispatcher = None
+
+    def enqueue(self, chat_id: str, text: str, trace_id: str = None):
+        chat_id = str(chat_id)
+        trace_id = trace_id or tracing.current_trace_id()
+        self._pending.setdefault(chat_id, []).append((text, time.monotonic(), (trace_id,) if trace_id else ()))
+        if chat_id not in self._scheduled:
+            now = time.monotonic()
+            self._schedule(chat_id, max(now + TELEGRAM_MERGE_WINDOW_SECONDS, self._next_allowed.get(chat_id, 0)))
+
+    def enqueue_threadsafe(self, chat_id: str, text: str):
+        self._loop.call_soon_threadsafe(self.enqueue, chat_id, text, tracing.current_trace_id())
+
+    def _schedule(self, chat_id: str, due: float):
+        self._scheduled.add(chat_id)
+        heapq.heappush(self._due, (due, next(self._sequence), chat_id))
+        self._wakeup.set()
+
+    async def _dispatch(self):
+        while True:
+            if not self._due:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._due[0][0] - time.monotonic()
+            if delay > 0:
+                # Daha erken bir sohbet eklenirse uyanıp tekrar bakılır.
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, chat_id = heapq.heappop(self._due)
+            await self._semaphore.acquire()
+            task = self._loop.create_task(self._deliver(chat_id))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _reserve_global_slot(self):
+        now = time.monotonic()
+        slot = max(now, self._next_global_slot)
+        self._next_global_slot = slot + 1 / TELEGRAM_GLOBAL_RATE_PER_SECOND
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _deliver(self, chat_id: str):
+        items = self._pending.pop(chat_id, [])
+        retry_at = None
+        try:
+            texts = [text for text, _, _ in items]
+            traces = tuple(dict.fromkeys(trace_id for _, _, item_traces in items for trace_id in item_traces))
+            if len(texts) > 1:
+                TELEGRAM_MERGED.inc(len(texts))
+            chunks = merge_messages(texts)
+            for index, chunk in enumerate(chunks):
+                await self._reserve_global_slot()
+                retry_after = await self._send(chat_id, chunk, traces)
+                self._next_allowed[chat_id] = time.monotonic() + TELEGRAM_PER_CHAT_INTERVAL_SECONDS
+                if retry_after is None:
+                    self._attempts.pop(chat_id, None)
+                else:
+                    # Gönderilemeyen parçalar, bu arada gelen mesajların önüne geri konur.
+                    attempts = self._attempts.get(chat_id, 0) + 1
+                    if attempts >= TELEGRAM_MAX_ATTEMPTS:
+                        TELEGRAM_MESSAGES.inc(result="failed")
+                        log.error("Telegram mesajı %d denemede gönderilemedi, bırakılıyor.", attempts, extra={'chat': chat_id})
+                        self._attempts.pop(chat_id, None)
+                        chunks_left = chunks[index + 1:]
+                    else:
+                        self._attempts[chat_id] = attempts
+                        chunks_left = chunks[index:]
+                    first_enqueued = items[0][1] if items else time.monotonic()
+                    self._pending[chat_id] = [(text, first_enqueued, traces) for text in chunks_left] + self._pending.get(chat_id, [])
+                    retry_at = time.monotonic() + retry_after
+                    self._next_allowed[chat_id] = retry_at
+                    break
+                if index + 1 < len(chunks):
+                    await asyncio.sleep(TELEGRAM_PER_CHAT_INTERVAL_SECONDS)
+            else:
+                for _, enqueued_at, item_traces in items:
+                    latency = time.monotonic() - enqueued_at
+                    TELEGRAM_QUEUE_LATENCY_SECONDS.observe(latency)
+                    if latency >= tracing.TRACE_SLOW_SECONDS:
+                        log.warning("Telegram mesajı %.0f ms kuyrukta bekledi.", latency * 1000,
+                                    extra={'chat': chat_id, 'traces': item_traces})
+        finally:
+            self._semaphore.release()
+            self._scheduled.discard(chat_id)
+            if self._pending.get(chat_id):
+                self._schedule(chat_id, retry_at or self._next_allowed.get(chat_id, 0))
+            else:
+                self._pending.pop(chat_id, None)
+
+    async def _send(self, chat_id: str, text: str, traces: tuple = ()):
+        """Tek bir sendMessage isteği. 429 ise beklenecek saniyeyi, diğer durumlarda None döndürür."""
+        fields = {'chat': chat_id, 'traces': traces}
+        payload = {'chat_id': chat_id, 'text': text}
+        if self.parse_mode:
+            payload['parse_mode'] = self.parse_mode
+        try:
+            with TELEGRAM_SEND_SECONDS.time(), tracing.span("telegram_send"):
+                response = await self.client.post(self.url, data=payload)
+            if response.status_code == 429:
+                TELEGRAM_RETRY_AFTER.inc()
+                retry_after = _retry_after(response)
+                log.warning("Telegram hız sınırı, %s saniye sonra tekrar denenecek.", retry_after, extra=fields)
+                return retry_after
+            if response.status_code == 200:
+                TELEGRAM_MESSAGES.inc(result="sent")
+                log.debug("Telegram mesajı gönderildi.", extra=fields)
+            else:
+                TELEGRAM_MESSAGES.inc(result="failed")
+                log.error("Telegram mesajı gönderilemedi: %s", response.text, extra=fields)
+        except httpx.HTTPError as e:
+            TELEGRAM_MESSAGES.inc(result="failed")
+            log.error("Telegram mesajı gönderme hatası: %s", e, extra=fields)
+        return None
+
+
+def _retry_after(response: httpx.Response) -> float:
+    try:
+        return float(response.json()['parameters']['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        return float(response.headers.get('retry-after') or 1)
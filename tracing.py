@@ -0,0 +1,119 @@
+import contextvars
+import logging
+import os
+import random
+import secrets
+import time
+from contextlib import contextmanager
+
+import metrics
+import structured_logging
+
+log = logging.getLogger(__name__)
+
+# --- AŞAMA ZAMANLAMASI (TRACE) ---
+# Bir sorgu turu (tek seferlik kontrol, izleme turu, işçiden gelen sonucun dağıtımı) bir trace'tir;
+# içindeki aşamalar (token, availability_post, decode, parse, render, deliver...) span() ile ölçülür.
+# Trace kimliği günlük bağlamına ve Telegram kuyruğuna taşınır, böylece gönderim satırları da aynı
+# kimlikle aranabilir. Her aşamanın süresi ayrıca trace_stage_<aşama>_seconds histogramına yazılır.
+# Trace bitince TRACE_SLOW_SECONDS'ı aşanlar WARNING, TRACE_SAMPLE_RATE oranındakiler INFO, kalanı
+# DEBUG seviyesinde aşama süreleriyle birlikte günlüğe yazılır.
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "5"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+
+# O anki görevin katkıda bulunduğu trace'ler. Toplu sorgularda paylaşılan POST birden fazla trace'e yazılır.
+_current = contextvars.ContextVar("traces", default=())
+_stage_histograms = {}
+
+
+class Trace:
+    __slots__ = ('trace_id', 'name', 'started', 'spans')
+
+    def __init__(self, name: str, trace_id: str = None):
+        self.trace_id = trace_id or secrets.token_hex(8)
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = {}  # { aşama: toplam saniye } - aynı aşama birden fazla kez çalışabilir (401 sonrası tekrar POST)
+
+    def add(self, stage: str, seconds: float):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def finish(self, **fields):
+        total = time.perf_counter() - self.started
+        extra = {
+            'trace': self.trace_id,
+            'total_ms': round(total * 1000, 1),
+            'spans_ms': {stage: round(seconds * 1000, 1) for stage, seconds in self.spans.items()},
+            **fields,
+        }
+        if total >= TRACE_SLOW_SECONDS:
+            log.warning("Yavaş %s: %.0f ms", self.name, total * 1000, extra=extra)
+        elif random.random() < TRACE_SAMPLE_RATE:
+            log.info("%s: %.0f ms", self.name, total * 1000, extra=extra)
+        else:
+            log.debug("%s: %.0f ms", self.name, total * 1000, extra=extra)
+
+
+def _histogram(stage: str):
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        histogram = _stage_histograms[stage] = metrics.Histogram(
+            f"trace_stage_{stage}_seconds", f"'{stage}' aşamasının süresi"
+        )
+    return histogram
+
+
+# Bilinen aşamaların histogramları baştan oluşturulur; işçi süreçlerin ölçtüğü süreler ana süreçte
+# metrics.merge ile aynı adlı histogramlara eklenir (merge bilinmeyen adları atlar).
+STAGES = ("token", "availability_post", "decode", "parse", "render", "availability", "deliver", "telegram_send")
+for _stage in STAGES:
+    _histogram(_stage)
+
+
+@contextmanager
+def trace(name: str, trace_id: str = None, **fields):
+    """
+    Yeni bir trace başlatır (trace_id verilirse başka süreçte başlamış trace'i sürdürür); blok
+    boyunca atılan günlük kayıtları ve span'ler bu trace'e bağlanır.
+    """
+    current = Trace(name, trace_id)
+    token = _current.set((current,))
+    log_token = structured_logging.bind_context(trace=current.trace_id)
+    try:
+        yield current
+    finally:
+        structured_logging.reset_context(log_token)
+        _current.reset(token)
+        current.finish(**fields)
+
+
+@contextmanager
+def attach(traces: tuple):
+    """Blok içindeki span'leri verilen trace'lere yazar (ör. toplu sorguda her sorgunun kendi trace'i)."""
+    token = _current.set(tuple(traces))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current_traces() -> tuple:
+    return _current.get()
+
+
+def current_trace_id():
+    traces = _current.get()
+    return traces[0].trace_id if traces else None
+
+
+@contextmanager
+def span(stage: str):
+    """Bloğun süresini o anki trace'lere ve aşama histogramına ekler; blok içinde await kullanılabilir."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        _histogram(stage).observe(seconds)
+        for current in _current.get():
+            current.add(stage, seconds)
@@ -0,0 +1,214 @@
+import logging
+import os
+from collections import OrderedDict
+
+from station_catalog import fold
+
+log = logging.getLogger(__name__)
+
+# --- SEFER / VAGON FİLTRELERİ ---
+# Her izleme kendi filtresini taşıyabilir: kalkış saati aralığı, izin verilen vagon sınıfları,
+# en yüksek fiyat, en az boş koltuk ve tren adı. Kullanıcının yazdığı tanım (spec) bir kez
+# derlenir: saat aralığı izin verilen dakikaların frozenset'ine, sınıf ve tren adları katlanmış
+# (fold) metinlere çevrilir. Son kullanılan FILTER_CACHE_SIZE tanımın derlenmiş hali saklanır; aynı
+# tanımdan derlenen filtreler eşittir, önbellekten düşmüş olsalar da deliver_result'ta aynı görünümü paylaşır.
+#
+#     /filtre saat=06:00-12:00 sinif=ekonomi,business fiyat=800 koltuk=2 tren=YHT
+
+FILTER_CACHE_SIZE = int(os.getenv("FILTER_CACHE_SIZE", "256"))
+
+# Bildirimlerde hiç gösterilmeyen vagon sınıfları (her filtrede, varsayılanda da geçerli)
+UNWANTED_CABIN_CLASSES = frozenset(["TEKERLEKLİ SANDALYE", "YATAKLI", "LOCA"])
+_UNWANTED_FOLDED = frozenset(fold(name) for name in UNWANTED_CABIN_CLASSES)
+
+# 'SS:DD' -> gün içindeki dakika
+MINUTE_OF_DAY = {f"{hour:02d}:{minute:02d}": hour * 60 + minute for hour in range(24) for minute in range(60)}
+
+# Katlanmış anahtar adı -> spec'teki kanonik ad
+_SPEC_KEYS = {'saat': 'saat', 'sinif': 'sinif', 'fiyat': 'fiyat', 'koltuk': 'koltuk', 'tren': 'tren'}
+
+# API'den gelen vagon ve tren adları az sayıda farklı değer alır; katlanmış halleri saklanır.
+_folded_names = {}
+_compiled = OrderedDict()  # { spec anahtarı: TrainFilter } - LRU
+
+
+def _folded(name: str) -> str:
+    folded = _folded_names.get(name)
+    if folded is None:
+        if len(_folded_names) > 4096:
+            _folded_names.clear()
+        folded = _folded_names[name] = fold(name)
+    return folded
+
+
+def is_unwanted_cabin(name: str) -> bool:
+    return _folded(name) in _UNWANTED_FOLDED
+
+
+class TrainFilter:
+    """
+    Derlenmiş filtre. accepts_train kalkış dakikası ve tren adına, accepts_cabin vagonun
+    sınıfı, boş koltuğu ve fiyatına bakar; ayrıştırıcı reddedilen trenlerin vagonlarını hiç okumaz.
+    spec boşsa sadece istenmeyen sınıflar ve dolu vagonlar elenir.
+    """
+    __slots__ = ('spec', 'minutes', 'cabin_classes', 'max_price', 'min_seats', 'train_names')
+
+    def __init__(self, spec: dict, minutes=None, cabin_classes=None, max_price=None, min_seats=1, train_names=None):
+        self.spec = spec
+        self.minutes = minutes
+        self.cabin_classes = cabin_classes
+        self.max_price = max_price
+        self.min_seats = min_seats
+        self.train_names = train_names
+
+    def __bool__(self):
+        return bool(self.spec)
+
+    def __eq__(self, other):
+        return isinstance(other, TrainFilter) and self.spec == other.spec
+
+    def __hash__(self):
+        return hash(_spec_key(self.spec))
+
+    def accepts_train(self, name: str, minute: int) -> bool:
+        if self.minutes is not None and minute not in self.minutes:
+            return False
+        if self.train_names is not None:
+            folded = _folded(name)
+            return any(part in folded for part in self.train_names)
+        return True
+
+    def accepts_cabin(self, name: str, seats: int, price) -> bool:
+        if seats < self.min_seats:
+            return False
+        if self.max_price is not None and (price is None or price > self.max_price):
+            return False
+        folded = _folded(name)
+        if folded in _UNWANTED_FOLDED:
+            return False
+        return self.cabin_classes is None or folded in self.cabin_classes
+
+    def filter_snapshot(self, snapshot: dict) -> dict:
+        """{(tren, 'SS:DD', vagon): (koltuk, fiyat)} snapshot'ından filtreye uyan satırları döndürür (sıra korunur)."""
+        return {
+            seat_key: value for seat_key, value in snapshot.items()
+            if self.accepts_train(seat_key[0], MINUTE_OF_DAY.get(seat_key[1], -1))
+            and self.accepts_cabin(seat_key[2], value[0], value[1])
+        }
+
+    def describe(self) -> str:
+        parts = []
+        if 'saat' in self.spec:
+            parts.append(f"kalkış {self.spec['saat']}")
+        if 'sinif' in self.spec:
+            parts.append(f"sınıf {self.spec['sinif'].replace(',', '/')}")
+        if 'fiyat' in self.spec:
+            parts.append(f"en fazla {self.spec['fiyat']} TRY")
+        if 'koltuk' in self.spec:
+            parts.append(f"en az {self.spec['koltuk']} koltuk")
+        if 'tren' in self.spec:
+            parts.append(f"tren {self.spec['tren'].replace(',', '/')}")
+        return ", ".join(parts) if parts else "filtre yok"
+
+
+def _parse_minute(value: str) -> int:
+    hour, _, minute = value.strip().partition(":")
+    hour, minute = int(hour), int(minute or 0)
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError
+    return hour * 60 + minute
+
+
+def _compile_window(value: str) -> frozenset:
+    """'SS:DD-SS:DD' aralığını (bitiş dahil) dakika kümesine çevirir; gece yarısını aşan aralıklar desteklenir."""
+    try:
+        start, end = (_parse_minute(part) for part in value.split("-", 1))
+    except ValueError:
+        raise ValueError(f"Saat aralığı anlaşılamadı: '{value}' (örnek: saat=06:00-12:30)") from None
+    if start <= end:
+        return frozenset(range(start, end + 1))
+    return frozenset(range(start, 1440)) | frozenset(range(0, end + 1))
+
+
+def _parse_number(value: str, name: str, cast):
+    try:
+        number = cast(value.replace(",", "."))
+    except ValueError:
+        raise ValueError(f"{name} bir sayı olmalı: '{value}'") from None
+    if number < 0:
+        raise ValueError(f"{name} negatif olamaz: '{value}'")
+    return number
+
+
+def _name_list(value: str) -> frozenset:
+    names = frozenset(fold(part.strip()) for part in value.split(",") if part.strip())
+    if not names:
+        raise ValueError("Liste boş olamaz.")
+    return names
+
+
+def _spec_key(spec: dict) -> tuple:
+    return tuple(sorted(spec.items()))
+
+
+def compile_filter(spec: dict) -> TrainFilter:
+    """Kanonik spec sözlüğünü derler; geçersiz değerlerde ValueError yükseltir."""
+    cache_key = _spec_key(spec)
+    compiled = _compiled.get(cache_key)
+    if compiled is not None:
+        _compiled.move_to_end(cache_key)
+        return compiled
+
+    options = {}
+    for name, value in spec.items():
+        if name == 'saat':
+            options['minutes'] = _compile_window(value)
+        elif name == 'sinif':
+            options['cabin_classes'] = _name_list(value)
+        elif name == 'fiyat':
+            options['max_price'] = _parse_number(value, "Fiyat", float)
+        elif name == 'koltuk':
+            options['min_seats'] = max(1, _parse_number(value, "Koltuk sayısı", int))
+        elif name == 'tren':
+            options['train_names'] = tuple(_name_list(value))
+        else:
+            raise ValueError(f"Bilinmeyen filtre: '{name}'")
+
+    compiled = _compiled[cache_key] = TrainFilter(dict(spec), **options)
+    while len(_compiled) > FILTER_CACHE_SIZE:
+        _compiled.popitem(last=False)
+    return compiled
+
+
+def parse_filter_spec(text: str):
+    """
+    '/filtre' argümanlarını ('anahtar=değer' çiftleri) derler.
+    Başarılıysa (TrainFilter, None), değilse (None, hata mesajı) döndürür.
+    """
+    spec = {}
+    for token in text.split():
+        name, separator, value = token.partition("=")
+        key = _SPEC_KEYS.get(fold(name))
+        if not separator or not value:
+            return (None, f"'{token}' anlaşılamadı; filtreler anahtar=değer biçiminde yazılır.")
+        if key is None:
+            return (None, f"Bilinmeyen filtre: '{name}'. Kullanılabilenler: saat, sınıf, fiyat, koltuk, tren.")
+        spec[key] = value
+    try:
+        return (compile_filter(spec), None)
+    except ValueError as e:
+        return (None, str(e))
+
+
+def load_filter(spec):
+    """Kayıttan okunan spec'i derler; boş veya geçersizse None döndürür."""
+    if not spec:
+        return None
+    try:
+        return compile_filter(spec)
+    except ValueError as e:
+        log.warning("Kayıtlı filtre yok sayıldı (%s): %s", spec, e)
+        return None
+
+
+DEFAULT_FILTER = compile_filter({})
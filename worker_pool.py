@@ -0,0 +1,294 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+
+import metrics
+import tracing
+
+log = logging.getLogger(__name__)
+
+# --- ÇOK SÜREÇLİ İZLEME HAVUZU ---
+# Telegram ön yüzü (e_bilet_V3) izlemeleri (güzergah, tarih) anahtarına göre tutarlı hash ile işçi
+# süreçlere dağıtır. Aynı anahtar her zaman aynı işçide sorgulanır; işçiler ayrıştırılmış ve
+# oluşturulmuş sonucu ortak bir sonuç kuyruğuyla geri bildirir. Çalışırken işçi ekleyip çıkarmak (yönetici
+# /isci komutu) sadece halkadaki sahibi değişen anahtarları taşır; çöken işçi aynı adla yeniden başlatıldığı
+# için anahtarları yerinde kalır.
+# Upstream hız bütçesinin WORKER_FRONT_RATE_SHARE kadarı ön yüz sürecine (/check) ayrılır, kalanı işçilere
+# eşit bölünür (işçi sayısı değişince paylar güncellenir); böylece toplam hız AVAILABILITY_RATE_PER_SECOND'ı aşmaz. İşçilerdeki sayaç ve histogramlar
+# (token, POST, ayrıştırma...) WORKER_METRICS_INTERVAL_SECONDS'ta bir ana sürecin /metrics'ine eklenir.
+# WORKER_PROCESSES 0 ise her şey bot süreci içinde çalışır (varsayılan).
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+WORKER_FRONT_RATE_SHARE = float(os.getenv("WORKER_FRONT_RATE_SHARE", "0.2"))
+WORKER_METRICS_INTERVAL_SECONDS = float(os.getenv("WORKER_METRICS_INTERVAL_SECONDS", "5"))
+# Her işçinin hash halkasındaki sanal düğüm sayısı; arttıkça dağılım dengelenir.
+WORKER_RING_REPLICAS = int(os.getenv("WORKER_RING_REPLICAS", "128"))
+# Çöken işçilerin kontrol edilme aralığı.
+WORKER_HEALTH_CHECK_SECONDS = float(os.getenv("WORKER_HEALTH_CHECK_SECONDS", "5"))
+
+
+def _ring_hash(value: str) -> int:
+    # hash() süreçler arasında rastgeleleştirildiği için sabit bir özet kullanılır.
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """Sanal düğümlü tutarlı hash halkası; get() anahtarın sahibi olan düğümü döndürür."""
+
+    def __init__(self, nodes=(), replicas: int = WORKER_RING_REPLICAS):
+        self.replicas = replicas
+        self._hashes = []
+        self._nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(set(self._nodes))
+
+    def add(self, node: str):
+        for replica in range(self.replicas):
+            point = _ring_hash(f"{node}#{replica}")
+            index = bisect.bisect(self._hashes, point)
+            self._hashes.insert(index, point)
+            self._nodes.insert(index, node)
+
+    def remove(self, node: str):
+        keep = [(point, owner) for point, owner in zip(self._hashes, self._nodes) if owner != node]
+        self._hashes = [point for point, _ in keep]
+        self._nodes = [owner for _, owner in keep]
+
+    def get(self, key: str):
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _ring_hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def ring_key(key: tuple) -> str:
+    from_id, to_id, date_iso = key
+    return f"{from_id}-{to_id}-{date_iso}"
+
+
+def _worker_main(name: str, commands, results, rate_share: float):
+    """İşçi sürecinin giriş noktası: komutları okur, poller'ları çalıştırır, sonuçları geri yollar."""
+    import e_bilet_V3 as bot
+    import structured_logging
+
+    structured_logging.setup_logging()
+    structured_logging.bind_context(worker=name)
+    bot.load_catalog()
+    bot.set_limiter_share(rate_share)
+    asyncio.run(_worker_loop(bot, name, commands, results))
+
+
+async def _worker_loop(bot, name: str, commands, results):
+    loop = asyncio.get_running_loop()
+    pollers = {}
+    stopped = asyncio.Event()
+
+    def publish(key: tuple, result: tuple):
+        results.put(('result', name, key, result, tracing.current_trace_id()))
+
+    async def ship_metrics():
+        while True:
+            await asyncio.sleep(WORKER_METRICS_INTERVAL_SECONDS)
+            results.put(('metrics', name, metrics.drain()))
+
+    def handle(command: tuple):
+        action = command[0]
+        if action == 'start':
+            _, key, interval_seconds, start_delay = command
+            if key not in pollers:
+                from_id, to_id, target_date = bot.key_arguments(key)
+                pollers[key] = loop.create_task(
+                    bot.poll_route(key, from_id, to_id, target_date, interval_seconds, start_delay, publish)
+                )
+        elif action == 'stop':
+            task = pollers.pop(command[1], None)
+            if task is not None:
+                task.cancel()
+        elif action == 'rate':
+            bot.set_limiter_share(command[1])
+        elif action == 'shutdown':
+            stopped.set()
+
+    def read_commands():
+        while True:
+            command = commands.get()
+            loop.call_soon_threadsafe(handle, command)
+            if command[0] == 'shutdown':
+                return
+
+    threading.Thread(target=read_commands, name=f"{name}-commands", daemon=True).start()
+    shipper = loop.create_task(ship_metrics())
+    log.info("İşçi %s hazır (pid %d).", name, os.getpid())
+    await stopped.wait()
+    for task in pollers.values():
+        task.cancel()
+    await asyncio.gather(*pollers.values(), return_exceptions=True)
+    shipper.cancel()
+    results.put(('metrics', name, metrics.drain()))
+    for client in (bot.ebilet_client, bot.tcdd_api_client, bot.telegram_client):
+        await client.aclose()
+
+
+class WorkerPool:
+    """
+    Ön yüz tarafı. assign()/release() anahtarı sahibi olan işçiye başlat/durdur komutu olarak iletir;
+    işçilerden gelen sonuçlar on_result(key, result) ile botun event loop'unda çağrılır.
+    start() botun event loop'u içinde çağrılmalıdır.
+    """
+
+    def __init__(self, size: int, on_result):
+        self.size = size
+        self.on_result = on_result
+        self.ring = ConsistentHashRing()
+        self.workers = {}  # { ad: (Process, komut kuyruğu) }
+        self.keys = {}  # { anahtar: (interval_seconds, start_delay) }
+        self.owners = {}  # { anahtar: işçi adı }
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._loop = None
+        self._next_worker_number = 0
+        self._closing = threading.Event()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        for _ in range(self.size):
+            self._spawn(self._new_worker_name())
+        self.ring = ConsistentHashRing(self.workers)
+        threading.Thread(target=self._read_results, name="worker-results", daemon=True).start()
+        threading.Thread(target=self._watch_workers, name="worker-health", daemon=True).start()
+        log.info("%d izleme işçisi başlatıldı.", self.size)
+
+    def _new_worker_name(self) -> str:
+        self._next_worker_number += 1
+        return f"worker-{self._next_worker_number}"
+
+    def _rate_share(self) -> float:
+        # Ön yüzün payı düşüldükten sonra kalan upstream hız bütçesi işçiler arasında paylaştırılır.
+        return (1 - WORKER_FRONT_RATE_SHARE) / max(1, self.size)
+
+    def _spawn(self, name: str):
+        commands = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main, args=(name, commands, self._results, self._rate_share()),
+            name=name, daemon=True,
+        )
+        process.start()
+        self.workers[name] = (process, commands)
+
+    def _send(self, name: str, command: tuple):
+        self.workers[name][1].put(command)
+
+    def assign(self, key: tuple, interval_seconds: float, start_delay: float = None):
+        owner = self.ring.get(ring_key(key))
+        self.keys[key] = (interval_seconds, start_delay)
+        self.owners[key] = owner
+        self._send(owner, ('start', key, interval_seconds, start_delay))
+
+    def release(self, key: tuple):
+        owner = self.owners.pop(key, None)
+        self.keys.pop(key, None)
+        if owner in self.workers:
+            self._send(owner, ('stop', key))
+
+    def _rebalance(self):
+        """Sahibi değişen anahtarları eski işçide durdurup yenisinde başlatır; kaç anahtarın taşındığını döndürür."""
+        moved = 0
+        for key, (interval_seconds, _) in self.keys.items():
+            owner = self.ring.get(ring_key(key))
+            previous = self.owners.get(key)
+            if owner == previous:
+                continue
+            if previous in self.workers:
+                self._send(previous, ('stop', key))
+            self.owners[key] = owner
+            self._send(owner, ('start', key, interval_seconds, None))
+            moved += 1
+        return moved
+
+    def _share_rate(self):
+        """İşçi sayısı değişince her işçinin hız payını günceller."""
+        for name in self.workers:
+            self._send(name, ('rate', self._rate_share()))
+
+    def add_worker(self) -> str:
+        name = self._new_worker_name()
+        self.size += 1
+        self._spawn(name)
+        self._share_rate()
+        self.ring.add(name)
+        moved = self._rebalance()
+        log.info("İşçi eklendi: %s; %d/%d anahtar taşındı.", name, moved, len(self.keys))
+        return name
+
+    async def remove_worker(self, name: str):
+        process, commands = self.workers[name]
+        self.ring.remove(name)
+        moved = self._rebalance()
+        commands.put(('shutdown',))
+        del self.workers[name]
+        self.size -= 1
+        self._share_rate()
+        await asyncio.to_thread(process.join, 10)
+        if process.is_alive():
+            process.terminate()
+        log.info("İşçi çıkarıldı: %s; %d/%d anahtar taşındı.", name, moved, len(self.keys))
+
+    async def resize(self, size: int):
+        """İşçi sayısını size'a getirir (en az 1); en son eklenen işçiler önce çıkarılır."""
+        size = max(1, size)
+        while self.size < size:
+            self.add_worker()
+        while self.size > size:
+            await self.remove_worker(list(self.workers)[-1])
+
+    def _restart_worker(self, name: str):
+        """Çöken işçiyi aynı adla yeniden başlatır; halka değişmediği için anahtarları aynen geri yüklenir."""
+        self._spawn(name)
+        for key, owner in self.owners.items():
+            if owner == name:
+                self._send(name, ('start', key, self.keys[key][0], None))
+
+    def _watch_workers(self):
+        while not self._closing.wait(WORKER_HEALTH_CHECK_SECONDS):
+            for name, (process, _) in list(self.workers.items()):
+                if not process.is_alive() and not self._closing.is_set():
+                    log.error("İşçi %s beklenmedik şekilde durdu (çıkış kodu %s), yeniden başlatılıyor.", name, process.exitcode)
+                    self._loop.call_soon_threadsafe(self._restart_worker, name)
+
+    def _read_results(self):
+        while True:
+            try:
+                item = self._results.get(timeout=1)
+            except queue.Empty:
+                if self._closing.is_set():
+                    return
+                continue
+            if item[0] == 'metrics':
+                metrics.merge(item[2])
+                continue
+            _, name, key, result, trace_id = item
+            # Bırakılmış anahtarlar için geç gelen sonuçlar yok sayılır.
+            self._loop.call_soon_threadsafe(self._deliver, name, key, result, trace_id)
+
+    def _deliver(self, name: str, key: tuple, result: tuple, trace_id: str = None):
+        if self.owners.get(key) == name:
+            # İşçideki poll trace'i aynı kimlikle sürer; bildirimler Telegram kuyruğuna bu kimlikle girer.
+            with tracing.trace("deliver", trace_id=trace_id), tracing.span("deliver"):
+                self.on_result(key, result)
+
+    async def close(self):
+        self._closing.set()
+        for _, commands in self.workers.values():
+            commands.put(('shutdown',))
+        for process, _ in self.workers.values():
+            await asyncio.to_thread(process.join, 10)
+            if process.is_alive():
+                process.terminate()
+        self.workers.clear()